@@ -6,44 +6,7 @@ from typing import List, Dict, Optional
 from datetime import datetime
 import math
 
-
-def extract_vendor_from_filename(filename: str, model: str) -> str:
-    """
-    Extract vendor name from filename.
-    Filename format: summary-{vendor}-{model}.json
-    """
-    # Remove 'summary-' prefix and '.json' suffix
-    name_part = filename.replace("summary-", "").replace(".json", "")
-
-    # Extract model suffix from the model field
-    # Model format is typically "vendor/model-name" or just "model-name"
-    if "/" in model:
-        model_suffix = model.split("/", 1)[1]
-    else:
-        model_suffix = model
-
-    # Remove the model suffix from the name to get vendor
-    # Handle dots in version numbers by replacing them temporarily
-    model_pattern = model_suffix.replace(".", "")
-    name_normalized = name_part.replace(".", "")
-
-    # Find the model pattern in the normalized name
-    # The vendor is everything before the model pattern
-    if model_pattern in name_normalized:
-        # Find the position of model pattern
-        pos = name_normalized.rfind(model_pattern)
-        vendor_normalized = name_normalized[:pos].rstrip("-")
-
-        # Map back to original with dots
-        # Count hyphens to find the split point
-        hyphen_count = vendor_normalized.count("-")
-        parts = name_part.split("-")
-        vendor = "-".join(parts[: hyphen_count + 1])
-    else:
-        # Fallback: use the whole name
-        vendor = name_part
-
-    return vendor
+from history_db import extract_vendor_from_filename
 
 
 def load_summary_files(directory: str) -> List[Dict]:
@@ -69,6 +32,30 @@ def load_summary_files(directory: str) -> List[Dict]:
     return summary_files
 
 
+def download_results(source: str, directory: Path, workers: int = 16) -> int:
+    """
+    Copy summary-*.json and results-*.jsonl from a remote directory (e.g. an
+    s3:// prefix) into directory, many files at a time. Files whose local size
+    already matches are skipped. Returns the number of files downloaded.
+    """
+    import megfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    entries = []
+    for pattern in ("summary-*.json", "results-*.jsonl"):
+        entries.extend(megfile.smart_glob_stat(megfile.smart_path_join(source, pattern)))
+
+    def fetch(entry) -> bool:
+        local_path = directory / entry.name
+        if local_path.exists() and local_path.stat().st_size == entry.stat.size:
+            return False
+        megfile.smart_copy(entry.path, str(local_path))
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(fetch, entries))
+
+
 def group_by_model(summaries: List[Dict]) -> Dict[str, List[Dict]]:
     """Group summaries by model name."""
     grouped = defaultdict(list)
@@ -169,6 +156,66 @@ def calculate_similarity_scores(summaries: List[Dict]) -> List[Dict]:
     return result_summaries
 
 
+def has_cost_data(summaries: List[Dict]) -> bool:
+    """Check whether any summary carries token throughput or cost figures."""
+    return any(
+        summary.get("avg_completion_tokens_per_second") is not None
+        or summary.get("cost_total") is not None
+        for summary in summaries
+    )
+
+
+def has_accuracy_data(summaries: List[Dict]) -> bool:
+    """Check whether any summary was scored against expected calls."""
+    return any(summary.get("tool_call_accuracy") is not None for summary in summaries)
+
+
+def format_optional(value, fmt: str) -> str:
+    """Format a possibly missing numeric value."""
+    if value is None:
+        return "N/A"
+    return format(value, fmt)
+
+
+def cost_header() -> tuple[str, str]:
+    """Extra leaderboard header cells for throughput and cost columns."""
+    return (
+        " Completion Tokens/s | Cost (USD) | Cost per Successful Tool Call (USD) | Projected Cost (USD) |",
+        "---------------------|------------|------------------------------------|----------------------|",
+    )
+
+
+def accuracy_header() -> tuple[str, str]:
+    """Extra leaderboard header cells for ground-truth accuracy columns."""
+    return (
+        " Tool Name Accuracy | **Tool Call Accuracy** |",
+        "--------------------|------------------------|",
+    )
+
+
+def accuracy_cells(summary: Dict) -> str:
+    """Extra leaderboard row cells for ground-truth accuracy columns."""
+    name_accuracy = format_optional(summary.get("tool_name_accuracy"), ".4f")
+    call_accuracy = format_optional(summary.get("tool_call_accuracy"), ".4f")
+    return f" {name_accuracy} | **{call_accuracy}** |"
+
+
+def cost_cells(summary: Dict) -> str:
+    """Extra leaderboard row cells for throughput and cost columns."""
+    tokens_per_second = format_optional(
+        summary.get("avg_completion_tokens_per_second"), ".2f"
+    )
+    cost_total = format_optional(summary.get("cost_total"), ".4f")
+    cost_per_call = format_optional(summary.get("cost_per_successful_tool_call"), ".6f")
+    projected = summary.get("projected_cost")
+    if projected is not None:
+        projected_requests = summary.get("projected_requests", 0)
+        projected_str = f"{projected:.2f} / {projected_requests} req"
+    else:
+        projected_str = "N/A"
+    return f" {tokens_per_second} | {cost_total} | {cost_per_call} | {projected_str} |"
+
+
 def generate_markdown_table(grouped_data: Dict[str, List[Dict]]) -> str:
     """Generate markdown table from grouped data."""
     lines = []
@@ -190,12 +237,20 @@ def generate_markdown_table(grouped_data: Dict[str, List[Dict]]) -> str:
         sorted_summaries = sort_by_successful_tool_calls(summaries_with_similarity)
 
         # Create table header
-        lines.append(
-            "| Vendor | Success Count | Failure Count | Finish Stop | Finish Tool Calls | Finish Others | Schema Validation Errors | **Successful Tool Call Count** | **Similarity to Official** |"
-        )
-        lines.append(
-            "|--------|---------------|---------------|-------------|-------------------|---------------|--------------------------|-------------------------------|---------------------------|"
-        )
+        include_accuracy = has_accuracy_data(summaries)
+        include_cost = has_cost_data(summaries)
+        header = "| Vendor | Success Count | Failure Count | Finish Stop | Finish Tool Calls | Finish Others | Schema Validation Errors | **Successful Tool Call Count** | **Similarity to Official** |"
+        separator = "|--------|---------------|---------------|-------------|-------------------|---------------|--------------------------|-------------------------------|---------------------------|"
+        if include_accuracy:
+            extra_header, extra_separator = accuracy_header()
+            header += extra_header
+            separator += extra_separator
+        if include_cost:
+            extra_header, extra_separator = cost_header()
+            header += extra_header
+            separator += extra_separator
+        lines.append(header)
+        lines.append(separator)
 
         # Add table rows
         for summary in sorted_summaries:
@@ -215,9 +270,12 @@ def generate_markdown_table(grouped_data: Dict[str, List[Dict]]) -> str:
             else:
                 similarity_str = f"{similarity:.4f}"
 
-            lines.append(
-                f"| {vendor} | {success_count} | {failure_count} | {finish_stop} | {finish_tool_calls} | {finish_others} | {schema_errors} | **{successful_tool_calls}** | **{similarity_str}** |"
-            )
+            row = f"| {vendor} | {success_count} | {failure_count} | {finish_stop} | {finish_tool_calls} | {finish_others} | {schema_errors} | **{successful_tool_calls}** | **{similarity_str}** |"
+            if include_accuracy:
+                row += accuracy_cells(summary)
+            if include_cost:
+                row += cost_cells(summary)
+            lines.append(row)
 
         lines.append("")
 
@@ -248,12 +306,20 @@ def generate_leaderboard_content(grouped_data: Dict[str, List[Dict]]) -> str:
         sorted_summaries = sort_by_successful_tool_calls(summaries_with_similarity)
 
         # Create table header
-        lines.append(
-            "| Vendor | Success Count | Failure Count | Finish Stop | Finish Tool Calls | Finish Others | Schema Validation Errors | **Successful Tool Call Count** | **Similarity to Official** |"
-        )
-        lines.append(
-            "|--------|---------------|---------------|-------------|-------------------|---------------|--------------------------|-------------------------------|---------------------------|"
-        )
+        include_accuracy = has_accuracy_data(summaries)
+        include_cost = has_cost_data(summaries)
+        header = "| Vendor | Success Count | Failure Count | Finish Stop | Finish Tool Calls | Finish Others | Schema Validation Errors | **Successful Tool Call Count** | **Similarity to Official** |"
+        separator = "|--------|---------------|---------------|-------------|-------------------|---------------|--------------------------|-------------------------------|---------------------------|"
+        if include_accuracy:
+            extra_header, extra_separator = accuracy_header()
+            header += extra_header
+            separator += extra_separator
+        if include_cost:
+            extra_header, extra_separator = cost_header()
+            header += extra_header
+            separator += extra_separator
+        lines.append(header)
+        lines.append(separator)
 
         # Add table rows
         for summary in sorted_summaries:
@@ -273,9 +339,12 @@ def generate_leaderboard_content(grouped_data: Dict[str, List[Dict]]) -> str:
             else:
                 similarity_str = f"{similarity:.4f}"
 
-            lines.append(
-                f"| {vendor} | {success_count} | {failure_count} | {finish_stop} | {finish_tool_calls} | {finish_others} | {schema_errors} | **{successful_tool_calls}** | **{similarity_str}** |"
-            )
+            row = f"| {vendor} | {success_count} | {failure_count} | {finish_stop} | {finish_tool_calls} | {finish_others} | {schema_errors} | **{successful_tool_calls}** | **{similarity_str}** |"
+            if include_accuracy:
+                row += accuracy_cells(summary)
+            if include_cost:
+                row += cost_cells(summary)
+            lines.append(row)
 
         lines.append("")
 
@@ -332,11 +401,40 @@ def update_readme(grouped_data: Dict[str, List[Dict]], readme_path: Path):
 
 def main():
     """Main function to generate the report."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate report.md and the README leaderboard from summary files"
+    )
+    parser.add_argument(
+        "--source",
+        help="Remote directory (e.g. s3://bucket/benchmark-result) to download "
+        "summary-*.json and results-*.jsonl files from before generating",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=16,
+        help="Files downloaded in parallel from --source (default: 16)",
+    )
+    args = parser.parse_args()
+
     # Get the directory of this script
     script_dir = Path(__file__).parent
 
-    # Load all summary files
-    summaries = load_summary_files(script_dir)
+    if args.source:
+        downloaded = download_results(args.source, script_dir, args.download_workers)
+        print(f"Downloaded {downloaded} files from {args.source}")
+
+    # Ingest new or changed summary files into the run history, then read
+    # the latest run per vendor/model from the database
+    import history_db
+
+    conn = history_db.connect()
+    new_runs = history_db.ingest_paths(conn, [script_dir])
+    if new_runs:
+        print(f"Ingested {new_runs} new runs into {history_db.DEFAULT_DB_PATH}")
+    summaries = history_db.load_latest_summaries(conn)
 
     if not summaries:
         print("No summary files found.")
@@ -0,0 +1,392 @@
+"""
+SQLite run history for benchmark results.
+
+Each summary-*.json (with its matching results-*.jsonl, when present) is
+ingested once as a run. Report generation and ad-hoc queries then read the
+database instead of re-parsing every file.
+
+Usage:
+    python history_db.py ingest [PATH ...]
+    python history_db.py runs --vendor ppio --model deepseek/deepseek-v3.2-exp
+    python history_db.py regressions --vendor ppio --model deepseek/deepseek-v3.2-exp --since 2025-10-01
+"""
+
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_DB_PATH = Path(__file__).parent / "history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    vendor TEXT NOT NULL,
+    model TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    run_at TEXT NOT NULL,
+    ingested_at TEXT NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_vendor_model_run_at ON runs (vendor, model, run_at);
+
+CREATE TABLE IF NOT EXISTS results (
+    vendor TEXT NOT NULL,
+    model TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    data_index INTEGER,
+    status TEXT,
+    finish_reason TEXT,
+    tool_calls_valid INTEGER,
+    duration_ms INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    last_run_at TEXT,
+    PRIMARY KEY (run_id, hash, trial)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_results_vendor_model_run_hash ON results (vendor, model, run_id, hash);
+
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    run_id TEXT NOT NULL
+);
+"""
+
+
+def extract_vendor_from_filename(filename: str, model: str) -> str:
+    """
+    Extract vendor name from filename.
+    Filename format: summary-{vendor}-{model}.json
+    """
+    # Remove 'summary-' prefix and '.json' suffix
+    name_part = filename.replace("summary-", "").replace(".json", "")
+
+    # Extract model suffix from the model field
+    # Model format is typically "vendor/model-name" or just "model-name"
+    if "/" in model:
+        model_suffix = model.split("/", 1)[1]
+    else:
+        model_suffix = model
+
+    # Remove the model suffix from the name to get vendor
+    # Handle dots in version numbers by replacing them temporarily
+    model_pattern = model_suffix.replace(".", "")
+    name_normalized = name_part.replace(".", "")
+
+    # Find the model pattern in the normalized name
+    # The vendor is everything before the model pattern
+    if model_pattern in name_normalized:
+        # Find the position of model pattern
+        pos = name_normalized.rfind(model_pattern)
+        vendor_normalized = name_normalized[:pos].rstrip("-")
+
+        # Map back to original with dots
+        # Count hyphens to find the split point
+        hyphen_count = vendor_normalized.count("-")
+        parts = name_part.split("-")
+        vendor = "-".join(parts[: hyphen_count + 1])
+    else:
+        # Fallback: use the whole name
+        vendor = name_part
+
+    return vendor
+
+
+def connect(db_path: Path = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """Open the history database, creating tables and indexes if needed."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def results_path_for(summary_path: Path) -> Path:
+    """results-{name}.jsonl next to summary-{name}.json."""
+    name = summary_path.name.replace("summary-", "results-", 1)
+    return summary_path.with_name(name[: -len(".json")] + ".jsonl")
+
+
+def file_fingerprint(paths: List[Path]) -> str:
+    """Cheap change detector based on size and mtime of the given files."""
+    parts = []
+    for path in paths:
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def ingest_run(conn: sqlite3.Connection, summary_path: Path) -> Optional[str]:
+    """
+    Ingest one summary file and its results file as a run.
+
+    Unchanged files are skipped without being read. The run_id is the content
+    hash of both files, so re-ingesting identical content is a no-op.
+    """
+    results_path = results_path_for(summary_path)
+    fingerprint = file_fingerprint([summary_path, results_path])
+    row = conn.execute(
+        "SELECT fingerprint, run_id FROM ingested_files WHERE path = ?",
+        (str(summary_path.resolve()),),
+    ).fetchone()
+    if row is not None and row["fingerprint"] == fingerprint:
+        return None
+
+    digest = hashlib.md5(summary_path.read_bytes())
+    if results_path.exists():
+        with open(results_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    run_id = digest.hexdigest()
+
+    summary = json.loads(summary_path.read_text(encoding="utf-8"))
+    model = summary.get("model", "")
+    vendor = extract_vendor_from_filename(summary_path.name, model)
+
+    rows = []
+    run_at = None
+    if results_path.exists():
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                usage = (r.get("response") or {}).get("usage") or {}
+                tool_calls_valid = r.get("tool_calls_valid")
+                rows.append(
+                    (
+                        vendor,
+                        model,
+                        run_id,
+                        r["hash"],
+                        r.get("trial", 0),
+                        r.get("data_index"),
+                        r.get("status"),
+                        r.get("finish_reason"),
+                        None if tool_calls_valid is None else int(tool_calls_valid),
+                        r.get("duration_ms"),
+                        usage.get("prompt_tokens"),
+                        usage.get("completion_tokens"),
+                        r.get("last_run_at"),
+                    )
+                )
+                if r.get("last_run_at") and (run_at is None or r["last_run_at"] > run_at):
+                    run_at = r["last_run_at"]
+    if run_at is None:
+        run_at = datetime.fromtimestamp(summary_path.stat().st_mtime).isoformat()
+
+    with conn:
+        # Identical content under a new name is the same run, now known by that name
+        conn.execute(
+            """
+            INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id) DO UPDATE
+            SET vendor = excluded.vendor, model = excluded.model, filename = excluded.filename
+            """,
+            (
+                run_id,
+                vendor,
+                model,
+                summary_path.name,
+                run_at,
+                datetime.now().isoformat(),
+                json.dumps(summary, ensure_ascii=False),
+            ),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute(
+            "UPDATE results SET vendor = ?, model = ? WHERE run_id = ?", (vendor, model, run_id)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?)",
+            (str(summary_path.resolve()), fingerprint, run_id),
+        )
+    return run_id
+
+
+def forget_missing(conn: sqlite3.Connection) -> int:
+    """
+    Drop ingested summary files that no longer exist; returns how many.
+
+    Their runs stay in the history for `runs` and `regressions`, but are no
+    longer current, so deleted or renamed files drop out of the report.
+    """
+    missing = [
+        (row["path"],)
+        for row in conn.execute("SELECT path FROM ingested_files")
+        if not Path(row["path"]).exists()
+    ]
+    with conn:
+        conn.executemany("DELETE FROM ingested_files WHERE path = ?", missing)
+    return len(missing)
+
+
+def ingest_paths(conn: sqlite3.Connection, paths: List[Path]) -> int:
+    """
+    Ingest summary files and directories of summary files, then forget the
+    files that have gone missing; returns new runs.
+    """
+    count = 0
+    for path in paths:
+        summary_paths = sorted(path.glob("summary-*.json")) if path.is_dir() else [path]
+        for summary_path in summary_paths:
+            try:
+                if ingest_run(conn, summary_path):
+                    count += 1
+            except Exception as e:
+                print(f"Error ingesting {summary_path}: {e}")
+    forgotten = forget_missing(conn)
+    if forgotten:
+        print(f"Forgot {forgotten} summary files that no longer exist")
+    return count
+
+
+def load_latest_summaries(conn: sqlite3.Connection) -> List[Dict]:
+    """
+    Latest current run per (vendor, model), in the shape load_summary_files
+    returns. A run is current while one of the ingested files still holds it.
+    """
+    rows = conn.execute(
+        """
+        WITH current AS (
+            SELECT * FROM runs WHERE run_id IN (SELECT run_id FROM ingested_files)
+        )
+        SELECT vendor, filename, summary FROM current AS r
+        WHERE run_at = (
+            SELECT MAX(run_at) FROM current WHERE vendor = r.vendor AND model = r.model
+        )
+        GROUP BY vendor, model
+        ORDER BY filename
+        """
+    ).fetchall()
+    summaries = []
+    for row in rows:
+        data = json.loads(row["summary"])
+        data["vendor"] = row["vendor"]
+        data["filename"] = row["filename"]
+        summaries.append(data)
+    return summaries
+
+
+def list_runs(conn: sqlite3.Connection, vendor: str, model: str) -> List[Dict]:
+    """All runs of a vendor/model, oldest first."""
+    rows = conn.execute(
+        "SELECT run_id, run_at, summary FROM runs WHERE vendor = ? AND model = ? ORDER BY run_at",
+        (vendor, model),
+    ).fetchall()
+    return [
+        {"run_id": row["run_id"], "run_at": row["run_at"], **json.loads(row["summary"])}
+        for row in rows
+    ]
+
+
+def passed_condition(alias: str) -> str:
+    """SQL condition for a passing result row."""
+    return (
+        f"({alias}.status = 'success' AND "
+        f"(COALESCE({alias}.finish_reason, '') != 'tool_calls' OR {alias}.tool_calls_valid = 1))"
+    )
+
+
+def newly_failing_samples(
+    conn: sqlite3.Connection, vendor: str, model: str, since: str
+) -> List[Dict]:
+    """
+    Samples that passed in the last run before `since` but fail in the latest run.
+
+    A sample passes when the request succeeded and, if it ended in tool_calls,
+    the calls were schema-valid.
+    """
+    baseline = conn.execute(
+        "SELECT run_id FROM runs WHERE vendor = ? AND model = ? AND run_at < ? ORDER BY run_at DESC LIMIT 1",
+        (vendor, model, since),
+    ).fetchone()
+    latest = conn.execute(
+        "SELECT run_id FROM runs WHERE vendor = ? AND model = ? AND run_at >= ? ORDER BY run_at DESC LIMIT 1",
+        (vendor, model, since),
+    ).fetchone()
+    if baseline is None or latest is None:
+        return []
+
+    rows = conn.execute(
+        f"""
+        SELECT cur.hash, cur.trial, cur.data_index, cur.status, cur.finish_reason,
+               cur.tool_calls_valid, old.finish_reason AS previous_finish_reason
+        FROM results AS cur
+        JOIN results AS old
+          ON old.vendor = cur.vendor AND old.model = cur.model
+         AND old.run_id = ? AND old.hash = cur.hash AND old.trial = cur.trial
+        WHERE cur.vendor = ? AND cur.model = ? AND cur.run_id = ?
+          AND NOT {passed_condition("cur")}
+          AND {passed_condition("old")}
+        ORDER BY cur.data_index, cur.trial
+        """,
+        (baseline["run_id"], vendor, model, latest["run_id"]),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite history of benchmark runs")
+    parser.add_argument(
+        "--db", default=str(DEFAULT_DB_PATH), help="Database path (default: history.sqlite)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest summary/results files")
+    ingest_parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[str(Path(__file__).parent)],
+        help="summary-*.json files or directories (default: this directory)",
+    )
+
+    runs_parser = subparsers.add_parser("runs", help="List runs of a vendor over time")
+    runs_parser.add_argument("--vendor", required=True)
+    runs_parser.add_argument("--model", required=True)
+
+    regressions_parser = subparsers.add_parser(
+        "regressions", help="Samples a vendor started failing since a date"
+    )
+    regressions_parser.add_argument("--vendor", required=True)
+    regressions_parser.add_argument("--model", required=True)
+    regressions_parser.add_argument(
+        "--since", required=True, help="ISO date or datetime, e.g. 2025-10-01"
+    )
+
+    args = parser.parse_args()
+    conn = connect(Path(args.db))
+
+    if args.command == "ingest":
+        count = ingest_paths(conn, [Path(p) for p in args.paths])
+        print(f"Ingested {count} new runs into {args.db}")
+    elif args.command == "runs":
+        for run in list_runs(conn, args.vendor, args.model):
+            print(
+                f"{run['run_at']}  {run['run_id']}  "
+                f"success={run.get('success_count', 0)} "
+                f"tool_calls={run.get('finish_tool_calls', 0)} "
+                f"schema_errors={run.get('schema_validation_error_count', 0)} "
+                f"successful_tool_calls={run.get('successful_tool_call_count', 0)}"
+            )
+    elif args.command == "regressions":
+        rows = newly_failing_samples(conn, args.vendor, args.model, args.since)
+        for row in rows:
+            print(
+                f"data_index={row['data_index']} trial={row['trial']} hash={row['hash']} "
+                f"status={row['status']} finish_reason={row['finish_reason']} "
+                f"(was {row['previous_finish_reason']})"
+            )
+        print(f"{len(rows)} samples newly failing since {args.since}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+CPU cost per request of the SDK response path vs --raw-response.
+
+Runs ToolCallsValidator.send_request against an in-process transport that
+replays one canned chat.completions body, so the measured CPU time is the
+client-side work only (request building, response parsing, model_dump),
+with no network or vendor in the loop:
+
+    python benchmark_raw_response.py --requests 2000 --tool-calls 8 --content-chars 4000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+import openai
+from loguru import logger
+
+from tool_calls_eval import ToolCallsValidator
+
+
+def response_body(tool_calls: int, content_chars: int, argument_chars: int) -> bytes:
+    """A chat.completions body with the given number and size of tool calls."""
+    calls = [
+        {
+            "id": f"call_{i}",
+            "type": "function",
+            "function": {
+                "name": f"tool_{i}",
+                "arguments": json.dumps({"query": "x" * argument_chars, "limit": i}),
+            },
+        }
+        for i in range(tool_calls)
+    ]
+    return json.dumps(
+        {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": 1,
+            "model": "benchmark",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "y" * content_chars,
+                        "tool_calls": calls or None,
+                    },
+                    "finish_reason": "tool_calls" if calls else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 1000,
+                "completion_tokens": 200,
+                "total_tokens": 1200,
+                "prompt_tokens_details": {"cached_tokens": 100},
+            },
+        }
+    ).encode()
+
+
+async def cpu_per_request(raw_response: bool, body: bytes, requests: int) -> float:
+    """Mean CPU time in ms of send_request with the canned body."""
+    validator = ToolCallsValidator(
+        model="benchmark",
+        base_url="http://benchmark.invalid/v1",
+        api_key="benchmark",
+        output_file="/dev/null",
+        summary_file="/dev/null",
+        raw_response=raw_response,
+    )
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(
+            200, content=body, headers={"content-type": "application/json"}
+        )
+    )
+    validator._client = openai.AsyncOpenAI(
+        api_key="benchmark",
+        base_url=validator.base_url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+    request = validator.prepare_request(
+        {"messages": [{"role": "user", "content": "Hello"}]}
+    )
+    # Untimed first request pays for imports and client setup
+    await validator.send_request(request)
+    start = time.process_time()
+    for _ in range(requests):
+        status, _, _, _ = await validator.send_request(request)
+        assert status == "success"
+    return (time.process_time() - start) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the per-request CPU time of the SDK response path and --raw-response"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="Timed requests per path (default: 2000)"
+    )
+    parser.add_argument(
+        "--tool-calls", type=int, default=4, help="Tool calls per response (default: 4)"
+    )
+    parser.add_argument(
+        "--content-chars", type=int, default=2000, help="Length of the message content (default: 2000)"
+    )
+    parser.add_argument(
+        "--argument-chars",
+        type=int,
+        default=500,
+        help="Length of each tool call's arguments (default: 500)",
+    )
+    args = parser.parse_args()
+    # Per-request debug logging would dominate the measurement
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    body = response_body(args.tool_calls, args.content_chars, args.argument_chars)
+    print(f"response body: {len(body)} bytes, {args.tool_calls} tool calls")
+    sdk = asyncio.run(cpu_per_request(False, body, args.requests))
+    raw = asyncio.run(cpu_per_request(True, body, args.requests))
+    print(f"{'sdk models':16s} {sdk:8.3f} ms CPU/request")
+    print(f"{'--raw-response':16s} {raw:8.3f} ms CPU/request")
+    print(f"saving: {sdk - raw:.3f} ms/request ({(sdk - raw) / sdk:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup-time guard for tool_calls_eval.py.
+
+Times `import tool_calls_eval` and `--help` of every subcommand in fresh
+interpreters and fails when the median of any of them exceeds the budget,
+so heavy imports do not creep back into module load. Meant for CI:
+
+    python benchmark_startup.py --budget-ms 300
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPT = Path(__file__).parent / "tool_calls_eval.py"
+
+
+def startup_commands() -> dict[str, list[str]]:
+    """Name -> argv of each measured startup path."""
+    from tool_calls_eval import SUBCOMMANDS
+
+    commands = {
+        "import": [sys.executable, "-c", "import tool_calls_eval"],
+        "--help": [sys.executable, str(SCRIPT), "--help"],
+    }
+    for name in SUBCOMMANDS:
+        commands[f"{name} --help"] = [sys.executable, str(SCRIPT), name, "--help"]
+    return commands
+
+
+def time_command(argv: list[str], repeats: int) -> float:
+    """Median wall time in ms of running argv to completion."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            argv,
+            cwd=SCRIPT.parent,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that tool_calls_eval.py starts within a time budget"
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=300,
+        help="Maximum median startup time per command in milliseconds (default: 300)",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Runs per command (default: 5)"
+    )
+    args = parser.parse_args()
+
+    # Interpreter startup alone is the floor every command pays
+    baseline = time_command([sys.executable, "-c", "pass"], args.repeats)
+    print(f"{'interpreter':24s} {baseline:8.1f} ms")
+
+    over_budget = []
+    for name, argv in startup_commands().items():
+        elapsed = time_command(argv, args.repeats)
+        flag = ""
+        if elapsed > args.budget_ms:
+            over_budget.append(name)
+            flag = "  OVER BUDGET"
+        print(f"{name:24s} {elapsed:8.1f} ms{flag}")
+
+    if over_budget:
+        print(f"{len(over_budget)} commands exceed {args.budget_ms:.0f} ms: {', '.join(over_budget)}")
+        raise SystemExit(1)
+    print(f"All commands within {args.budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
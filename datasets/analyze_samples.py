@@ -1,10 +1,40 @@
-"""Analyze the generated samples to provide statistics."""
+"""
+Analyze the generated samples, or the results of evaluation runs.
 
+    python analyze_samples.py samples.jsonl
+    python analyze_samples.py results results-*.jsonl --csv-dir analytics/
+
+Results analytics loads any number of results-*.jsonl files into columnar
+NumPy arrays (parsed in parallel byte ranges) and aggregates them with
+vectorized group operations, so millions of rows take seconds.
+"""
+
+import csv
+import importlib.util
 import json
+import os
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 
+class _LazyNumpy:
+    """numpy, imported on first use so `--help` and test-set statistics stay fast."""
+
+    def __getattr__(self, attr):
+        import numpy
+
+        return getattr(numpy, attr)
+
+
+np = _LazyNumpy()
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+
 def analyze_samples(file_path: str):
     """Analyze samples.jsonl and print statistics."""
 
@@ -105,13 +135,498 @@ def analyze_samples(file_path: str):
     print("=" * 70)
 
 
-if __name__ == "__main__":
+# Bucket edges of the latency breakdowns; a value v falls in [edge_i, edge_i+1)
+PROMPT_TOKEN_EDGES = (0, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+TOOL_COUNT_EDGES = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+PARAM_COUNT_EDGES = (0, 1, 3, 6, 10, 20, 40)
+
+# Per-result columns of the loaded table, besides the offered/called tool pairs
+ROW_COLUMNS = (
+    "vendor",
+    "data_index",
+    "trial",
+    "round",
+    "success",
+    "finish_reason",
+    "tool_calls_valid",
+    "duration_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "tool_count",
+    "param_count",
+)
+
+# Results files are parsed in byte ranges of this size, one per worker task
+CHUNK_BYTES = 32 << 20
+
+
+def vendor_label(path: str) -> str:
+    """results-{vendor}-{model}.jsonl -> {vendor}-{model}."""
+    name = Path(path).name
+    name = name[len("results-") :] if name.startswith("results-") else name
+    return name.split(".jsonl")[0]
+
+
+def file_chunks(path: str, chunk_bytes: int = CHUNK_BYTES) -> list[tuple[str, int, int]]:
+    size = os.path.getsize(path)
+    return [(path, start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def encode(vocab: dict[str, int], value: str) -> int:
+    code = vocab.get(value)
+    if code is None:
+        code = vocab[value] = len(vocab)
+    return code
+
+
+def load_result_chunk(path: str, start: int, end: int) -> dict:
+    """
+    Columns of the result lines that start in [start, end) of a file.
+
+    String columns are returned as codes plus the chunk's own vocabulary,
+    offered and called tools as (row, tool code) pairs.
+    """
+    columns = {name: [] for name in ROW_COLUMNS if name != "vendor"}
+    finish_vocab: dict[str, int] = {}
+    tool_vocab: dict[str, int] = {}
+    offered_row, offered_tool, called_row, called_tool = [], [], [], []
+
+    with open(path, "rb") as f:
+        if start:
+            # The line straddling `start` belongs to the previous chunk
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if not line.strip():
+                continue
+            r = json_loads(line)
+            row = len(columns["data_index"])
+            tools = (r.get("request") or {}).get("tools") or []
+            response = r.get("response") or {}
+            usage = response.get("usage") or {}
+            valid = r.get("tool_calls_valid")
+
+            columns["data_index"].append(r.get("data_index") or 0)
+            columns["trial"].append(r.get("trial", 0))
+            columns["round"].append(r.get("round", 0))
+            columns["success"].append(r.get("status") == "success")
+            columns["finish_reason"].append(encode(finish_vocab, r.get("finish_reason") or "none"))
+            columns["tool_calls_valid"].append(-1 if valid is None else int(valid))
+            duration = r.get("duration_ms")
+            columns["duration_ms"].append(float("nan") if duration is None else duration)
+            columns["prompt_tokens"].append(usage.get("prompt_tokens") or 0)
+            columns["completion_tokens"].append(usage.get("completion_tokens") or 0)
+            columns["tool_count"].append(len(tools))
+            param_count = 0
+            for tool in tools:
+                function = tool.get("function") or {}
+                param_count += len((function.get("parameters") or {}).get("properties") or {})
+                offered_row.append(row)
+                offered_tool.append(encode(tool_vocab, function.get("name", "")))
+            columns["param_count"].append(param_count)
+
+            choices = response.get("choices") or [{}]
+            for call in (choices[0].get("message") or {}).get("tool_calls") or []:
+                called_row.append(row)
+                called_tool.append(encode(tool_vocab, (call.get("function") or {}).get("name", "")))
+
+    chunk = {
+        "data_index": np.array(columns["data_index"], dtype=np.int64),
+        "trial": np.array(columns["trial"], dtype=np.int32),
+        "round": np.array(columns["round"], dtype=np.int32),
+        "success": np.array(columns["success"], dtype=bool),
+        "finish_reason": np.array(columns["finish_reason"], dtype=np.int32),
+        "tool_calls_valid": np.array(columns["tool_calls_valid"], dtype=np.int8),
+        "duration_ms": np.array(columns["duration_ms"], dtype=np.float64),
+        "prompt_tokens": np.array(columns["prompt_tokens"], dtype=np.int64),
+        "completion_tokens": np.array(columns["completion_tokens"], dtype=np.int64),
+        "tool_count": np.array(columns["tool_count"], dtype=np.int32),
+        "param_count": np.array(columns["param_count"], dtype=np.int32),
+        "offered_row": np.array(offered_row, dtype=np.int64),
+        "offered_tool": np.array(offered_tool, dtype=np.int32),
+        "called_row": np.array(called_row, dtype=np.int64),
+        "called_tool": np.array(called_tool, dtype=np.int32),
+    }
+    return {"columns": chunk, "finish_vocab": list(finish_vocab), "tool_vocab": list(tool_vocab)}
+
+
+def merge_vocab(global_vocab: dict[str, int], local: list[str]) -> "np.ndarray":
+    """Array mapping local codes to codes in the global vocabulary."""
+    return np.array([encode(global_vocab, value) for value in local], dtype=np.int32)
+
+
+def load_results(paths: list[str], workers: int | None = None) -> dict:
+    """
+    Load results files into one columnar table.
+
+    Returns a dict of equal-length arrays (one row per result, plus a
+    `vendor` code per row), the `offered_*`/`called_*` pair arrays, and the
+    `vendors`, `finish_reasons` and `tools` vocabularies.
+    """
+    tasks = [(i, chunk) for i, path in enumerate(paths) for chunk in file_chunks(path)]
+    finish_vocab: dict[str, int] = {}
+    tool_vocab: dict[str, int] = {}
+    parts: dict[str, list] = defaultdict(list)
+    rows = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(i, executor.submit(load_result_chunk, *chunk)) for i, chunk in tasks]
+        for file_index, future in futures:
+            chunk = future.result()
+            columns = chunk["columns"]
+            finish_map = merge_vocab(finish_vocab, chunk["finish_vocab"])
+            tool_map = merge_vocab(tool_vocab, chunk["tool_vocab"])
+            n = len(columns["data_index"])
+            for name, values in columns.items():
+                if name in ("finish_reason",):
+                    values = finish_map[values] if n else values
+                elif name in ("offered_tool", "called_tool"):
+                    values = tool_map[values] if len(values) else values
+                elif name in ("offered_row", "called_row"):
+                    values = values + rows
+                parts[name].append(values)
+            parts["vendor"].append(np.full(n, file_index, dtype=np.int32))
+            rows += n
+
+    table = {name: np.concatenate(values) for name, values in parts.items()}
+    table["vendors"] = [vendor_label(path) for path in paths]
+    table["finish_reasons"] = list(finish_vocab)
+    table["tools"] = list(tool_vocab)
+    return table
+
+
+def grouped_quantiles(keys, values, n_groups: int, quantiles=(0.5, 0.95)) -> dict:
+    """Per-group count and quantiles of `values` (NaN ignored), via one sort."""
+    mask = ~np.isnan(values)
+    keys, values = keys[mask], values[mask]
+    order = np.lexsort((values, keys))
+    values = values[order]
+    counts = np.bincount(keys, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    stats = {"count": counts}
+    for q in quantiles:
+        index = starts + np.floor(q * np.maximum(counts - 1, 0)).astype(np.int64)
+        picked = values[np.minimum(index, len(values) - 1)] if len(values) else np.zeros(n_groups)
+        stats[f"p{round(q * 100)}"] = np.where(counts > 0, picked, np.nan)
+    return stats
+
+
+def rate(numerator, denominator):
+    """Elementwise ratio with NaN where the denominator is zero."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full_like(numerator, np.nan), where=denominator > 0)
+
+
+def clean(name: str, value):
+    """NumPy value -> plain Python value: NaN -> None, *_ms to whole ms, rates to 4 places."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = value.item()
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        return round(value) if name.endswith("_ms") else round(value, 4)
+    return value
+
+
+def bucket_labels(edges: tuple) -> list[str]:
+    labels = [str(lo) if hi - lo == 1 else f"{lo}-{hi - 1}" for lo, hi in zip(edges, edges[1:])]
+    return labels + [f">={edges[-1]}"]
+
+
+def latency_breakdown(table: dict, passed, feature: str, edges: tuple) -> list[dict]:
+    """Latency quantiles and failure rate per vendor and feature bucket."""
+    n_buckets = len(edges)
+    buckets = np.digitize(table[feature], edges[1:])
+    keys = table["vendor"] * n_buckets + buckets
+    n_groups = len(table["vendors"]) * n_buckets
+    latency = np.where(table["success"], table["duration_ms"], np.nan)
+    stats = grouped_quantiles(keys, latency, n_groups)
+    totals = np.bincount(keys, minlength=n_groups)
+    failures = np.bincount(keys, weights=~passed, minlength=n_groups)
+    labels = bucket_labels(edges)
+    return [
+        {
+            "vendor": table["vendors"][g // n_buckets],
+            feature: labels[g % n_buckets],
+            "results": totals[g],
+            "p50_ms": stats["p50"][g],
+            "p95_ms": stats["p95"][g],
+            "failure_rate": rate(failures[g], totals[g]),
+        }
+        for g in np.flatnonzero(totals)
+    ]
+
+
+def latency_drivers(table: dict) -> list[dict]:
+    """Correlation and linear slope of successful-request latency per feature and vendor."""
+    rows = []
+    ok = table["success"] & ~np.isnan(table["duration_ms"])
+    for vendor_code, vendor in enumerate(table["vendors"]):
+        mask = ok & (table["vendor"] == vendor_code)
+        y = table["duration_ms"][mask]
+        for feature in ("prompt_tokens", "tool_count", "param_count", "completion_tokens"):
+            x = table[feature][mask].astype(np.float64)
+            if len(x) < 3 or np.ptp(x) == 0 or np.ptp(y) == 0:
+                continue
+            slope, intercept = np.polyfit(x, y, 1)
+            rows.append(
+                {
+                    "vendor": vendor,
+                    "feature": feature,
+                    "pearson_r": np.corrcoef(x, y)[0, 1],
+                    "ms_per_unit": slope,
+                    "intercept_ms": intercept,
+                }
+            )
+    return rows
+
+
+def analyze_result_table(table: dict, top: int = 20) -> dict[str, list[dict]]:
+    """All analytics tables, as lists of row dicts."""
+    n_vendors = len(table["vendors"])
+    vendor = table["vendor"]
+    is_tool_calls = table["tool_calls_valid"] >= 0
+    schema_error = table["tool_calls_valid"] == 0
+    passed = table["success"] & ~schema_error
+    latency = np.where(table["success"], table["duration_ms"], np.nan)
+    tables = {}
+
+    # Per vendor overview
+    totals = np.bincount(vendor, minlength=n_vendors)
+    success = np.bincount(vendor, weights=table["success"], minlength=n_vendors)
+    passes = np.bincount(vendor, weights=passed, minlength=n_vendors)
+    tool_calls = np.bincount(vendor, weights=is_tool_calls, minlength=n_vendors)
+    errors = np.bincount(vendor, weights=schema_error, minlength=n_vendors)
+    stats = grouped_quantiles(vendor, latency, n_vendors, (0.5, 0.95, 0.99))
+    tables["vendors"] = [
+        {
+            "vendor": table["vendors"][v],
+            "results": totals[v],
+            "success_rate": rate(success[v], totals[v]),
+            "pass_rate": rate(passes[v], totals[v]),
+            "schema_error_rate": rate(errors[v], tool_calls[v]),
+            "p50_ms": stats["p50"][v],
+            "p95_ms": stats["p95"][v],
+            "p99_ms": stats["p99"][v],
+        }
+        for v in range(n_vendors)
+    ]
+
+    # Finish reasons per vendor
+    n_reasons = len(table["finish_reasons"])
+    counts = np.bincount(vendor * n_reasons + table["finish_reason"], minlength=n_vendors * n_reasons)
+    counts = counts.reshape(n_vendors, n_reasons)
+    tables["finish_reasons"] = [
+        {
+            "vendor": table["vendors"][v],
+            "finish_reason": table["finish_reasons"][f],
+            "count": counts[v, f],
+            "share": rate(counts[v, f], totals[v]),
+        }
+        for v in range(n_vendors)
+        for f in np.argsort(-counts[v])
+        if counts[v, f]
+    ]
+
+    tables["latency_by_prompt_tokens"] = latency_breakdown(table, passed, "prompt_tokens", PROMPT_TOKEN_EDGES)
+    tables["latency_by_tool_count"] = latency_breakdown(table, passed, "tool_count", TOOL_COUNT_EDGES)
+    tables["latency_by_param_count"] = latency_breakdown(table, passed, "param_count", PARAM_COUNT_EDGES)
+    tables["latency_drivers"] = latency_drivers(table)
+
+    # Per tool name: failures when offered, schema errors when called
+    n_tools = len(table["tools"])
+    offered_row, called_row = table["offered_row"], table["called_row"]
+    offered = np.bincount(table["offered_tool"], minlength=n_tools)
+    offered_failed = np.bincount(table["offered_tool"], weights=~passed[offered_row], minlength=n_tools)
+    called = np.bincount(table["called_tool"], minlength=n_tools)
+    called_errors = np.bincount(table["called_tool"], weights=schema_error[called_row], minlength=n_tools)
+    called_latency = grouped_quantiles(table["called_tool"], latency[called_row], n_tools)
+    tables["tools"] = [
+        {
+            "tool": table["tools"][t],
+            "offered": offered[t],
+            "failure_rate_when_offered": rate(offered_failed[t], offered[t]),
+            "called": called[t],
+            "schema_error_rate": rate(called_errors[t], called[t]),
+            "called_p50_ms": called_latency["p50"][t],
+        }
+        for t in np.lexsort((-offered, -called))
+    ]
+
+    # Slowest individual results
+    finite = np.flatnonzero(~np.isnan(latency))
+    slowest = finite[np.argsort(-latency[finite], kind="stable")[:top]]
+    tables["slowest"] = [
+        {
+            "vendor": table["vendors"][vendor[i]],
+            "data_index": table["data_index"][i],
+            "trial": table["trial"][i],
+            "duration_ms": table["duration_ms"][i],
+            "prompt_tokens": table["prompt_tokens"][i],
+            "completion_tokens": table["completion_tokens"][i],
+            "tool_count": table["tool_count"][i],
+            "finish_reason": table["finish_reasons"][table["finish_reason"][i]],
+        }
+        for i in slowest
+    ]
+
+    # Samples (by data_index, across vendors and trials) that fail most often
+    data_index = table["data_index"]
+    runs = np.bincount(data_index)
+    failures = np.bincount(data_index, weights=~passed, minlength=len(runs))
+    most_failing = np.lexsort((-runs, -failures))[:top]
+    tables["most_failing"] = []
+    for d in most_failing:
+        if not failures[d]:
+            break
+        failed_vendors = np.unique(vendor[(data_index == d) & ~passed])
+        tables["most_failing"].append(
+            {
+                "data_index": d,
+                "results": runs[d],
+                "failures": int(failures[d]),
+                "failure_rate": rate(failures[d], runs[d]),
+                "failing_vendors": " ".join(table["vendors"][v] for v in failed_vendors),
+            }
+        )
+
+    return {name: [{k: clean(k, v) for k, v in row.items()} for row in rows] for name, rows in tables.items()}
+
+
+def print_table(title: str, rows: list[dict], limit: int):
+    print(f"📈 {title}")
+    if not rows:
+        print("  (no rows)")
+        print()
+        return
+    columns = list(rows[0])
+    shown = rows[:limit]
+    cells = [["" if row[c] is None else str(row[c]) for c in columns] for row in shown]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  " + "  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  " + "  ".join(v.ljust(w) for v, w in zip(r, widths)))
+    if len(rows) > limit:
+        print(f"  ... {len(rows) - limit} more rows")
+    print()
+
+
+def analyze_results(
+    paths: list[str],
+    csv_dir: str | None = None,
+    json_file: str | None = None,
+    top: int = 20,
+    workers: int | None = None,
+    first_round_only: bool = True,
+):
+    """Load results files, print the analytics tables and optionally export them."""
+    if importlib.util.find_spec("numpy") is None:
+        raise SystemExit('Results analytics needs NumPy: pip install -e ".[analytics]"')
+
+    import time
+
+    started = time.perf_counter()
+    table = load_results(paths, workers)
+    if first_round_only:
+        keep = table["round"] == 0
+        if not keep.all():
+            # Later rounds of multi-turn runs would skew per-sample numbers
+            row_map = np.cumsum(keep) - 1
+            for name in ("offered", "called"):
+                pair_keep = keep[table[f"{name}_row"]]
+                table[f"{name}_tool"] = table[f"{name}_tool"][pair_keep]
+                table[f"{name}_row"] = row_map[table[f"{name}_row"][pair_keep]]
+            for name in ROW_COLUMNS:
+                table[name] = table[name][keep]
+    loaded = time.perf_counter()
+    tables = analyze_result_table(table, top)
+    done = time.perf_counter()
+
+    print("=" * 70)
+    print("Tool Call Results Analysis")
+    print("=" * 70)
+    print(
+        f"  {len(table['vendor'])} results from {len(paths)} files "
+        f"(loaded in {loaded - started:.2f}s, analyzed in {done - loaded:.2f}s)"
+    )
+    print()
+    for name, rows in tables.items():
+        print_table(name.replace("_", " ").capitalize(), rows, top)
+
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+        for name, rows in tables.items():
+            with open(os.path.join(csv_dir, f"{name}.csv"), "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"✓ CSV tables written to {csv_dir}")
+    if json_file:
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(tables, f, ensure_ascii=False, indent=2)
+        print(f"✓ JSON tables written to {json_file}")
+    return tables
+
+
+def main():
+    import argparse
     import sys
 
-    file_path = sys.argv[1] if len(sys.argv) > 1 else "samples-deepseek.jsonl"
+    argv = sys.argv[1:]
+    # `analyze_samples.py samples.jsonl` keeps analyzing a test set
+    if argv[:1] != ["results"] and argv[:1] != ["samples"] and argv[:1] not in (["-h"], ["--help"]):
+        argv = ["samples", *argv]
 
-    if not Path(file_path).exists():
-        print(f"Error: {file_path} not found!")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Analyze test sets and evaluation results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    analyze_samples(file_path)
+    samples_parser = subparsers.add_parser("samples", help="Statistics of a samples.jsonl test set")
+    samples_parser.add_argument(
+        "file_path", nargs="?", default="samples-deepseek.jsonl", help="Test set JSONL file"
+    )
+
+    results_parser = subparsers.add_parser(
+        "results", help="Latency, failure and finish-reason analytics of results-*.jsonl files"
+    )
+    results_parser.add_argument("paths", nargs="+", help="results JSONL files, one vendor/model each")
+    results_parser.add_argument("--csv-dir", help="Directory to write one CSV file per table to")
+    results_parser.add_argument("--json", dest="json_file", help="File to write all tables to as JSON")
+    results_parser.add_argument(
+        "--top", type=int, default=20, help="Rows shown per table and in the slowest/most-failing lists (default: 20)"
+    )
+    results_parser.add_argument(
+        "--workers", type=int, help="Parser processes (default: number of CPUs)"
+    )
+    results_parser.add_argument(
+        "--all-rounds", action="store_true", help="Include later rounds of multi-turn runs"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "samples":
+        if not Path(args.file_path).exists():
+            print(f"Error: {args.file_path} not found!")
+            sys.exit(1)
+        analyze_samples(args.file_path)
+    else:
+        missing = [p for p in args.paths if not Path(p).exists()]
+        if missing:
+            print(f"Error: {', '.join(missing)} not found!")
+            sys.exit(1)
+        analyze_results(
+            args.paths,
+            csv_dir=args.csv_dir,
+            json_file=args.json_file,
+            top=args.top,
+            workers=args.workers,
+            first_round_only=not args.all_rounds,
+        )
+
+
+if __name__ == "__main__":
+    main()
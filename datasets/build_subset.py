@@ -0,0 +1,330 @@
+"""
+Deduplicate a samples.jsonl test set and build stratified subsets of it.
+
+Each sample is fingerprinted by its tool-set signature, parameter complexity
+and turn count. Exact duplicates are removed by content hash and near
+duplicates by MinHash with LSH banding. Subsets are then drawn per stratum
+in proportion to the deduplicated set, so a small screen keeps the coverage
+distribution of the full set.
+"""
+
+import hashlib
+import json
+import random
+import struct
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+# MinHash parameters: BANDS * ROWS permutations, candidate pairs share a band
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+MERSENNE_PRIME = (1 << 61) - 1
+SHINGLE_SIZE = 4
+
+
+@dataclass
+class SampleFingerprint:
+    """Coverage features and hashes of one sample."""
+
+    line_index: int
+    content_hash: str
+    tool_signature: str
+    tool_count: int
+    param_count: int
+    max_depth: int
+    turn_count: int
+    minhash: tuple
+
+    @property
+    def stratum(self) -> tuple:
+        """Coarse coverage cell used for stratified sampling."""
+        return (
+            bucket(self.tool_count, (1, 2, 4, 8)),
+            bucket(self.param_count, (1, 3, 6, 10)),
+            "nested" if self.max_depth > 1 else "flat",
+            bucket(self.turn_count, (1, 2, 4)),
+        )
+
+
+def bucket(value: int, bounds: tuple) -> str:
+    """Label a value with the first upper bound it does not exceed."""
+    for bound in bounds:
+        if value <= bound:
+            return f"<={bound}"
+    return f">{bounds[-1]}"
+
+
+def schema_depth(schema: dict) -> int:
+    """Nesting depth of object/array schemas; scalar parameters count as 0."""
+    if not isinstance(schema, dict):
+        return 0
+    children = list((schema.get("properties") or {}).values())
+    if isinstance(schema.get("items"), dict):
+        children.append(schema["items"])
+    if not children and schema.get("type") not in ("object", "array"):
+        return 0
+    return 1 + max((schema_depth(child) for child in children), default=0)
+
+
+def stable_hash64(text: str) -> int:
+    """Process-independent 64-bit hash (str hash() is salted per process)."""
+    return struct.unpack("<Q", hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest())[0]
+
+
+def make_permutations(seed: int = 1) -> list[tuple[int, int]]:
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+        for _ in range(MINHASH_PERMUTATIONS)
+    ]
+
+
+PERMUTATIONS = make_permutations()
+
+
+def minhash(shingles: set[str]) -> tuple:
+    """MinHash signature of a set of shingles."""
+    if not shingles:
+        return (0,) * MINHASH_PERMUTATIONS
+    hashes = [stable_hash64(s) for s in shingles]
+    return tuple(
+        min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS
+    )
+
+
+def sample_shingles(sample: dict) -> set[str]:
+    """Character shingles of the conversation text plus tool names."""
+    text = " ".join(
+        m.get("content") or ""
+        for m in sample.get("messages", [])
+        if isinstance(m.get("content"), str)
+    )
+    text = " ".join(text.lower().split())
+    shingles = {text[i : i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    shingles.update(
+        "tool:" + t.get("function", {}).get("name", "") for t in sample.get("tools", [])
+    )
+    return shingles
+
+
+def fingerprint_sample(line_index: int, sample: dict) -> SampleFingerprint:
+    messages = sample.get("messages", [])
+    tools = sample.get("tools", [])
+    content = json.dumps(
+        {"messages": messages, "tools": tools}, sort_keys=True, ensure_ascii=False
+    )
+    tool_shapes = sorted(
+        (
+            t.get("function", {}).get("name", ""),
+            tuple(sorted((t.get("function", {}).get("parameters") or {}).get("properties", {}))),
+        )
+        for t in tools
+    )
+    parameters = [t.get("function", {}).get("parameters") or {} for t in tools]
+    return SampleFingerprint(
+        line_index=line_index,
+        content_hash=hashlib.md5(content.encode("utf-8")).hexdigest(),
+        tool_signature=hashlib.md5(json.dumps(tool_shapes).encode("utf-8")).hexdigest(),
+        tool_count=len(tools),
+        param_count=sum(len(p.get("properties", {})) for p in parameters),
+        max_depth=max((schema_depth(p) for p in parameters), default=0),
+        turn_count=sum(1 for m in messages if m.get("role") == "user"),
+        minhash=minhash(sample_shingles(sample)),
+    )
+
+
+def estimated_jaccard(a: tuple, b: tuple) -> float:
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_PERMUTATIONS
+
+
+def deduplicate(
+    fingerprints: list[SampleFingerprint], threshold: float
+) -> tuple[list[SampleFingerprint], int, int]:
+    """
+    Drop exact and near duplicates, keeping the first occurrence.
+
+    Returns (kept, exact_duplicates, near_duplicates).
+    """
+    seen_hashes = set()
+    band_buckets: dict[tuple, list[SampleFingerprint]] = defaultdict(list)
+    kept = []
+    exact = 0
+    near = 0
+
+    for fp in fingerprints:
+        if fp.content_hash in seen_hashes:
+            exact += 1
+            continue
+        seen_hashes.add(fp.content_hash)
+
+        bands = [
+            (i, fp.minhash[i * MINHASH_ROWS : (i + 1) * MINHASH_ROWS])
+            for i in range(MINHASH_BANDS)
+        ]
+        candidates = {id(c): c for band in bands for c in band_buckets.get(band, ())}
+        if any(
+            c.tool_signature == fp.tool_signature
+            and estimated_jaccard(c.minhash, fp.minhash) >= threshold
+            for c in candidates.values()
+        ):
+            near += 1
+            continue
+
+        for band in bands:
+            band_buckets[band].append(fp)
+        kept.append(fp)
+
+    return kept, exact, near
+
+
+def allocate(stratum_sizes: dict[tuple, int], size: int) -> dict[tuple, int]:
+    """
+    Proportional allocation with largest remainders, capped at stratum size.
+
+    When the subset is at least as large as the number of strata, every
+    stratum gets one sample first so rare cells stay covered.
+    """
+    total = sum(stratum_sizes.values())
+    if size >= total:
+        return dict(stratum_sizes)
+    allocation = {k: 0 for k in stratum_sizes}
+    if size >= len(stratum_sizes):
+        allocation = {k: 1 for k in stratum_sizes}
+    remaining_sizes = {k: n - allocation[k] for k, n in stratum_sizes.items()}
+    remaining_total = sum(remaining_sizes.values())
+    budget = size - sum(allocation.values())
+    quotas = {k: budget * n / remaining_total for k, n in remaining_sizes.items()}
+    for k, q in quotas.items():
+        allocation[k] += int(q)
+    leftover = size - sum(allocation.values())
+    for k in sorted(quotas, key=lambda k: quotas[k] - int(quotas[k]), reverse=True)[:leftover]:
+        allocation[k] += 1
+    return allocation
+
+
+def stratified_subset(
+    fingerprints: list[SampleFingerprint], size: int, seed: int = 0
+) -> list[SampleFingerprint]:
+    """
+    Draw `size` samples keeping the stratum distribution.
+
+    Within a stratum, samples are taken round-robin over tool signatures so
+    the subset covers as many distinct tool sets as possible.
+    """
+    rng = random.Random(seed)
+    strata: dict[tuple, list[SampleFingerprint]] = defaultdict(list)
+    for fp in fingerprints:
+        strata[fp.stratum].append(fp)
+
+    allocation = allocate({k: len(v) for k, v in strata.items()}, size)
+    selected = []
+    for stratum, members in strata.items():
+        by_signature: dict[str, list[SampleFingerprint]] = defaultdict(list)
+        for fp in members:
+            by_signature[fp.tool_signature].append(fp)
+        groups = list(by_signature.values())
+        rng.shuffle(groups)
+        for group in groups:
+            rng.shuffle(group)
+
+        picked = []
+        while len(picked) < allocation[stratum]:
+            for group in groups:
+                if group and len(picked) < allocation[stratum]:
+                    picked.append(group.pop())
+        selected.extend(picked)
+
+    return sorted(selected, key=lambda fp: fp.line_index)
+
+
+def print_coverage(full: list[SampleFingerprint], subset: list[SampleFingerprint]):
+    full_counts = Counter(fp.stratum for fp in full)
+    subset_counts = Counter(fp.stratum for fp in subset)
+    print(f"{'Stratum (tools, params, depth, turns)':50s} {'Full':>12s} {'Subset':>12s}")
+    for stratum, count in full_counts.most_common():
+        full_share = count / len(full) * 100
+        subset_share = subset_counts[stratum] / len(subset) * 100 if subset else 0
+        print(
+            f"  {str(stratum):48s} {count:5d} ({full_share:4.1f}%) "
+            f"{subset_counts[stratum]:5d} ({subset_share:4.1f}%)"
+        )
+    print(
+        f"Distinct tool sets: full {len({fp.tool_signature for fp in full})}, "
+        f"subset {len({fp.tool_signature for fp in subset})}"
+    )
+
+
+def build_subset(
+    input_file: str,
+    output_file: str | None,
+    size: int,
+    seed: int = 0,
+    threshold: float = 0.8,
+    dedup_output: str | None = None,
+):
+    """Deduplicate the input and write a stratified subset of `size` samples."""
+    with open(input_file, "r", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+
+    fingerprints = [fingerprint_sample(i, json.loads(line)) for i, line in enumerate(lines)]
+    kept, exact, near = deduplicate(fingerprints, threshold)
+
+    print("=" * 70)
+    print(f"Input samples: {len(fingerprints)}")
+    print(f"Exact duplicates removed: {exact}")
+    print(f"Near duplicates removed (Jaccard >= {threshold}): {near}")
+    print(f"Unique samples: {len(kept)}")
+
+    if dedup_output:
+        with open(dedup_output, "w", encoding="utf-8") as f:
+            for fp in kept:
+                f.write(lines[fp.line_index])
+        print(f"Deduplicated set written to {dedup_output}")
+
+    if output_file:
+        subset = stratified_subset(kept, size, seed)
+        with open(output_file, "w", encoding="utf-8") as f:
+            for fp in subset:
+                f.write(lines[fp.line_index])
+        print(f"Subset of {len(subset)} samples written to {output_file}")
+        print("=" * 70)
+        print_coverage(kept, subset)
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Deduplicate a samples.jsonl test set and build stratified subsets"
+    )
+    parser.add_argument("input", help="Input samples JSONL file")
+    parser.add_argument("--output", help="Output subset JSONL file")
+    parser.add_argument(
+        "--size", type=int, default=128, help="Number of samples in the subset (default: 128)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.8,
+        help="Estimated Jaccard similarity above which samples with the same tool set are near duplicates (default: 0.8)",
+    )
+    parser.add_argument("--dedup-output", help="Also write the full deduplicated set here")
+
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: {args.input} not found!")
+        raise SystemExit(1)
+
+    build_subset(
+        input_file=args.input,
+        output_file=args.output,
+        size=args.size,
+        seed=args.seed,
+        threshold=args.threshold,
+        dedup_output=args.dedup_output,
+    )
@@ -5,9 +5,15 @@ This script extracts conversations that end with a function_call and formats the
 for testing DeepSeek's tool call capability (without tool role support).
 """
 
+import gzip
+import hashlib
+import io
 import json
-import sys
-from pathlib import Path
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
 from loguru import logger
 
 
@@ -69,6 +75,40 @@ def extract_first_function_call(conversations: list[dict]) -> dict | None:
     return None
 
 
+def canonical_call(call: dict | None) -> dict | None:
+    """Expected call as {"name", "arguments"}, with JSON-string arguments parsed."""
+    if not isinstance(call, dict) or not call.get("name"):
+        return None
+    arguments = call.get("arguments") or {}
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments) if arguments.strip() else {}
+        except json.JSONDecodeError:
+            return None
+    return {"name": call["name"], "arguments": arguments}
+
+
+def sample_key(sample: dict) -> str:
+    """
+    Model-independent key of a sample: the hash of its messages and tools.
+
+    Must match tool_calls_eval.expected_call_key, which computes it at
+    scoring time (the request `hash` also covers the model name, which is
+    only known when a run starts).
+    """
+    content = json.dumps(
+        {"messages": sample["messages"], "tools": sample["tools"]},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def expected_calls_path(output_file: str) -> str:
+    """Sidecar of expected calls next to the (base) output file."""
+    return os.path.splitext(output_file)[0] + ".expected.jsonl"
+
+
 def should_include_sample(conversations: list[dict]) -> bool:
     """
     Determine if this sample should be included.
@@ -83,6 +123,219 @@ def should_include_sample(conversations: list[dict]) -> bool:
     return has_function_call and has_user_input
 
 
+def convert_item(
+    item: dict,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    user: str,
+) -> dict | None:
+    """Convert one dataset item to a request sample, or None if it is skipped."""
+    conversations = item.get("conversations", [])
+    tools_str = item.get("tools", "[]")
+
+    # Check if this sample is valid
+    if not should_include_sample(conversations):
+        return None
+
+    # Convert messages
+    messages = convert_conversation(conversations)
+
+    # Skip if no messages or no user message
+    if not messages or not any(m["role"] == "user" for m in messages):
+        return None
+
+    # Parse tools
+    tools = parse_tools(tools_str)
+
+    if not tools:
+        return None
+
+    # Create sample (only include API-compatible fields)
+    return {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": False,
+        "user": user,
+        "tools": tools,
+    }
+
+
+def convert_batch(
+    batch: list[tuple[int, dict]], options: dict
+) -> tuple[list[tuple[dict, dict | None]], int]:
+    """
+    Convert a batch of (index, item) pairs; runs in a worker process.
+
+    Returns (sample, expected call) pairs and the number of skipped items.
+    """
+    samples = []
+    skipped = 0
+    for idx, item in batch:
+        try:
+            sample = convert_item(item, **options)
+            expected = canonical_call(
+                extract_first_function_call(item.get("conversations", []))
+            )
+        except Exception as e:
+            logger.warning(f"Error converting sample {idx}: {e}")
+            sample = None
+        if sample is None:
+            skipped += 1
+        else:
+            samples.append((sample, expected))
+    return samples, skipped
+
+
+def iter_json_array(f, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    eof = not buffer
+    pos = buffer.find("[") + 1
+    if pos == 0:
+        raise ValueError("Input is not a JSON array")
+
+    while True:
+        # Skip separators between elements
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer):
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                pos = end
+                continue
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+        # Need more input; drop consumed text so memory is bounded by the largest element
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_jsonl(f) -> Iterator[dict]:
+    """Yield one object per non-empty line."""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def is_json_array(input_file: str) -> bool:
+    """Peek at the first non-whitespace character to tell JSON arrays from JSONL."""
+    if input_file.endswith(".jsonl"):
+        return False
+    import megfile
+
+    with megfile.smart_open(input_file, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(64)
+            if not chunk:
+                return False
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0] == "["
+
+
+def iter_dataset(input_file: str) -> Iterator[dict]:
+    """Stream items from a JSON array or JSONL file (local path or megfile URL)."""
+    import megfile
+
+    json_array = is_json_array(input_file)
+    with megfile.smart_open(input_file, "r", encoding="utf-8") as f:
+        if json_array:
+            yield from iter_json_array(f)
+        else:
+            yield from iter_jsonl(f)
+
+
+def iter_batches(items: Iterator[dict], batch_size: int) -> Iterator[list[tuple[int, dict]]]:
+    """Group items into lists of (index, item) pairs."""
+    batch = []
+    for idx, item in enumerate(items):
+        batch.append((idx, item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ShardWriter:
+    """Write samples into numbered, optionally gzip-compressed JSONL shards."""
+
+    def __init__(self, output_file: str, shard_size: int = 0, compress: bool = False):
+        self.output_file = output_file
+        self.shard_size = shard_size
+        self.compress = compress
+        self.shards: list[dict] = []
+        self._file = None
+        self._raw = None
+
+    def _shard_path(self, index: int) -> str:
+        if self.shard_size:
+            root, ext = os.path.splitext(self.output_file)
+            path = f"{root}-{index:05d}{ext or '.jsonl'}"
+        else:
+            path = self.output_file
+        if self.compress and not path.endswith(".gz"):
+            path += ".gz"
+        return path
+
+    def _open_shard(self):
+        import megfile
+
+        path = self._shard_path(len(self.shards))
+        self._raw = megfile.smart_open(path, "wb")
+        if self.compress:
+            self._file = gzip.open(self._raw, "wt", encoding="utf-8")
+        else:
+            self._file = io.TextIOWrapper(self._raw, encoding="utf-8")
+        self.shards.append({"path": path, "samples": 0, "tools": 0, "messages": 0})
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            if self.compress:
+                self._raw.close()
+            self._file = None
+            self._raw = None
+
+    def write(self, sample: dict):
+        if self._file is None or (
+            self.shard_size and self.shards[-1]["samples"] >= self.shard_size
+        ):
+            self._close_shard()
+            self._open_shard()
+        self._file.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        stats = self.shards[-1]
+        stats["samples"] += 1
+        stats["tools"] += len(sample["tools"])
+        stats["messages"] += len(sample["messages"])
+
+    def close(self) -> list[dict]:
+        """Close the current shard and write the manifest for sharded output."""
+        self._close_shard()
+        if self.shard_size:
+            import megfile
+
+            manifest_path = os.path.splitext(self.output_file)[0] + ".manifest.json"
+            with megfile.smart_open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump({"shards": self.shards}, f, ensure_ascii=False, indent=2)
+            logger.info(f"Wrote shard manifest to {manifest_path}")
+        return self.shards
+
+
 def convert_dataset(
     input_file: str,
     output_file: str,
@@ -90,91 +343,102 @@ def convert_dataset(
     temperature: float = 0.0,
     max_tokens: int = 4096,
     user: str = "test-user",
+    workers: int = 1,
+    batch_size: int = 1000,
+    shard_size: int = 0,
+    compress: bool = False,
 ):
-    """Convert the dataset to samples.jsonl format."""
-
-    logger.info(f"Reading dataset from {input_file}")
-    with open(input_file, "r", encoding="utf-8") as f:
-        dataset = json.load(f)
+    """
+    Convert the dataset to samples.jsonl format.
 
-    logger.info(f"Total samples in dataset: {len(dataset)}")
+    Input is streamed (JSON array or JSONL) and converted in batches by a
+    process pool with a bounded number of batches in flight, so memory does
+    not grow with the corpus size. Expected calls are written to a sidecar
+    keyed by sample_key, for accuracy scoring without extra API calls.
+    """
+    import megfile
 
-    converted_samples = []
+    logger.info(f"Reading dataset from {input_file}")
+    options = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "user": user,
+    }
+
+    total_count = 0
+    converted_count = 0
     skipped_count = 0
-
-    for idx, item in enumerate(dataset):
-        conversations = item.get("conversations", [])
-        tools_str = item.get("tools", "[]")
-
-        # Check if this sample is valid
-        if not should_include_sample(conversations):
-            skipped_count += 1
-            continue
-
-        try:
-            # Convert messages
-            messages = convert_conversation(conversations)
-
-            # Skip if no messages or no user message
-            if not messages or not any(m["role"] == "user" for m in messages):
-                skipped_count += 1
-                continue
-
-            # Parse tools
-            tools = parse_tools(tools_str)
-
-            if not tools:
-                skipped_count += 1
-                continue
-
-            # Get expected function call for reference (optional)
-            expected_call = extract_first_function_call(conversations)
-
-            # Create sample (only include API-compatible fields)
-            sample = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "stream": False,
-                "user": user,
-                "tools": tools,
-            }
-
-            converted_samples.append(sample)
-
-        except Exception as e:
-            logger.warning(f"Error converting sample {idx}: {e}")
-            skipped_count += 1
-            continue
-
-    logger.info(f"Converted {len(converted_samples)} samples")
+    expected_count = 0
+    preview = None
+    writer = ShardWriter(output_file, shard_size=shard_size, compress=compress)
+    expected_file = megfile.smart_open(expected_calls_path(output_file), "w", encoding="utf-8")
+
+    def consume(samples: list[tuple[dict, dict | None]], skipped: int, batch_len: int):
+        nonlocal total_count, converted_count, skipped_count, expected_count, preview
+        total_count += batch_len
+        skipped_count += skipped
+        for sample, expected in samples:
+            converted_count += 1
+            writer.write(sample)
+            if expected is not None:
+                expected_count += 1
+                record = {
+                    "key": sample_key(sample),
+                    "data_index": converted_count,
+                    "expected_call": expected,
+                }
+                expected_file.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+        if preview is None and samples:
+            preview = samples[0][0]
+
+    batches = iter_batches(iter_dataset(input_file), batch_size)
+    if workers <= 1:
+        for batch in batches:
+            samples, skipped = convert_batch(batch, options)
+            consume(samples, skipped, len(batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep at most 2 batches per worker in flight and write in input order
+            pending: deque = deque()
+            for batch in batches:
+                pending.append((executor.submit(convert_batch, batch, options), len(batch)))
+                if len(pending) >= workers * 2:
+                    future, batch_len = pending.popleft()
+                    consume(*future.result(), batch_len)
+            while pending:
+                future, batch_len = pending.popleft()
+                consume(*future.result(), batch_len)
+
+    shards = writer.close()
+    expected_file.close()
+
+    logger.info(f"Total samples in dataset: {total_count}")
+    logger.info(f"Converted {converted_count} samples")
     logger.info(f"Skipped {skipped_count} samples")
-
-    # Write to JSONL
-    logger.info(f"Writing to {output_file}")
-    with open(output_file, "w", encoding="utf-8") as f:
-        for sample in converted_samples:
-            f.write(json.dumps(sample, ensure_ascii=False) + "\n")
-
     logger.info("Conversion complete!")
 
     # Print statistics
     print("\n" + "=" * 60)
     print("Conversion Statistics")
     print("=" * 60)
-    print(f"Total input samples: {len(dataset)}")
-    print(f"Successfully converted: {len(converted_samples)}")
+    print(f"Total input samples: {total_count}")
+    print(f"Successfully converted: {converted_count}")
     print(f"Skipped: {skipped_count}")
     print(f"Output file: {output_file}")
+    print(f"Expected calls: {expected_count} written to {expected_calls_path(output_file)}")
+    if shard_size:
+        for shard in shards:
+            print(
+                f"  {shard['path']}: {shard['samples']} samples, "
+                f"{shard['tools']} tools, {shard['messages']} messages"
+            )
     print("=" * 60 + "\n")
 
     # Sample preview
-    if converted_samples:
+    if preview:
         print("Sample preview (first item):")
-        print(
-            json.dumps(converted_samples[0], ensure_ascii=False, indent=2)[:500] + "..."
-        )
+        print(json.dumps(preview, ensure_ascii=False, indent=2)[:500] + "...")
 
 
 if __name__ == "__main__":
@@ -186,12 +450,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--input",
         default="Z:/works/huggingface.co/datasets/glaive_toolcall_zh/glaive_toolcall_zh_1k.json",
-        help="Input dataset JSON file",
+        help="Input dataset file: JSON array or JSONL, local path or megfile URL (e.g. s3://...)",
     )
     parser.add_argument(
         "--output",
         default="samples-deepseek.jsonl",
-        help="Output JSONL file",
+        help="Output JSONL file (base name of the shards when --shard-size is set)",
     )
     parser.add_argument(
         "--model",
@@ -216,6 +480,30 @@ if __name__ == "__main__":
         help="User identifier for requests",
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of converter processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Samples per batch sent to a worker (default: 1000)",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        help="Samples per output shard, writes OUTPUT-00000.jsonl... plus a manifest (default: 0, single file)",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="gzip-compress output files",
+    )
+
     args = parser.parse_args()
 
     convert_dataset(
@@ -225,4 +513,8 @@ if __name__ == "__main__":
         temperature=args.temperature,
         max_tokens=args.max_tokens,
         user=args.user,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        shard_size=args.shard_size,
+        compress=args.compress,
     )
@@ -0,0 +1,319 @@
+"""
+Continuous drift monitor for tool-call vendors.
+
+Every interval, a small rotating stratified probe set is sent to each
+configured vendor, and per-sample outcomes and latency are compared with a
+stored baseline results file (matched by request hash). When agreement or
+p95 latency over a rolling window drifts past its threshold, a "drift"
+event is appended to the events file and posted to the webhook, followed by
+a "recovered" event once the vendor is back within bounds.
+
+Memory is bounded: only a compact outcome per baseline sample and a
+fixed-size window of recent probes are kept per vendor.
+
+Vendors are configured in a JSON file:
+
+    [
+        {
+            "name": "ppio",
+            "model": "deepseek/deepseek-v3.2-exp",
+            "base_url": "https://api.ppinfra.com/v3/openai",
+            "api_key_env": "PPIO_API_KEY",
+            "baseline": "benchmark-result/results-ppio-deepseek-v3.2-exp.jsonl"
+        }
+    ]
+
+Optional per-vendor keys: extra_body, provider_order, filter_unsupported_roles.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Optional
+
+import httpx
+import megfile
+from loguru import logger
+
+from tool_calls_eval import (
+    LatencySketch,
+    ResultRecord,
+    ToolCallsValidator,
+    json_dumps_line,
+    json_loads,
+)
+
+
+def outcome(record: ResultRecord) -> tuple:
+    """What a probe must reproduce: finish reason, called tool names and pass/fail."""
+    passed = record.status == "success" and (
+        record.finish_reason != "tool_calls" or bool(record.tool_calls_valid)
+    )
+    return (record.finish_reason, record.tool_names, passed)
+
+
+def load_baseline(path: str) -> tuple[dict[str, tuple], Optional[float]]:
+    """Compact first-trial outcomes by hash, and the baseline p95 latency in ms."""
+    outcomes = {}
+    latency = LatencySketch()
+    with megfile.smart_open(path, "rb") as f:
+        for line in f:
+            result = json_loads(line)
+            if result.get("trial", 0) or result.get("round", 0):
+                continue
+            record = ResultRecord.from_result(result)
+            outcomes[record.hash] = outcome(record)
+            if record.status == "success" and record.duration_ms:
+                latency.add(record.duration_ms)
+    return outcomes, latency.quantile(0.95)
+
+
+class ProbeRotation:
+    """
+    Stratified rotating probe sets.
+
+    Samples are grouped by their baseline outcome (finish reason and pass/fail),
+    each group is shuffled once and walked with its own cursor, so the whole set
+    is cycled through over time. Each round's samples are split over the strata
+    by largest remainder, with the fractional shares carried over to the next
+    round, so strata too small for a sample every round still get their turn.
+    """
+
+    def __init__(self, requests: list[dict], baseline: dict[str, tuple], seed: int = 0):
+        strata: dict[tuple, list[dict]] = defaultdict(list)
+        for req in requests:
+            if req["hash"] in baseline:
+                finish_reason, _, passed = baseline[req["hash"]]
+                strata[(finish_reason, passed)].append(req)
+        rng = random.Random(seed)
+        self.strata = [members for _, members in sorted(strata.items(), key=str)]
+        for members in self.strata:
+            rng.shuffle(members)
+        self.cursors = [0] * len(self.strata)
+        self.credits = [0.0] * len(self.strata)
+        self.total = sum(len(members) for members in self.strata)
+
+    def quotas(self, size: int) -> list[int]:
+        """Samples per stratum for the next round, summing to min(size, total)."""
+        size = min(size, self.total)
+        for i, members in enumerate(self.strata):
+            self.credits[i] += size * len(members) / self.total
+        quotas = [
+            min(max(0, math.floor(credit)), len(members))
+            for credit, members in zip(self.credits, self.strata)
+        ]
+        # The strata with the largest unpaid share get the samples left over
+        order = sorted(
+            range(len(self.strata)), key=lambda i: self.credits[i] - quotas[i], reverse=True
+        )
+        remaining = size - sum(quotas)
+        while remaining > 0:
+            for i in order:
+                if remaining and quotas[i] < len(self.strata[i]):
+                    quotas[i] += 1
+                    remaining -= 1
+        for i, quota in enumerate(quotas):
+            self.credits[i] -= quota
+        return quotas
+
+    def next_probe(self, size: int) -> list[dict]:
+        """Up to `size` distinct samples, allocated to strata in proportion to their size."""
+        probe = []
+        for i, quota in enumerate(self.quotas(size)):
+            members = self.strata[i]
+            for _ in range(quota):
+                probe.append(members[self.cursors[i] % len(members)])
+                self.cursors[i] += 1
+        return probe
+
+
+class VendorMonitor:
+    """Probes one vendor and tracks a rolling window of agreement and latency."""
+
+    def __init__(self, config: dict, dataset: str, args: argparse.Namespace):
+        self.name = config["name"]
+        api_key = config.get("api_key")
+        if config.get("api_key_env"):
+            api_key = os.environ.get(config["api_key_env"], api_key)
+        self.validator = ToolCallsValidator(
+            model=config["model"],
+            base_url=config["base_url"],
+            api_key=api_key,
+            concurrency=args.concurrency,
+            output_file=os.devnull,
+            summary_file=os.devnull,
+            timeout=args.timeout,
+            max_retries=args.retries,
+            extra_body=config.get("extra_body"),
+            filter_unsupported_roles=config.get("filter_unsupported_roles", False),
+            vendor=self.name,
+            provider_order=config.get("provider_order"),
+        )
+        self.baseline, self.baseline_p95 = load_baseline(config["baseline"])
+        self.rotation = ProbeRotation(
+            self.validator.read_jsonl(dataset), self.baseline, seed=args.seed
+        )
+        if not self.rotation.total:
+            raise ValueError(f"No dataset sample of {self.name} has a baseline result")
+        self.probe_size = args.probe_size
+        self.window: deque[tuple[str, bool, Optional[int]]] = deque(maxlen=args.window)
+        self.drifting = False
+        logger.info(
+            f"[{self.name}] {self.rotation.total} probe candidates, "
+            f"baseline p95 {self.baseline_p95 and round(self.baseline_p95)}ms"
+        )
+
+    async def probe(self):
+        """Send one probe set and add the outcomes to the window."""
+        probe = self.rotation.next_probe(self.probe_size)
+        results = await asyncio.gather(
+            *(self.validator.process_request(req, req["data_index"]) for req in probe)
+        )
+        for result in results:
+            record = ResultRecord.from_result(result)
+            agrees = outcome(record) == self.baseline[record.hash]
+            duration = record.duration_ms if record.status == "success" else None
+            self.window.append((record.hash, agrees, duration))
+
+    def stats(self) -> dict:
+        latency = LatencySketch()
+        for _, _, duration in self.window:
+            if duration:
+                latency.add(duration)
+        p95 = latency.quantile(0.95)
+        return {
+            "window": len(self.window),
+            "agreement": round(sum(agrees for _, agrees, _ in self.window) / len(self.window), 4),
+            "p95_ms": p95 and round(p95),
+            "baseline_p95_ms": self.baseline_p95 and round(self.baseline_p95),
+            "disagreeing_hashes": [h for h, agrees, _ in self.window if not agrees][-20:],
+        }
+
+    def check(self, args: argparse.Namespace) -> Optional[dict]:
+        """Event dict when the drift state changes, otherwise None."""
+        stats = self.stats()
+        reasons = []
+        if stats["agreement"] < args.agreement_threshold:
+            reasons.append(f"agreement {stats['agreement']} < {args.agreement_threshold}")
+        if (
+            stats["p95_ms"]
+            and self.baseline_p95
+            and stats["p95_ms"] > self.baseline_p95 * args.latency_ratio
+        ):
+            reasons.append(
+                f"p95 {stats['p95_ms']}ms > {args.latency_ratio}x baseline {stats['baseline_p95_ms']}ms"
+            )
+        logger.info(
+            f"[{self.name}] agreement={stats['agreement']} p95={stats['p95_ms']}ms "
+            f"window={stats['window']}"
+        )
+
+        # Alert only once a full probe set is in, and only on state changes
+        if stats["window"] < min(self.probe_size, self.window.maxlen):
+            return None
+        drifting = bool(reasons)
+        if drifting == self.drifting:
+            return None
+        self.drifting = drifting
+        return {
+            "type": "drift" if drifting else "recovered",
+            "vendor": self.name,
+            "model": self.validator.model,
+            "at": datetime.now().isoformat(),
+            "reasons": reasons,
+            **stats,
+        }
+
+
+async def emit_event(event: dict, events, webhook: Optional[str]):
+    logger.warning(f"[{event['vendor']}] {event['type']}: {'; '.join(event['reasons']) or 'within thresholds'}")
+    events.write(json_dumps_line(event))
+    events.flush()
+    if webhook:
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await client.post(webhook, json=event)
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f"Webhook delivery failed: {e}")
+
+
+async def monitor(args: argparse.Namespace):
+    with megfile.smart_open(args.vendors, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    monitors = [VendorMonitor(config, args.dataset, args) for config in configs]
+
+    # One handle for the monitor's lifetime; events are flushed as they are written
+    with megfile.smart_open(args.events_file, "ab") as events:
+        round_index = 0
+        while True:
+            round_index += 1
+            results = await asyncio.gather(
+                *(m.probe() for m in monitors), return_exceptions=True
+            )
+            for m, result in zip(monitors, results):
+                if isinstance(result, Exception):
+                    logger.error(f"[{m.name}] probe failed: {result}")
+                    continue
+                event = m.check(args)
+                if event:
+                    await emit_event(event, events, args.webhook)
+            if args.rounds and round_index >= args.rounds:
+                break
+            await asyncio.sleep(args.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Periodically probe vendors and alert when tool-call behaviour drifts from a baseline run"
+    )
+    parser.add_argument("dataset", help="JSONL test set the baseline results were produced from")
+    parser.add_argument("--vendors", required=True, help="JSON file listing the vendors to monitor")
+    parser.add_argument(
+        "--interval", type=float, default=3600, help="Seconds between probe rounds (default: 3600)"
+    )
+    parser.add_argument(
+        "--probe-size", type=int, default=16, help="Samples per vendor per round (default: 16)"
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=128,
+        help="Number of recent probes agreement and p95 latency are computed over (default: 128)",
+    )
+    parser.add_argument(
+        "--agreement-threshold",
+        type=float,
+        default=0.9,
+        help="Alert when the share of probes matching the baseline outcome drops below this (default: 0.9)",
+    )
+    parser.add_argument(
+        "--latency-ratio",
+        type=float,
+        default=1.5,
+        help="Alert when p95 latency exceeds this multiple of the baseline p95 (default: 1.5)",
+    )
+    parser.add_argument(
+        "--events-file",
+        default="drift-events.jsonl",
+        help="JSONL file drift and recovery events are appended to (default: drift-events.jsonl)",
+    )
+    parser.add_argument("--webhook", help="URL each event is POSTed to as JSON")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests per vendor (default: 4)")
+    parser.add_argument("--timeout", type=int, default=600, help="Request timeout in seconds (default: 600)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per request (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the probe rotation (default: 0)")
+    parser.add_argument(
+        "--rounds", type=int, default=0, help="Stop after this many rounds (default: 0, run forever)"
+    )
+    args = parser.parse_args()
+    asyncio.run(monitor(args))
+
+
+if __name__ == "__main__":
+    main()
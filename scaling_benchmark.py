@@ -0,0 +1,547 @@
+"""
+Context-scaling benchmark: how latency and tool-call validity degrade as requests grow.
+
+`generate` writes a grid of synthetic samples in the format of
+datasets/convert_dataset.py. Each axis sweeps one dimension while the others
+stay at their baseline:
+
+    tools          number of tools offered (the target tool plus distractors)
+    history        user/assistant turns before the final request
+    schema_width   optional properties added to the target tool's parameters
+    schema_depth   nesting depth of an optional object parameter of the target tool
+    system_chars   length of the system prompt
+
+Next to the samples it writes the expected calls ({output}.expected.jsonl) and
+the grid ({output}.grid.jsonl), which maps each sample key to its axis points.
+
+`run` sends the grid to every vendor of a vendors file (the drift monitor
+format, without `baseline`) with streaming on, so TTFT is measured, and
+`curves` turns the results into per-vendor scaling tables of TTFT, latency,
+tokens/s and schema-error rate:
+
+    python scaling_benchmark.py generate scaling.jsonl
+    python scaling_benchmark.py run scaling.jsonl --vendors vendors.json --results-dir scaling-results
+    python scaling_benchmark.py curves scaling.grid.jsonl scaling-results/results-*.jsonl --csv scaling.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+from collections import defaultdict
+from pathlib import Path
+
+import megfile
+from loguru import logger
+
+from tool_calls_eval import (
+    LatencySketch,
+    ResultRecord,
+    ToolCallsValidator,
+    expected_call_key,
+    json_dumps_line,
+    json_loads,
+    load_expected_calls,
+)
+
+AXES = ("tools", "history", "schema_width", "schema_depth", "system_chars")
+
+# Point every axis is swept from; the other dimensions stay here
+BASELINE = {"tools": 4, "history": 0, "schema_width": 0, "schema_depth": 0, "system_chars": 0}
+
+DEFAULT_SWEEPS = {
+    "tools": "1,2,4,8,16,32,64,128",
+    "history": "0,2,4,8,16,32,64",
+    "schema_width": "0,4,16,64,128",
+    "schema_depth": "0,1,2,4,8",
+    "system_chars": "0,1000,4000,16000,64000",
+}
+
+TASKS = [
+    {
+        "name": "get_weather",
+        "description": "查询指定城市某一天的天气预报",
+        "properties": {
+            "city": {"type": "string", "description": "城市名称"},
+            "date": {"type": "string", "description": "日期，例如 今天、明天"},
+        },
+        "prompt": "帮我查一下{city}{date}的天气。",
+        "values": {"city": ["北京", "上海", "广州", "成都", "杭州"], "date": ["今天", "明天", "后天"]},
+    },
+    {
+        "name": "convert_currency",
+        "description": "按实时汇率换算货币金额",
+        "properties": {
+            "amount": {"type": "number", "description": "金额"},
+            "from_currency": {"type": "string", "description": "源货币代码，如 USD"},
+            "to_currency": {"type": "string", "description": "目标货币代码，如 CNY"},
+        },
+        "prompt": "把 {amount} {from_currency} 换算成 {to_currency} 是多少？",
+        "values": {
+            "amount": [100, 250, 1000, 4999],
+            "from_currency": ["USD", "EUR", "JPY"],
+            "to_currency": ["CNY", "GBP", "HKD"],
+        },
+    },
+    {
+        "name": "search_flights",
+        "description": "搜索两个城市之间某天的航班",
+        "properties": {
+            "origin": {"type": "string", "description": "出发城市"},
+            "destination": {"type": "string", "description": "到达城市"},
+            "date": {"type": "string", "description": "出发日期，格式 YYYY-MM-DD"},
+        },
+        "prompt": "帮我查 {date} 从{origin}飞{destination}的航班。",
+        "values": {
+            "origin": ["北京", "深圳", "西安"],
+            "destination": ["上海", "重庆", "厦门"],
+            "date": ["2025-10-01", "2025-11-15", "2025-12-24"],
+        },
+    },
+    {
+        "name": "create_reminder",
+        "description": "在指定时间创建一条提醒",
+        "properties": {
+            "title": {"type": "string", "description": "提醒内容"},
+            "time": {"type": "string", "description": "提醒时间，格式 HH:MM"},
+        },
+        "prompt": "提醒我 {time} {title}。",
+        "values": {"title": ["开周会", "给妈妈打电话", "交房租", "去健身"], "time": ["08:30", "14:00", "21:15"]},
+    },
+]
+
+VERBS = ["get", "list", "create", "update", "delete", "search", "export", "import", "sync", "archive", "share", "validate"]
+NOUNS = ["order", "invoice", "contact", "ticket", "document", "playlist", "recipe", "vehicle", "warehouse", "employee", "coupon", "device"]
+PARAM_TYPES = [
+    {"type": "string"},
+    {"type": "integer"},
+    {"type": "boolean"},
+    {"type": "number"},
+    {"type": "string", "enum": ["low", "medium", "high"]},
+    {"type": "array", "items": {"type": "string"}},
+]
+
+FILLER_SENTENCES = [
+    "回答前请先确认用户的真实意图。",
+    "如果信息不足，应当礼貌地向用户追问。",
+    "涉及金额、日期和地点时要格外仔细核对。",
+    "不要编造不存在的数据或链接。",
+    "优先使用简洁、清晰的中文进行回复。",
+    "在调用工具前检查参数是否完整且格式正确。",
+    "对于敏感话题，保持中立客观的态度。",
+    "如果用户的请求超出能力范围，请说明原因。",
+    "上周的项目复盘会上，大家讨论了交付节奏和测试覆盖率的问题。",
+    "周末我们去郊外爬山，山顶的风景非常开阔。",
+    "这本书从历史、经济和技术三个角度分析了城市的发展。",
+    "最近天气转凉，早晚温差比较大，出门记得带外套。",
+]
+
+
+def parse_sweep(text: str) -> list[int]:
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def filler(rng: random.Random, chars: int) -> str:
+    """Chinese filler text of about `chars` characters."""
+    parts = []
+    length = 0
+    while length < chars:
+        sentence = rng.choice(FILLER_SENTENCES)
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:chars]
+
+
+def distractor_tools(rng: random.Random, count: int, exclude: str) -> list[dict]:
+    """`count` distinct tools unrelated to the task, with 1-3 parameters each."""
+    names = [f"{verb}_{noun}" for verb in VERBS for noun in NOUNS if f"{verb}_{noun}" != exclude]
+    tools = []
+    for name in rng.sample(names, count):
+        verb, noun = name.split("_")
+        properties = {
+            f"{noun}_{field}": {**rng.choice(PARAM_TYPES), "description": f"{noun} {field}"}
+            for field in rng.sample(["id", "name", "status", "limit", "tag", "owner"], rng.randint(1, 3))
+        }
+        tools.append(
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": f"{verb.capitalize()} {noun} records in the business system",
+                    "parameters": {
+                        "type": "object",
+                        "properties": properties,
+                        "required": [next(iter(properties))],
+                    },
+                },
+            }
+        )
+    return tools
+
+
+def nested_options(depth: int) -> dict:
+    """Optional object parameter nested `depth` levels deep."""
+    schema = {
+        "type": "object",
+        "description": f"第 {depth} 层高级选项",
+        "properties": {
+            "enabled": {"type": "boolean", "description": "是否启用"},
+            "priority": {"type": "integer", "minimum": 0, "maximum": 9, "description": "优先级"},
+        },
+    }
+    if depth > 1:
+        schema["properties"]["details"] = nested_options(depth - 1)
+    return schema
+
+
+def target_tool(task: dict, width: int, depth: int, rng: random.Random) -> dict:
+    properties = dict(task["properties"])
+    for i in range(width):
+        properties[f"extra_option_{i}"] = {
+            **rng.choice(PARAM_TYPES),
+            "description": f"可选参数 {i}，用户未提及时不要填写",
+        }
+    if depth:
+        properties["advanced_options"] = nested_options(depth)
+    return {
+        "type": "function",
+        "function": {
+            "name": task["name"],
+            "description": task["description"],
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": list(task["properties"]),
+            },
+        },
+    }
+
+
+def build_sample(point: dict, index: int, args: argparse.Namespace) -> tuple[dict, dict]:
+    """Sample and expected call of one grid point; identical points give identical samples."""
+    rng = random.Random(json.dumps([args.seed, index, point], sort_keys=True))
+    task = TASKS[index % len(TASKS)]
+    arguments = {name: rng.choice(values) for name, values in task["values"].items()}
+
+    tools = distractor_tools(rng, point["tools"] - 1, task["name"])
+    tools.insert(
+        rng.randint(0, len(tools)),
+        target_tool(task, point["schema_width"], point["schema_depth"], rng),
+    )
+
+    messages = []
+    if point["system_chars"]:
+        messages.append({"role": "system", "content": filler(rng, point["system_chars"])})
+    for _ in range(point["history"]):
+        messages.append({"role": "user", "content": filler(rng, 80)})
+        messages.append({"role": "assistant", "content": filler(rng, 200)})
+    messages.append({"role": "user", "content": task["prompt"].format(**arguments)})
+
+    sample = {
+        "model": args.model,
+        "messages": messages,
+        "max_tokens": args.max_tokens,
+        "temperature": args.temperature,
+        "stream": False,
+        "user": args.user,
+        "tools": tools,
+    }
+    return sample, {"name": task["name"], "arguments": arguments}
+
+
+def grid_path(output_file: str) -> str:
+    """Sidecar mapping sample keys to grid points, next to the (base) output file."""
+    return os.path.splitext(output_file)[0] + ".grid.jsonl"
+
+
+def expected_calls_path(output_file: str) -> str:
+    """Same sidecar name as datasets/convert_dataset.py."""
+    return os.path.splitext(output_file)[0] + ".expected.jsonl"
+
+
+def generate(args: argparse.Namespace):
+    sweeps = {axis: parse_sweep(getattr(args, axis)) for axis in AXES}
+    if max(sweeps["tools"]) > len(VERBS) * len(NOUNS) or min(sweeps["tools"]) < 1:
+        raise SystemExit(f"--tools values must be between 1 and {len(VERBS) * len(NOUNS)}")
+
+    written: dict[str, int] = {}
+    grid_rows = []
+    with open(args.output, "wb") as samples, open(expected_calls_path(args.output), "wb") as expected_file:
+        for axis in args.axes.split(","):
+            for value in sweeps[axis]:
+                point = {**BASELINE, axis: value}
+                for index in range(args.samples_per_point):
+                    sample, expected = build_sample(point, index, args)
+                    key = expected_call_key(sample)
+                    # Baseline points recur on every axis but are sent once
+                    if key not in written:
+                        written[key] = len(written) + 1
+                        samples.write(json_dumps_line(sample))
+                        expected_file.write(
+                            json_dumps_line(
+                                {"key": key, "data_index": written[key], "expected_call": expected}
+                            )
+                        )
+                    grid_rows.append({"key": key, "axis": axis, "value": value, **point})
+    with open(grid_path(args.output), "wb") as f:
+        for row in grid_rows:
+            f.write(json_dumps_line(row))
+    logger.info(
+        f"Wrote {len(written)} samples to {args.output} "
+        f"({len(grid_rows)} grid points, {args.samples_per_point} per point)"
+    )
+    logger.info(f"Grid: {grid_path(args.output)}, expected calls: {expected_calls_path(args.output)}")
+
+
+async def run_vendors(args: argparse.Namespace):
+    with megfile.smart_open(args.vendors, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    expected_calls = load_expected_calls(expected_calls_path(args.dataset))
+    os.makedirs(args.results_dir, exist_ok=True)
+    for config in configs:
+        api_key = config.get("api_key")
+        if config.get("api_key_env"):
+            api_key = os.environ.get(config["api_key_env"], api_key)
+        name = config["name"]
+        logger.info(f"[{name}] sending the grid to {config['base_url']}")
+        validator = ToolCallsValidator(
+            model=config["model"],
+            base_url=config["base_url"],
+            api_key=api_key,
+            concurrency=args.concurrency,
+            output_file=os.path.join(args.results_dir, f"results-{name}.jsonl"),
+            summary_file=os.path.join(args.results_dir, f"summary-{name}.json"),
+            timeout=args.timeout,
+            max_retries=args.retries,
+            extra_body=config.get("extra_body"),
+            incremental=args.incremental,
+            filter_unsupported_roles=config.get("filter_unsupported_roles", False),
+            vendor=name,
+            provider_order=config.get("provider_order"),
+            repeats=args.repeats,
+            warmup=args.warmup,
+            expected_calls=expected_calls,
+            stream=True,
+        )
+        await validator.validate_file(args.dataset)
+
+
+def load_grid(path: str) -> dict[str, list[tuple[str, int]]]:
+    points = defaultdict(list)
+    with megfile.smart_open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                row = json_loads(line)
+                points[row["key"]].append((row["axis"], row["value"]))
+    return points
+
+
+class PointStats:
+    """Running metrics of one (vendor, axis, value) point."""
+
+    def __init__(self):
+        self.requests = 0
+        self.success = 0
+        self.tool_calls = 0
+        self.schema_errors = 0
+        self.expected = 0
+        self.name_correct = 0
+        self.prompt_tokens = 0
+        self.tokens_per_second = []
+        self.ttft = LatencySketch()
+        self.latency = LatencySketch()
+
+    def add(self, record: ResultRecord):
+        self.requests += 1
+        self.prompt_tokens += record.prompt_tokens
+        if record.tool_name_correct is not None:
+            self.expected += 1
+            self.name_correct += record.tool_name_correct
+        if record.status != "success":
+            return
+        self.success += 1
+        if record.duration_ms:
+            self.latency.add(record.duration_ms)
+            if record.completion_tokens:
+                self.tokens_per_second.append(record.completion_tokens / (record.duration_ms / 1000))
+        # A retried request's first token says more about the retry than the context size
+        if record.ttft_ms is not None and record.attempts == 1:
+            self.ttft.add(record.ttft_ms)
+        if record.finish_reason == "tool_calls":
+            self.tool_calls += 1
+            self.schema_errors += not record.tool_calls_valid
+
+    def row(self) -> dict:
+        def rounded(value, digits=0):
+            return None if value is None else round(value, digits) if digits else int(round(value))
+
+        return {
+            "requests": self.requests,
+            "avg_prompt_tokens": rounded(self.prompt_tokens / self.requests) if self.requests else None,
+            "success_rate": rounded(self.success / self.requests, 4) if self.requests else None,
+            "ttft_p50_ms": rounded(self.ttft.quantile(0.5)),
+            "latency_p50_ms": rounded(self.latency.quantile(0.5)),
+            "latency_p95_ms": rounded(self.latency.quantile(0.95)),
+            "tokens_per_second": rounded(
+                sum(self.tokens_per_second) / len(self.tokens_per_second), 2
+            )
+            if self.tokens_per_second
+            else None,
+            "tool_call_rate": rounded(self.tool_calls / self.success, 4) if self.success else None,
+            "schema_error_rate": rounded(self.schema_errors / self.tool_calls, 4)
+            if self.tool_calls
+            else None,
+            "tool_name_accuracy": rounded(self.name_correct / self.expected, 4)
+            if self.expected
+            else None,
+        }
+
+
+def vendor_name(results_file: str) -> str:
+    stem = Path(results_file).stem
+    return stem[len("results-"):] if stem.startswith("results-") else stem
+
+
+CURVE_METRICS = [
+    ("ttft_p50_ms", "TTFT p50 (ms)"),
+    ("latency_p50_ms", "Latency p50 (ms)"),
+    ("latency_p95_ms", "Latency p95 (ms)"),
+    ("tokens_per_second", "Tokens/s"),
+    ("schema_error_rate", "Schema error rate"),
+    ("tool_name_accuracy", "Tool name accuracy"),
+]
+
+
+def curves_markdown(rows: list[dict], vendors: list[str]) -> str:
+    """One table per axis and metric: axis values down, vendors across."""
+    by_point = {(r["vendor"], r["axis"], r["value"]): r for r in rows}
+    lines = ["# Context Scaling", ""]
+    for axis in AXES:
+        values = sorted({r["value"] for r in rows if r["axis"] == axis})
+        if not values:
+            continue
+        lines += [f"## {axis}", ""]
+        for metric, title in CURVE_METRICS:
+            if all(r[metric] is None for r in rows if r["axis"] == axis):
+                continue
+            lines.append(f"**{title}**")
+            lines.append("")
+            lines.append(f"| {axis} | " + " | ".join(vendors) + " |")
+            lines.append("|---" * (len(vendors) + 1) + "|")
+            for value in values:
+                cells = []
+                for vendor in vendors:
+                    point = by_point.get((vendor, axis, value))
+                    cell = point[metric] if point else None
+                    cells.append("-" if cell is None else str(cell))
+                lines.append(f"| {value} | " + " | ".join(cells) + " |")
+            lines.append("")
+    return "\n".join(lines)
+
+
+def curves(args: argparse.Namespace):
+    grid = load_grid(args.grid)
+    stats: dict[tuple[str, str, int], PointStats] = defaultdict(PointStats)
+    vendors = []
+    for results_file in args.results:
+        vendor = vendor_name(results_file)
+        vendors.append(vendor)
+        unmatched = 0
+        with megfile.smart_open(results_file, "rb") as f:
+            for line in f:
+                result = json_loads(line)
+                if result.get("round", 0):
+                    continue
+                points = grid.get(expected_call_key(result["request"]))
+                if not points:
+                    unmatched += 1
+                    continue
+                record = ResultRecord.from_result(result)
+                for axis, value in points:
+                    stats[(vendor, axis, value)].add(record)
+        if unmatched:
+            logger.warning(f"{results_file}: {unmatched} results are not part of the grid")
+
+    rows = [
+        {"vendor": vendor, "axis": axis, "value": value, **point.row()}
+        for (vendor, axis, value), point in sorted(stats.items())
+    ]
+    report = curves_markdown(rows, vendors)
+    print(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report)
+        logger.info(f"Report saved to {args.report}")
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["vendor"])
+            writer.writeheader()
+            writer.writerows(rows)
+        logger.info(f"Curves saved to {args.csv}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate context-scaling sweeps, run them against vendors and plot scaling curves"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gen = subparsers.add_parser("generate", help="Write the sweep grid as a JSONL test set")
+    gen.add_argument("output", nargs="?", default="scaling.jsonl", help="Output JSONL (default: scaling.jsonl)")
+    gen.add_argument(
+        "--axes",
+        default=",".join(AXES),
+        help=f"Comma-separated axes to sweep (default: {','.join(AXES)})",
+    )
+    for axis in AXES:
+        gen.add_argument(
+            f"--{axis.replace('_', '-')}",
+            dest=axis,
+            default=DEFAULT_SWEEPS[axis],
+            help=f"Values of the {axis} sweep (default: {DEFAULT_SWEEPS[axis]}; baseline {BASELINE[axis]})",
+        )
+    gen.add_argument(
+        "--samples-per-point", type=int, default=8, help="Samples per grid point (default: 8)"
+    )
+    gen.add_argument("--seed", type=int, default=0, help="Seed of the synthetic content (default: 0)")
+    gen.add_argument("--model", default="deepseek-chat", help="Model name to use in requests")
+    gen.add_argument("--temperature", type=float, default=0.0, help="Temperature (default: 0.0)")
+    gen.add_argument("--max-tokens", type=int, default=1024, help="Max tokens (default: 1024)")
+    gen.add_argument("--user", default="test-user", help="User identifier for requests")
+
+    run = subparsers.add_parser("run", help="Send the grid to every vendor with streaming on")
+    run.add_argument("dataset", help="Grid JSONL written by `generate`")
+    run.add_argument("--vendors", required=True, help="JSON file listing the vendors, as for drift_monitor.py")
+    run.add_argument(
+        "--results-dir",
+        default="scaling-results",
+        help="Directory of results-{name}.jsonl and summary-{name}.json (default: scaling-results)",
+    )
+    run.add_argument("--concurrency", type=int, default=5, help="Concurrent requests per vendor (default: 5)")
+    run.add_argument("--timeout", type=int, default=600, help="Request timeout in seconds (default: 600)")
+    run.add_argument("--retries", type=int, default=3, help="Retries per request (default: 3)")
+    run.add_argument("--repeats", type=int, default=1, help="Trials per sample (default: 1)")
+    run.add_argument(
+        "--warmup", type=int, default=0, help="Warm-up requests per vendor before measuring (default: 0)"
+    )
+    run.add_argument("--incremental", action="store_true", help="Only rerun new or failed samples")
+
+    plot = subparsers.add_parser("curves", help="Scaling tables per vendor from the results")
+    plot.add_argument("grid", help="Grid sidecar written by `generate` (*.grid.jsonl)")
+    plot.add_argument("results", nargs="+", help="results-{vendor}.jsonl files of the grid")
+    plot.add_argument("--report", help="Also write the markdown tables to this file")
+    plot.add_argument("--csv", help="Write one row per vendor, axis and value to this CSV file")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args)
+    elif args.command == "run":
+        asyncio.run(run_vendors(args))
+    else:
+        curves(args)
+
+
+if __name__ == "__main__":
+    main()
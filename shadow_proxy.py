@@ -0,0 +1,494 @@
+"""
+Shadow-traffic proxy that scores candidate vendors on live request shapes.
+
+Serves an OpenAI-compatible endpoint locally. Every request is forwarded to
+the primary vendor and its answer is returned unchanged (streaming
+included). A fraction of chat.completions requests is also mirrored to
+candidate vendors in the background, and their responses are validated and
+summarised like a tool_calls_eval.py run, next to the primary's own
+responses to the same requests.
+
+Mirroring never blocks the primary path. Each candidate has its own bounded
+queue, workers and connection pool, and a mirrored request is dropped when
+the candidate's queue is full. The primary's responses to mirrored requests
+(streamed ones reassembled from their SSE chunks) are scored on a worker
+thread through a bounded queue of their own.
+
+Candidates are configured in a JSON file:
+
+    [
+        {
+            "name": "ppio",
+            "model": "deepseek/deepseek-v3.2-exp",
+            "base_url": "https://api.ppinfra.com/v3/openai",
+            "api_key_env": "PPIO_API_KEY"
+        }
+    ]
+
+Optional per-candidate keys: extra_body, provider_order, filter_unsupported_roles.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+import megfile
+from loguru import logger
+
+from tool_calls_eval import (
+    ResultRecord,
+    SummaryAccumulator,
+    ToolCallsValidator,
+    compute_hash,
+    json_dumps_line,
+    json_loads,
+)
+
+# Hop-by-hop and framing headers are not forwarded in either direction
+SKIP_REQUEST_HEADERS = {
+    "host",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "keep-alive",
+    "accept-encoding",
+}
+SKIP_RESPONSE_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "keep-alive"}
+
+
+class UnsupportedBody(Exception):
+    """A request body framing the proxy does not decode."""
+
+
+async def read_body(reader: asyncio.StreamReader, headers: dict) -> bytes:
+    """Read a request body framed by content-length or chunked transfer-encoding."""
+    encoding = headers.get("transfer-encoding", "").lower()
+    if not encoding:
+        return await reader.readexactly(int(headers.get("content-length", 0)))
+    if encoding != "chunked":
+        raise UnsupportedBody(f"transfer-encoding {encoding} is not supported")
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    # Trailers are dropped
+    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+        pass
+    return b"".join(chunks)
+
+
+def assemble_stream(content: bytes) -> dict:
+    """Assemble the SSE chunks of a streamed chat.completions response into one response."""
+    response = {"id": None, "object": "chat.completion", "created": None, "model": None, "usage": None}
+    full_content = []
+    tool_calls: dict[int, dict] = {}
+    finish_reason = None
+    for line in content.splitlines():
+        if not line.startswith(b"data:"):
+            continue
+        data = line[len(b"data:") :].strip()
+        if data == b"[DONE]":
+            break
+        event = json_loads(data)
+        for key in ("id", "created", "model", "usage"):
+            if event.get(key):
+                response[key] = event[key]
+        for choice in event.get("choices") or []:
+            delta = choice.get("delta") or {}
+            if delta.get("content"):
+                full_content.append(delta["content"])
+            for tc in delta.get("tool_calls") or []:
+                call = tool_calls.setdefault(
+                    tc.get("index") or 0,
+                    {"id": tc.get("id"), "type": tc.get("type"), "function": {"name": "", "arguments": ""}},
+                )
+                function = tc.get("function") or {}
+                if function.get("name"):
+                    call["function"]["name"] = function["name"]
+                if function.get("arguments"):
+                    call["function"]["arguments"] += function["arguments"]
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+    response["choices"] = [
+        {
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": "".join(full_content),
+                "tool_calls": list(tool_calls.values()) if tool_calls else None,
+            },
+            "finish_reason": finish_reason or "stop",
+        }
+    ]
+    return response
+
+
+class Candidate:
+    """A vendor receiving mirrored requests through its own queue and workers."""
+
+    def __init__(self, config: dict, concurrency: int, queue_size: int, timeout: int, retries: int):
+        self.name = config["name"]
+        api_key = config.get("api_key")
+        if config.get("api_key_env"):
+            api_key = os.environ.get(config["api_key_env"], api_key)
+        self.validator = ToolCallsValidator(
+            model=config["model"],
+            base_url=config["base_url"],
+            api_key=api_key,
+            concurrency=concurrency,
+            output_file=os.devnull,
+            summary_file=os.devnull,
+            timeout=timeout,
+            max_retries=retries,
+            extra_body=config.get("extra_body"),
+            filter_unsupported_roles=config.get("filter_unsupported_roles", False),
+            vendor=self.name,
+            provider_order=config.get("provider_order"),
+        )
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue[tuple[int, bytes]] = asyncio.Queue(maxsize=queue_size)
+        self.summary_acc = SummaryAccumulator(self.validator.alias_model)
+        self.mirrored = 0
+        self.dropped = 0
+        # Open for the proxy's lifetime when --results-dir is set
+        self.results = None
+
+    def open_results(self, path: str):
+        self.results = megfile.smart_open(path, "ab")
+
+    def flush(self):
+        if self.results:
+            self.results.flush()
+
+    def close(self):
+        if self.results:
+            self.results.close()
+
+    def offer(self, sequence: int, body: bytes):
+        """Enqueue a mirrored request, dropping it if the candidate is behind."""
+        try:
+            self.queue.put_nowait((sequence, body))
+            self.mirrored += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def worker(self):
+        while True:
+            sequence, body = await self.queue.get()
+            try:
+                prepared = self.validator.prepare_request(json_loads(body))
+                result = await self.validator.process_request(
+                    {"prepared": prepared, "hash": compute_hash(prepared)}, sequence
+                )
+                self.summary_acc.add(ResultRecord.from_result(result))
+                if self.results:
+                    self.results.write(json_dumps_line(result))
+            except Exception as e:
+                logger.error(f"[{self.name}] mirrored request {sequence} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def summary(self) -> dict:
+        summary = self.summary_acc.build()
+        summary.update(
+            mirrored=self.mirrored,
+            dropped=self.dropped,
+            queued=self.queue.qsize(),
+        )
+        return summary
+
+
+class ShadowProxy:
+    """Forwards to the primary vendor and mirrors a sample of requests to candidates."""
+
+    def __init__(
+        self,
+        primary_base_url: str,
+        primary_api_key: Optional[str],
+        candidates: list[Candidate],
+        mirror_fraction: float,
+        timeout: int,
+        scorer: ToolCallsValidator,
+        queue_size: int = 100,
+    ):
+        self.primary_base_url = primary_base_url.rstrip("/")
+        self.primary_api_key = primary_api_key
+        self.candidates = candidates
+        self.mirror_fraction = mirror_fraction
+        # The primary gets its own pool, never shared with the candidates
+        self.client = httpx.AsyncClient(timeout=timeout)
+        self.scorer = scorer
+        self.primary_acc = SummaryAccumulator("primary")
+        # Parsing and schema validation of primary responses stay off the event loop
+        self.score_queue: asyncio.Queue[tuple[int, bytes, bytes, bool]] = asyncio.Queue(
+            maxsize=queue_size
+        )
+        self.score_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="score-primary")
+        self.primary_dropped = 0
+        self.sequence = 0
+
+    def upstream_url(self, path: str) -> str:
+        """Map /v1/chat/completions on the proxy to {primary}/chat/completions."""
+        if path.startswith("/v1/") or path == "/v1":
+            path = path[len("/v1") :]
+        return self.primary_base_url + path
+
+    def summary(self) -> dict:
+        primary = self.primary_acc.build()
+        primary.update(dropped=self.primary_dropped, queued=self.score_queue.qsize())
+        return {
+            "primary": primary,
+            "candidates": {c.name: c.summary() for c in self.candidates},
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one keep-alive connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    body = await read_body(reader, headers)
+                except UnsupportedBody as e:
+                    await self.respond(
+                        writer, 501, {"content-type": "text/plain", "connection": "close"}, f"{e}\n".encode()
+                    )
+                    break
+
+                if method == "GET" and target == "/shadow/summary":
+                    data = json.dumps(self.summary(), ensure_ascii=False, indent=4).encode("utf-8")
+                    await self.respond(writer, 200, {"content-type": "application/json"}, data)
+                else:
+                    await self.forward(writer, method, target, headers, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, headers: dict, body: bytes):
+        head = f"HTTP/1.1 {status} {httpx.codes.get_reason_phrase(status)}\r\n"
+        for name, value in headers.items():
+            head += f"{name}: {value}\r\n"
+        head += f"content-length: {len(body)}\r\n\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def forward(
+        self, writer: asyncio.StreamWriter, method: str, target: str, headers: dict, body: bytes
+    ):
+        mirrored = (
+            method == "POST"
+            and target.split("?")[0].endswith("/chat/completions")
+            and self.candidates
+            and random.random() < self.mirror_fraction
+        )
+        if mirrored:
+            # Only an O(1) enqueue per candidate happens before forwarding
+            self.sequence += 1
+            sequence = self.sequence
+            for candidate in self.candidates:
+                candidate.offer(sequence, body)
+
+        upstream_headers = {k: v for k, v in headers.items() if k not in SKIP_REQUEST_HEADERS}
+        if self.primary_api_key:
+            upstream_headers["authorization"] = f"Bearer {self.primary_api_key}"
+        request = self.client.build_request(
+            method, self.upstream_url(target), headers=upstream_headers, content=body
+        )
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            logger.error(f"Primary request failed: {e}")
+            await self.respond(writer, 502, {"content-type": "text/plain"}, f"{e}\n".encode())
+            return
+
+        try:
+            response_headers = {
+                k: v for k, v in response.headers.items() if k.lower() not in SKIP_RESPONSE_HEADERS
+            }
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                # Relay the stream chunk by chunk so time to first token is unchanged
+                head = f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n"
+                for name, value in response_headers.items():
+                    head += f"{name}: {value}\r\n"
+                writer.write((head + "transfer-encoding: chunked\r\n\r\n").encode("latin-1"))
+                chunks = []
+                async for chunk in response.aiter_bytes():
+                    writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                    await writer.drain()
+                    if mirrored:
+                        chunks.append(chunk)
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                content = b"".join(chunks)
+                stream = True
+            else:
+                content = await response.aread()
+                await self.respond(writer, response.status_code, response_headers, content)
+                stream = False
+        finally:
+            await response.aclose()
+
+        if mirrored and response.status_code == 200:
+            # Scored after the answer has been written, off the primary's latency
+            self.score_primary(sequence, body, content, stream)
+
+    def score_primary(self, sequence: int, body: bytes, content: bytes, stream: bool):
+        """Enqueue a primary response for scoring, dropping it if the scorer is behind."""
+        try:
+            self.score_queue.put_nowait((sequence, body, content, stream))
+        except asyncio.QueueFull:
+            self.primary_dropped += 1
+
+    def _score(self, sequence: int, body: bytes, content: bytes, stream: bool) -> dict:
+        request = json_loads(body)
+        return self.scorer.score_response(
+            {"prepared": request, "hash": compute_hash(request)},
+            sequence,
+            0,
+            "success",
+            assemble_stream(content) if stream else json_loads(content),
+            None,
+        )
+
+    async def score_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            sequence, body, content, stream = await self.score_queue.get()
+            try:
+                result = await loop.run_in_executor(
+                    self.score_executor, self._score, sequence, body, content, stream
+                )
+                self.primary_acc.add(ResultRecord.from_result(result))
+            except Exception as e:
+                logger.warning(f"Could not score primary response: {e}")
+            finally:
+                self.score_queue.task_done()
+
+
+async def run_proxy(args: argparse.Namespace):
+    with megfile.smart_open(args.candidates, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    candidates = [
+        Candidate(c, args.concurrency, args.queue_size, args.timeout, args.retries)
+        for c in configs
+    ]
+    if args.results_dir:
+        megfile.smart_makedirs(args.results_dir, exist_ok=True)
+        for candidate in candidates:
+            candidate.open_results(
+                megfile.smart_path_join(args.results_dir, f"results-shadow-{candidate.name}.jsonl")
+            )
+
+    scorer = ToolCallsValidator(
+        model="", base_url=args.base_url, api_key="unused", output_file=os.devnull, summary_file=os.devnull
+    )
+    proxy = ShadowProxy(
+        args.base_url,
+        args.api_key,
+        candidates,
+        args.mirror_fraction,
+        args.timeout,
+        scorer,
+        args.queue_size,
+    )
+    workers = [
+        asyncio.create_task(candidate.worker())
+        for candidate in candidates
+        for _ in range(candidate.concurrency)
+    ]
+    workers.append(asyncio.create_task(proxy.score_worker()))
+
+    def write_summary():
+        with megfile.smart_open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(proxy.summary(), f, ensure_ascii=False, indent=4)
+        for candidate in candidates:
+            candidate.flush()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = await asyncio.start_server(proxy.handle, args.host, args.port)
+    logger.info(
+        f"Shadow proxy on http://{args.host}:{args.port}/v1 -> {args.base_url}, mirroring "
+        f"{args.mirror_fraction:.0%} to {', '.join(c.name for c in candidates) or 'no candidates'}"
+    )
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=args.summary_interval)
+            except asyncio.TimeoutError:
+                pass
+            write_summary()
+    finally:
+        server.close()
+        for task in workers:
+            task.cancel()
+        await proxy.client.aclose()
+        proxy.score_executor.shutdown()
+        write_summary()
+        for candidate in candidates:
+            candidate.close()
+        logger.info(f"Summary saved to {args.summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="OpenAI-compatible proxy that mirrors live traffic to candidate vendors and scores their tool calls"
+    )
+    parser.add_argument("--base-url", required=True, help="Primary vendor API endpoint, e.g., https://api.moonshot.cn/v1")
+    parser.add_argument(
+        "--api-key",
+        help="Primary vendor API key (default: forward the client's Authorization header)",
+    )
+    parser.add_argument("--candidates", required=True, help="JSON file listing the candidate vendors")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Listen port (default: 8000)")
+    parser.add_argument(
+        "--mirror-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of chat.completions requests mirrored to the candidates (default: 0.1)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=100,
+        help="Mirrored requests buffered per candidate, and primary responses awaiting scoring; more are dropped (default: 100)",
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent mirrored requests per candidate (default: 4)")
+    parser.add_argument("--timeout", type=int, default=600, help="Request timeout in seconds (default: 600)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per mirrored request (default: 3)")
+    parser.add_argument("--summary", default="shadow-summary.json", help="Summary JSON file (default: shadow-summary.json)")
+    parser.add_argument(
+        "--summary-interval",
+        type=float,
+        default=60,
+        help="Seconds between summary file updates (default: 60)",
+    )
+    parser.add_argument("--results-dir", help="Also append each candidate's scored results to results-shadow-{name}.jsonl here")
+    args = parser.parse_args()
+    asyncio.run(run_proxy(args))
+
+
+if __name__ == "__main__":
+    main()
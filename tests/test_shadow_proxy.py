@@ -0,0 +1,252 @@
+"""Shadow proxy against in-process stand-ins for the primary and a candidate vendor."""
+
+import asyncio
+import json
+import os
+
+import httpx
+import openai
+
+from shadow_proxy import Candidate, ShadowProxy
+from tool_calls_eval import ToolCallsValidator
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "parameters": {
+                "type": "object",
+                "properties": {"city": {"type": "string"}},
+                "required": ["city"],
+            },
+        },
+    }
+]
+
+
+def completion(arguments: str) -> bytes:
+    return json.dumps(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 1,
+            "model": "m",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "",
+                        "tool_calls": [
+                            {
+                                "id": "call_1",
+                                "type": "function",
+                                "function": {"name": "get_weather", "arguments": arguments},
+                            }
+                        ],
+                    },
+                    "finish_reason": "tool_calls",
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+    ).encode()
+
+
+PRIMARY_BODY = completion('{"city": "Beijing"}')
+# The candidate answers with arguments that fail the schema
+CANDIDATE_BODY = completion('{"city": 1}')
+
+
+def sse_event(delta: dict, finish_reason=None) -> bytes:
+    event = {
+        "id": "chatcmpl-2",
+        "created": 1,
+        "model": "m",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return b"data: " + json.dumps(event).encode() + b"\n\n"
+
+
+PRIMARY_STREAM = b"".join(
+    [
+        sse_event(
+            {
+                "role": "assistant",
+                "tool_calls": [
+                    {
+                        "index": 0,
+                        "id": "call_1",
+                        "type": "function",
+                        "function": {"name": "get_weather", "arguments": '{"city": '},
+                    }
+                ],
+            }
+        ),
+        sse_event({"tool_calls": [{"index": 0, "function": {"arguments": '"Beijing"}'}}]}),
+        sse_event({}, "tool_calls"),
+        b"data: [DONE]\n\n",
+    ]
+)
+
+
+def request_body(stream: bool = False) -> bytes:
+    body = {
+        "model": "m",
+        "messages": [{"role": "user", "content": "Weather in Beijing?"}],
+        "tools": TOOLS,
+    }
+    if stream:
+        body["stream"] = True
+    return json.dumps(body).encode()
+
+
+class Stand:
+    """A proxy wired to mock transports, serving on an ephemeral local port."""
+
+    async def start(self, results_file: str):
+        self.primary_requests = []
+
+        def primary(request: httpx.Request) -> httpx.Response:
+            self.primary_requests.append(request.content)
+            if json.loads(request.content).get("stream"):
+                return httpx.Response(
+                    200, content=PRIMARY_STREAM, headers={"content-type": "text/event-stream"}
+                )
+            return httpx.Response(
+                200, content=PRIMARY_BODY, headers={"content-type": "application/json"}
+            )
+
+        def candidate(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200, content=CANDIDATE_BODY, headers={"content-type": "application/json"}
+            )
+
+        self.candidate = Candidate(
+            {"name": "cand", "model": "m", "base_url": "http://candidate.invalid/v1", "api_key": "x"},
+            concurrency=1,
+            queue_size=10,
+            timeout=10,
+            retries=0,
+        )
+        self.candidate.validator._client = openai.AsyncOpenAI(
+            api_key="x",
+            base_url="http://candidate.invalid/v1",
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(candidate)),
+        )
+        self.candidate.open_results(results_file)
+        scorer = ToolCallsValidator(
+            model="",
+            base_url="http://primary.invalid/v1",
+            api_key="unused",
+            output_file=os.devnull,
+            summary_file=os.devnull,
+        )
+        self.proxy = ShadowProxy(
+            "http://primary.invalid/v1", "key", [self.candidate], 1.0, 10, scorer
+        )
+        self.proxy.client = httpx.AsyncClient(transport=httpx.MockTransport(primary))
+        self.workers = [
+            asyncio.create_task(self.candidate.worker()),
+            asyncio.create_task(self.proxy.score_worker()),
+        ]
+        self.server = await asyncio.start_server(self.proxy.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def exchange(self, head: str, body: bytes) -> tuple[bytes, bytes]:
+        """Send one raw request and return the response head and body."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return head, body
+
+    async def post(self, body: bytes) -> tuple[bytes, bytes]:
+        return await self.exchange(
+            "POST /v1/chat/completions HTTP/1.1\r\nhost: proxy\r\n"
+            f"content-length: {len(body)}\r\nconnection: close\r\n\r\n",
+            body,
+        )
+
+    async def stop(self) -> dict:
+        await self.candidate.queue.join()
+        await self.proxy.score_queue.join()
+        self.server.close()
+        for task in self.workers:
+            task.cancel()
+        await self.proxy.client.aclose()
+        self.proxy.score_executor.shutdown()
+        self.candidate.close()
+        return self.proxy.summary()
+
+
+def dechunk(body: bytes) -> bytes:
+    chunks = []
+    while True:
+        size, _, body = body.partition(b"\r\n")
+        size = int(size, 16)
+        if size == 0:
+            return b"".join(chunks)
+        chunks.append(body[:size])
+        body = body[size + 2 :]
+
+
+def test_passthrough_and_candidate_results(tmp_path):
+    results_file = str(tmp_path / "results-shadow-cand.jsonl")
+
+    async def scenario():
+        stand = Stand()
+        await stand.start(results_file)
+        head, body = await stand.post(request_body())
+        assert head.startswith(b"HTTP/1.1 200")
+        assert body == PRIMARY_BODY
+        head, body = await stand.post(request_body(stream=True))
+        assert b"text/event-stream" in head
+        assert dechunk(body) == PRIMARY_STREAM
+        return await stand.stop()
+
+    summary = asyncio.run(scenario())
+
+    with open(results_file, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    assert [r["data_index"] for r in results] == [1, 2]
+    assert all(r["status"] == "success" for r in results)
+    assert all(r["tool_calls_valid"] is False for r in results)
+    assert summary["candidates"]["cand"]["schema_validation_error_count"] == 2
+    # Both primary answers are scored, the streamed one reassembled from its chunks
+    assert summary["primary"]["successful_tool_call_count"] == 2
+    assert summary["primary"]["schema_validation_error_count"] == 0
+    assert summary["primary"]["dropped"] == 0
+
+
+def test_chunked_request_body(tmp_path):
+    payload = request_body()
+
+    async def scenario():
+        stand = Stand()
+        await stand.start(str(tmp_path / "results.jsonl"))
+        chunked = b"".join(
+            f"{len(part):x}\r\n".encode() + part + b"\r\n"
+            for part in (payload[:20], payload[20:])
+        ) + b"0\r\n\r\n"
+        head, body = await stand.exchange(
+            "POST /v1/chat/completions HTTP/1.1\r\nhost: proxy\r\n"
+            "transfer-encoding: chunked\r\nconnection: close\r\n\r\n",
+            chunked,
+        )
+        assert body == PRIMARY_BODY
+        assert stand.primary_requests == [payload]
+        head, _ = await stand.exchange(
+            "POST /v1/chat/completions HTTP/1.1\r\nhost: proxy\r\n"
+            "transfer-encoding: gzip\r\n\r\n",
+            b"",
+        )
+        assert head.startswith(b"HTTP/1.1 501")
+        return await stand.stop()
+
+    summary = asyncio.run(scenario())
+    assert summary["candidates"]["cand"]["mirrored"] == 1
@@ -0,0 +1,342 @@
+"""ToolCallsValidator against in-process stand-ins for a vendor."""
+
+import asyncio
+import json
+import os
+
+import httpx
+import openai
+
+from tool_calls_eval import RetryBudget, ToolCallsValidator, compute_hash, find_steady_state
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "parameters": {
+                "type": "object",
+                "properties": {"city": {"type": "string"}},
+                "required": ["city"],
+            },
+        },
+    }
+]
+
+REQUEST = {
+    "messages": [{"role": "user", "content": "Weather in Beijing?"}],
+    "tools": TOOLS,
+}
+
+USAGE = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+
+def validator(handler, **kwargs) -> ToolCallsValidator:
+    """A validator whose client talks to `handler` through a mock transport."""
+    v = ToolCallsValidator(
+        model="m",
+        base_url="http://vendor.invalid/v1",
+        api_key="x",
+        output_file=os.devnull,
+        summary_file=os.devnull,
+        **kwargs,
+    )
+    v._client = openai.AsyncOpenAI(
+        api_key="x",
+        base_url=v.base_url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    return v
+
+
+def sse_event(delta: dict, finish_reason=None, usage=None) -> bytes:
+    event = {
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 1,
+        "model": "m",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        event["usage"] = usage
+    return b"data: " + json.dumps(event).encode() + b"\n\n"
+
+
+def test_stream_usage_on_finish_chunk():
+    # The vendor attaches usage to the chunk that carries the last delta and finish_reason
+    body = b"".join(
+        [
+            sse_event(
+                {
+                    "role": "assistant",
+                    "tool_calls": [
+                        {
+                            "index": 0,
+                            "id": "call_1",
+                            "type": "function",
+                            "function": {"name": "get_weather", "arguments": '{"city": '},
+                        }
+                    ],
+                }
+            ),
+            sse_event(
+                {"tool_calls": [{"index": 0, "function": {"arguments": '"Beijing"}'}}]},
+                finish_reason="tool_calls",
+                usage=USAGE,
+            ),
+            b"data: [DONE]\n\n",
+        ]
+    )
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    v = validator(handler, stream=True)
+    prepared = v.prepare_request(REQUEST)
+    result = asyncio.run(v.process_request({"prepared": prepared, "hash": compute_hash(prepared)}, 0))
+
+    assert sent[0]["stream"] is True
+    assert sent[0]["stream_options"] == {"include_usage": True}
+    assert result["finish_reason"] == "tool_calls"
+    assert result["tool_calls_valid"] is True
+    message = result["response"]["choices"][0]["message"]
+    assert message["tool_calls"][0]["function"]["arguments"] == '{"city": "Beijing"}'
+    assert result["response"]["usage"]["completion_tokens"] == 5
+    assert result["ttft_ms"] is not None
+
+
+def test_stream_does_not_change_hashes():
+    plain = validator(lambda request: None).prepare_request(REQUEST)
+    streamed = validator(lambda request: None, stream=True).prepare_request(REQUEST)
+    assert compute_hash(plain) == compute_hash(streamed)
+
+
+def test_run_spreads_trials_of_a_sample():
+    v = validator(lambda request: None, concurrency=2, repeats=3)
+    requests = [{"messages": [{"role": "user", "content": str(i)}]} for i in range(10)]
+
+    async def jobs():
+        return [(data_index, trial) async for _, data_index, trial in v._iter_jobs(requests)]
+
+    order = asyncio.run(jobs())
+    assert sorted(order) == [(d, t) for d in range(1, 11) for t in range(3)]
+    last_seen = {}
+    for position, (data_index, _) in enumerate(order):
+        if data_index in last_seen:
+            # stream_jobs keeps at most 2 x concurrency jobs in flight
+            assert position - last_seen[data_index] > 2 * v.concurrency
+        last_seen[data_index] = position
+
+
+class BatchServer:
+    """Stand-in for the /v1/files and /v1/batches API, completing on the second poll."""
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.polls = 0
+        self.input_lines: list[dict] = []
+
+    def batch(self, status: str) -> dict:
+        batch = {
+            "id": "batch_1",
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": "file_in",
+            "completion_window": "24h",
+            "status": status,
+            "created_at": 1,
+            "request_counts": {"total": len(self.input_lines), "completed": 0, "failed": 0},
+        }
+        if status == "completed":
+            batch.update(output_file_id="file_out", error_file_id="file_err")
+        return batch
+
+    def complete(self):
+        output, errors = [], []
+        for line in self.input_lines:
+            # The request of sample 3 is throttled, the others answer with a tool call
+            if line["custom_id"].startswith("3-"):
+                errors.append(
+                    {
+                        "custom_id": line["custom_id"],
+                        "response": {"status_code": 429, "body": {"error": {"message": "slow down"}}},
+                        "error": None,
+                    }
+                )
+                continue
+            body = {
+                "id": "chatcmpl-" + line["custom_id"],
+                "object": "chat.completion",
+                "created": 1,
+                "model": "m",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": "",
+                            "tool_calls": [
+                                {
+                                    "id": "call_1",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "get_weather",
+                                        "arguments": '{"city": "Beijing"}',
+                                    },
+                                }
+                            ],
+                        },
+                        "finish_reason": "tool_calls",
+                    }
+                ],
+                "usage": USAGE,
+            }
+            output.append({"custom_id": line["custom_id"], "response": {"status_code": 200, "body": body}})
+        self.files["file_out"] = "".join(json.dumps(o) + "\n" for o in output).encode()
+        self.files["file_err"] = "".join(json.dumps(e) + "\n" for e in errors).encode()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "POST" and path == "/v1/files":
+            content = request.content
+            start = content.index(b'{"custom_id"')
+            end = content.rindex(b"}\n") + 2
+            self.input_lines = [json.loads(line) for line in content[start:end].splitlines()]
+            file = {
+                "id": "file_in",
+                "object": "file",
+                "bytes": end - start,
+                "created_at": 1,
+                "filename": "batch-input.jsonl",
+                "purpose": "batch",
+                "status": "processed",
+            }
+            return httpx.Response(200, json=file)
+        if request.method == "POST" and path == "/v1/batches":
+            return httpx.Response(200, json=self.batch("validating"))
+        if request.method == "GET" and path == "/v1/batches/batch_1":
+            self.polls += 1
+            if self.polls < 2:
+                return httpx.Response(200, json=self.batch("in_progress"))
+            self.complete()
+            return httpx.Response(200, json=self.batch("completed"))
+        if request.method == "GET" and path.startswith("/v1/files/") and path.endswith("/content"):
+            return httpx.Response(200, content=self.files[path.split("/")[3]])
+        return httpx.Response(404, json={"error": {"message": f"no route {request.method} {path}"}})
+
+
+def test_batch_mode(tmp_path):
+    dataset = tmp_path / "samples.jsonl"
+    lines = [
+        {"messages": [{"role": "user", "content": "Weather in Beijing?"}], "tools": TOOLS},
+        {"messages": [{"role": "user", "content": "Weather in Beijing?"}], "tools": TOOLS},
+        {"messages": [{"role": "user", "content": "Weather in Shanghai?"}], "tools": TOOLS},
+    ]
+    dataset.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+    server = BatchServer()
+    v = validator(server, batch=True, batch_poll_interval=0, repeats=2)
+    v.output_file = str(tmp_path / "results.jsonl")
+    v.summary_file = str(tmp_path / "summary.json")
+
+    asyncio.run(v.validate_file(str(dataset)))
+
+    # Duplicate lines are separate batch lines, one per (data_index, trial)
+    custom_ids = sorted(line["custom_id"] for line in server.input_lines)
+    assert custom_ids == ["1-0", "1-1", "2-0", "2-1", "3-0", "3-1"]
+    assert server.polls == 2
+    with open(v.output_file, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    jobs = [(r["data_index"], r["trial"]) for r in results]
+    assert jobs == [(d, t) for d in (1, 2, 3) for t in (0, 1)]
+    for r in results:
+        if r["data_index"] == 3:
+            assert r["status"] == "failed"
+            assert r["error_class"] == "rate_limit"
+        else:
+            assert r["status"] == "success"
+            assert r["finish_reason"] == "tool_calls"
+            assert r["tool_calls_valid"] is True
+    with open(v.summary_file, encoding="utf-8") as f:
+        summary = json.load(f)
+    assert summary["success_count"] == 4
+    assert summary["failure_count"] == 2
+    assert summary["successful_tool_call_count"] == 4
+    # Upload, create and polls are API calls, not retries
+    assert v.metrics.retries == 0
+
+
+def test_retries_are_counted_where_they_happen(monkeypatch):
+    monkeypatch.setattr("tool_calls_eval.retry_delay", lambda *args: 0)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, json={"error": {"message": "overloaded"}})
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 1,
+                "model": "m",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "hi"}, "finish_reason": "stop"}
+                ],
+                "usage": USAGE,
+            },
+        )
+
+    v = validator(handler)
+    status, _, attempts, _ = asyncio.run(v.send_request(v.prepare_request(REQUEST)))
+    assert (status, attempts) == ("success", 2)
+    assert v.metrics.retries == 1
+
+
+def test_raw_response_is_archived_verbatim():
+    # Key order, whitespace and number formatting a re-serialization would not keep
+    body = (
+        '{"usage": {"total_tokens": 15, "prompt_tokens": 10, "completion_tokens": 5},\n'
+        ' "id": "chatcmpl-1", "object": "chat.completion", "created": 1.0, "model": "m",\n'
+        ' "choices": [{"index": 0, "finish_reason": "stop",'
+        ' "message": {"role": "assistant", "content": "\\u4f60\\u597d"}}], "x_vendor": 1e3}'
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body.encode(), headers={"content-type": "application/json"})
+
+    v = validator(handler, raw_response=True)
+    prepared = v.prepare_request(REQUEST)
+    result = asyncio.run(v.process_request({"prepared": prepared, "hash": compute_hash(prepared)}, 0))
+    assert result["status"] == "success"
+    assert result["finish_reason"] == "stop"
+    assert result["raw_response"] == body
+
+
+def test_steady_state_is_where_throughput_settles():
+    # 5 requests/s for the first 10 s while the vendor warms up, then 20 requests/s
+    finished_at = [i / 5 for i in range(50)] + [10 + i / 20 for i in range(600)]
+    at, rps = find_steady_state(0.0, finished_at)
+    assert 9 <= at <= 11
+    assert 18 <= rps <= 22
+    # Too few completions to tell
+    assert find_steady_state(0.0, finished_at[:20]) is None
+
+
+def test_retry_budget_balance_is_capped():
+    budget = RetryBudget(ratio=0.2, min_retries=10)
+    # A long quiet stretch earns no more than 500 requests' worth
+    for _ in range(100_000):
+        budget.record_request()
+    spent = 0
+    while budget.try_spend():
+        spent += 1
+    assert spent == 110
+    assert budget.exhausted == 1
+    # Afterwards retries come back at the configured ratio
+    for _ in range(50):
+        budget.record_request()
+    assert sum(budget.try_spend() for _ in range(20)) == 10
@@ -1,26 +1,1376 @@
+from __future__ import annotations
+
 import argparse
-import asyncio
+import contextvars
+import gzip
 import hashlib
+import importlib
 import json
+import math
 import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
 import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
-from collections import defaultdict
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
+from collections import defaultdict, deque
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    Keeps `--help`, argument errors and offline subcommands from paying for
+    imports they never use (openai alone takes hundreds of milliseconds).
+    The import happens under a lock because the dataset prefetch thread and
+    the event loop can both touch a module first.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
+
+
+asyncio = LazyModule("asyncio")
+httpx = LazyModule("httpx")
+jsonschema = LazyModule("jsonschema")
+megfile = LazyModule("megfile")
+openai = LazyModule("openai")
+
+
+class _LazyLogger:
+    """Forwards to loguru's logger, importing loguru on first use."""
+
+    def __getattr__(self, name):
+        from loguru import logger
+
+        return getattr(logger, name)
+
 
-import megfile
-from jsonschema import ValidationError, validate
-from loguru import logger
-from openai import AsyncOpenAI
-from tqdm.asyncio import tqdm_asyncio
+logger = _LazyLogger()
+
+
+# Optional fast JSON codecs: orjson, then msgspec, then the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_CODEC = "orjson"
+elif msgspec is not None:
+    JSON_CODEC = "msgspec"
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+else:
+    JSON_CODEC = "json"
+
+
+def json_loads(data: str | bytes):
+    """Parse JSON with the fastest available codec."""
+    if JSON_CODEC == "orjson":
+        return orjson.loads(data)
+    if JSON_CODEC == "msgspec":
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), str(data)[:100], 0) from e
+    return json.loads(data)
+
+
+def json_dumps_line(obj) -> bytes:
+    """Serialize to one UTF-8 JSON line (non-ASCII kept as-is) ending in a newline."""
+    try:
+        if JSON_CODEC == "orjson":
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        if JSON_CODEC == "msgspec":
+            return _msgspec_encoder.encode(obj) + b"\n"
+    except (TypeError, OverflowError):
+        pass  # e.g. non-string keys or huge ints, which only the stdlib accepts
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
 
 
 def compute_hash(obj: dict) -> str:
-    """Compute a stable hash of the request dict."""
+    """
+    Compute a stable hash of the request dict.
+
+    Always uses the stdlib encoder: its separators and float formatting define
+    the canonical form behind every stored hash, which faster codecs do not
+    reproduce byte for byte.
+    """
     s = json.dumps(obj, sort_keys=True, ensure_ascii=False)
     return hashlib.md5(s.encode("utf-8")).hexdigest()
 
 
+DATASET_CACHE_VERSION = 3
+
+
+# Object storage transfers: remote files are read with parallel readahead of
+# IO_READAHEAD_BLOCKS blocks and written as multipart uploads of IO_BLOCK_SIZE
+# parts, IO_MAX_WORKERS at a time
+IO_BLOCK_SIZE = 8 << 20
+IO_MAX_WORKERS = 8
+IO_READAHEAD_BLOCKS = 8
+
+
+def storage_options(path: str) -> dict:
+    """megfile open options for a path; local files need none."""
+    if megfile.SmartPath(path).protocol == "file":
+        return {}
+    return {
+        "block_size": IO_BLOCK_SIZE,
+        "max_workers": IO_MAX_WORKERS,
+        "block_forward": IO_READAHEAD_BLOCKS,
+        "max_buffer_size": IO_BLOCK_SIZE * (IO_READAHEAD_BLOCKS + 1),
+    }
+
+
+def file_fingerprint(file_path: str) -> dict:
+    """Cheap change detector for a file: its location, size and mtime, without reading it."""
+    stat = megfile.smart_stat(file_path)
+    if megfile.SmartPath(file_path).protocol == "file":
+        file_path = os.path.abspath(file_path)
+    return {"path": file_path, "size": stat.size, "mtime": stat.mtime}
+
+
+def parse_raw_response(body: bytes) -> dict:
+    """
+    Response dict straight from a chat.completions body, skipping the SDK models.
+
+    The caller keeps the body text itself for archival (raw_response);
+    everything scoring reads (choices, finish_reason, tool_calls, usage) is
+    looked up with the same defaults as the SDK path.
+    """
+    response = json_loads(body)
+    if not isinstance(response, dict):
+        raise ValueError(f"Response body is not a JSON object: {body[:200]!r}")
+    return response
+
+
+def extract_usage(response: Optional[dict]) -> tuple[int, int, int]:
+    """Return (prompt, completion, cached) token counts from a response dict."""
+    usage = (response or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    details = usage.get("prompt_tokens_details") or {}
+    # DeepSeek reports cache hits as prompt_cache_hit_tokens
+    cached_tokens = (
+        details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+    )
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+def load_price_table(path: str) -> dict:
+    """
+    Load a price table in USD per 1M tokens, keyed by vendor then model.
+
+    Example:
+        {"deepseek-official": {"deepseek-chat": {"prompt": 0.27, "cached_prompt": 0.07, "completion": 1.1}},
+         "*": {"*": {"prompt": 1.0, "completion": 2.0}}}
+    """
+    with megfile.smart_open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def lookup_price(
+    price_table: dict, vendor: Optional[str], model: str
+) -> Optional[dict]:
+    """Find the most specific price entry, falling back to '*' wildcards."""
+    for vendor_key in (vendor or "*", "*"):
+        models = price_table.get(vendor_key) or {}
+        for model_key in (model, "*"):
+            if model_key in models:
+                return models[model_key]
+    return None
+
+
+def compute_cost(
+    price: dict, prompt_tokens: int, completion_tokens: int, cached_tokens: int
+) -> float:
+    """Cost in USD for the given token counts."""
+    prompt_price = price.get("prompt", 0)
+    cached_price = price.get("cached_prompt", prompt_price)
+    completion_price = price.get("completion", 0)
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+def tool_call_signature(response: Optional[dict]) -> tuple:
+    """Tool names and canonicalized arguments of a response, for comparing trials."""
+    choices = (response or {}).get("choices") or []
+    message = (choices[0] if choices else {}).get("message") or {}
+    signature = []
+    for tc in message.get("tool_calls") or []:
+        function = tc.get("function") or {}
+        args = function.get("arguments")
+        try:
+            if isinstance(args, str):
+                args = json.loads(args)
+            args = json.dumps(args, sort_keys=True, ensure_ascii=False)
+        except (json.JSONDecodeError, TypeError):
+            pass
+        signature.append((function.get("name"), args))
+    return tuple(signature)
+
+
+def compute_consistency(trials_by_sample: dict[int, list["ResultRecord"]]) -> Optional[dict]:
+    """
+    Summarize how consistently each sample behaves across repeated trials.
+
+    Agreement rates are the share of trials matching the most common outcome,
+    averaged over samples with at least two trials.
+    """
+    finish_reason_mix: dict[str, int] = defaultdict(int)
+    finish_agreement = []
+    name_agreement = []
+    args_agreement = []
+    inconsistent = []
+
+    for trials in trials_by_sample.values():
+        if len(trials) < 2:
+            continue
+        reasons = [str(t.finish_reason) for t in trials]
+        reason_counts = {reason: reasons.count(reason) for reason in set(reasons)}
+        finish_reason_mix[
+            ",".join(f"{k}:{v}" for k, v in sorted(reason_counts.items()))
+        ] += 1
+        finish_agreement.append(max(reason_counts.values()) / len(trials))
+        if len(reason_counts) > 1:
+            inconsistent.append(min(t.data_index for t in trials))
+
+        tool_trials = [t for t in trials if t.finish_reason == "tool_calls"]
+        if len(tool_trials) >= 2:
+            names = [t.tool_names for t in tool_trials]
+            signatures = [t.tool_signature for t in tool_trials]
+            name_agreement.append(
+                max(names.count(n) for n in set(names)) / len(names)
+            )
+            args_agreement.append(
+                max(signatures.count(sig) for sig in set(signatures))
+                / len(signatures)
+            )
+
+    if not finish_agreement:
+        return None
+
+    def mean(values: list[float]) -> Optional[float]:
+        return round(sum(values) / len(values), 4) if values else None
+
+    return {
+        "samples": len(finish_agreement),
+        "finish_reason_agreement": mean(finish_agreement),
+        "tool_name_agreement": mean(name_agreement),
+        "arguments_agreement": mean(args_agreement),
+        "consistent_finish_reason_samples": len(finish_agreement) - len(inconsistent),
+        "finish_reason_mix": dict(sorted(finish_reason_mix.items())),
+        "inconsistent_data_indexes": sorted(inconsistent),
+    }
+
+
+def expected_call_key(request: dict) -> str:
+    """
+    Model-independent key of a sample: the hash of its messages and tools.
+
+    Matches sample_key in datasets/convert_dataset.py, which writes the
+    expected-calls sidecar.
+    """
+    return compute_hash(
+        {"messages": request.get("messages", []), "tools": request.get("tools", [])}
+    )
+
+
+def normalize_argument(value):
+    """
+    Comparable form of a tool-call argument value.
+
+    Numbers and numeric strings become floats, "true"/"false" become bools,
+    strings are stripped and null object members are dropped, so that
+    `{"n": "5", "x": null}` and `{"n": 5}` compare equal.
+    """
+    if isinstance(value, dict):
+        return {str(k): normalize_argument(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [normalize_argument(v) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lower() in ("true", "false"):
+            return text.lower() == "true"
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return number if math.isfinite(number) else text
+    return value
+
+
+def arguments_match(actual, expected, tolerance: float) -> bool:
+    """Compare normalized arguments, numbers within a relative and absolute tolerance."""
+    if isinstance(expected, dict):
+        return (
+            isinstance(actual, dict)
+            and actual.keys() == expected.keys()
+            and all(arguments_match(actual[k], v, tolerance) for k, v in expected.items())
+        )
+    if isinstance(expected, list):
+        return (
+            isinstance(actual, list)
+            and len(actual) == len(expected)
+            and all(arguments_match(a, e, tolerance) for a, e in zip(actual, expected))
+        )
+    if isinstance(expected, float) and isinstance(actual, float):
+        return math.isclose(actual, expected, rel_tol=tolerance, abs_tol=tolerance)
+    return type(actual) is type(expected) and actual == expected
+
+
+def load_expected_calls(path: str) -> dict[str, dict]:
+    """Expected calls by sample key, with normalized arguments, from a convert_dataset.py sidecar."""
+    expected = {}
+    with megfile.smart_open(path, "rb", **storage_options(path)) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json_loads(line)
+            call = record["expected_call"]
+            expected[record["key"]] = {
+                "name": call["name"],
+                "arguments": normalize_argument(call.get("arguments") or {}),
+            }
+    return expected
+
+
+def score_expected_call(
+    response: Optional[dict], expected: dict, tolerance: float
+) -> tuple[bool, bool]:
+    """Whether the first tool call has the expected name, and also the expected arguments."""
+    choices = (response or {}).get("choices") or []
+    message = (choices[0] if choices else {}).get("message") or {}
+    tool_calls = message.get("tool_calls") or []
+    if not tool_calls:
+        return False, False
+    function = tool_calls[0].get("function") or {}
+    if function.get("name") != expected["name"]:
+        return False, False
+    args = function.get("arguments")
+    try:
+        if isinstance(args, str):
+            args = json.loads(args) if args.strip() else {}
+    except json.JSONDecodeError:
+        return True, False
+    return True, arguments_match(normalize_argument(args), expected["arguments"], tolerance)
+
+
+@dataclass(slots=True)
+class StagedRequest:
+    """Where a prepared request sits in the staging file, and what scheduling needs of it."""
+
+    data_index: int
+    hash: str
+    offset: int
+    length: int
+    tokens: float = 0.0
+
+
+@dataclass(slots=True)
+class ResultRecord:
+    """Scoring fields of a result; the full payload lives in the spool file."""
+
+    data_index: int
+    hash: str
+    trial: int
+    status: str
+    finish_reason: Optional[str]
+    tool_calls_valid: Optional[bool]
+    duration_ms: int
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    tool_names: tuple = ()
+    tool_signature: Optional[str] = None
+    round: int = 0
+    attempts: int = 1
+    error_class: Optional[str] = None
+    warm: Optional[bool] = None
+    tool_name_correct: Optional[bool] = None
+    tool_call_correct: Optional[bool] = None
+    ttft_ms: Optional[int] = None
+    offset: int = -1
+    length: int = 0
+
+    @classmethod
+    def from_result(cls, result: dict) -> "ResultRecord":
+        response = result.get("response")
+        prompt_tokens, completion_tokens, cached_tokens = extract_usage(response)
+        signature = tool_call_signature(response)
+        return cls(
+            data_index=result["data_index"],
+            hash=result["hash"],
+            trial=result.get("trial", 0),
+            status=result.get("status"),
+            finish_reason=result.get("finish_reason"),
+            tool_calls_valid=result.get("tool_calls_valid"),
+            duration_ms=result.get("duration_ms") or 0,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            tool_names=tuple(name for name, _ in signature),
+            tool_signature=compute_hash(signature) if signature else None,
+            round=result.get("round", 0),
+            attempts=result.get("attempts") or 1,
+            error_class=result.get("error_class"),
+            warm=result.get("warm"),
+            tool_name_correct=result.get("tool_name_correct"),
+            tool_call_correct=result.get("tool_call_correct"),
+            ttft_ms=result.get("ttft_ms"),
+        )
+
+
+class LatencySketch:
+    """Log-bucketed histogram giving quantiles within 1% relative error."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def describe(self) -> Optional[dict]:
+        """Mean and common percentiles, rounded to milliseconds."""
+        if self.count == 0:
+            return None
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count),
+            "p50": round(self.quantile(0.5)),
+            "p95": round(self.quantile(0.95)),
+            "p99": round(self.quantile(0.99)),
+        }
+
+
+class SummaryAccumulator:
+    """Summary counters updated online as each result arrives."""
+
+    def __init__(self, model: str, track_trials: bool = False):
+        self.summary = {
+            "model": model,
+            "success_count": 0,
+            "failure_count": 0,
+            "finish_stop": 0,
+            "finish_tool_calls": 0,
+            "finish_others": 0,
+            "finish_others_detail": {},
+            "schema_validation_error_count": 0,
+            "successful_tool_call_count": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "avg_completion_tokens_per_second": None,
+            "retries": 0,
+            "error_classes": {},
+        }
+        self.request_count = 0
+        self.expected_call_count = 0
+        self.tool_name_correct_count = 0
+        self.tool_call_correct_count = 0
+        self.tokens_per_second_sum = 0.0
+        self.tokens_per_second_count = 0
+        self.latency = LatencySketch()
+        self.cold_latency = LatencySketch()
+        self.warm_latency = LatencySketch()
+        self.ttft = LatencySketch()
+        self.track_trials = track_trials
+        # Keyed by data_index, so duplicate lines of a dataset stay separate samples
+        self.trials_by_sample: dict[int, list[ResultRecord]] = defaultdict(list)
+
+    def add(self, record: ResultRecord):
+        summary = self.summary
+        self.request_count += 1
+
+        if record.status == "success":
+            summary["success_count"] += 1
+            if record.duration_ms:
+                self.latency.add(record.duration_ms)
+                if record.warm is not None:
+                    sketch = self.warm_latency if record.warm else self.cold_latency
+                    sketch.add(record.duration_ms)
+            if record.ttft_ms is not None:
+                self.ttft.add(record.ttft_ms)
+        else:
+            summary["failure_count"] += 1
+            if record.error_class:
+                summary["error_classes"].setdefault(record.error_class, 0)
+                summary["error_classes"][record.error_class] += 1
+        summary["retries"] += record.attempts - 1
+        if record.tool_call_correct is not None:
+            self.expected_call_count += 1
+            self.tool_name_correct_count += record.tool_name_correct
+            self.tool_call_correct_count += record.tool_call_correct
+
+        finish_reason = record.finish_reason
+        if finish_reason == "stop":
+            summary["finish_stop"] += 1
+        elif finish_reason == "tool_calls":
+            summary["finish_tool_calls"] += 1
+            if record.tool_calls_valid:
+                summary["successful_tool_call_count"] += 1
+            else:
+                summary["schema_validation_error_count"] += 1
+        elif finish_reason:
+            summary["finish_others"] += 1
+            summary["finish_others_detail"].setdefault(finish_reason, 0)
+            summary["finish_others_detail"][finish_reason] += 1
+
+        summary["prompt_tokens"] += record.prompt_tokens
+        summary["completion_tokens"] += record.completion_tokens
+        summary["cached_tokens"] += record.cached_tokens
+        if (
+            record.status == "success"
+            and record.completion_tokens
+            and record.duration_ms
+        ):
+            self.tokens_per_second_sum += record.completion_tokens / (
+                record.duration_ms / 1000
+            )
+            self.tokens_per_second_count += 1
+
+        if self.track_trials:
+            self.trials_by_sample[record.data_index].append(record)
+
+    def build(
+        self,
+        price: Optional[dict] = None,
+        projected_requests: int = 0,
+        repeats: int = 1,
+    ) -> dict:
+        """Finalize the summary dict from the running counters."""
+        summary = dict(self.summary)
+        summary["finish_others_detail"] = dict(self.summary["finish_others_detail"])
+        summary["error_classes"] = dict(sorted(self.summary["error_classes"].items()))
+        if self.tokens_per_second_count:
+            summary["avg_completion_tokens_per_second"] = round(
+                self.tokens_per_second_sum / self.tokens_per_second_count, 2
+            )
+        summary["latency_ms"] = self.latency.describe()
+        if self.expected_call_count:
+            summary["expected_call_count"] = self.expected_call_count
+            summary["tool_name_correct_count"] = self.tool_name_correct_count
+            summary["tool_call_correct_count"] = self.tool_call_correct_count
+            summary["tool_name_accuracy"] = round(
+                self.tool_name_correct_count / self.expected_call_count, 4
+            )
+            summary["tool_call_accuracy"] = round(
+                self.tool_call_correct_count / self.expected_call_count, 4
+            )
+        if self.cold_latency.count or self.warm_latency.count:
+            summary["latency_cold_ms"] = self.cold_latency.describe()
+            summary["latency_warm_ms"] = self.warm_latency.describe()
+        if self.ttft.count:
+            summary["ttft_ms"] = self.ttft.describe()
+
+        if price is not None:
+            total_cost = compute_cost(
+                price,
+                summary["prompt_tokens"],
+                summary["completion_tokens"],
+                summary["cached_tokens"],
+            )
+            cost_per_request = (
+                total_cost / self.request_count if self.request_count else 0.0
+            )
+            successful = summary["successful_tool_call_count"]
+            summary["cost_total"] = round(total_cost, 6)
+            summary["cost_per_successful_tool_call"] = (
+                round(total_cost / successful, 8) if successful else None
+            )
+            summary["projected_requests"] = projected_requests
+            summary["projected_cost"] = round(cost_per_request * projected_requests, 2)
+
+        if repeats > 1:
+            summary["repeats"] = repeats
+            summary["consistency"] = compute_consistency(self.trials_by_sample)
+        return summary
+
+
+# Decoding is much slower than prefill, so expected output tokens weigh more
+DECODE_TOKEN_WEIGHT = 20
+EXPECTED_COMPLETION_TOKENS = 512
+
+
+def estimate_request_tokens(request: dict) -> float:
+    """Rough cost of a request in prefill-token units (4 chars per token)."""
+    prompt_chars = len(
+        json.dumps(request.get("messages", []), ensure_ascii=False)
+    ) + len(json.dumps(request.get("tools", []), ensure_ascii=False))
+    max_tokens = request.get("max_tokens") or EXPECTED_COMPLETION_TOKENS
+    return prompt_chars / 4 + DECODE_TOKEN_WEIGHT * min(
+        max_tokens, EXPECTED_COMPLETION_TOKENS
+    )
+
+
+def load_duration_history(file_paths: list[str]) -> dict[str, float]:
+    """Median duration_ms of successful results per request hash."""
+    durations: dict[str, list[int]] = defaultdict(list)
+    for file_path in file_paths:
+        with megfile.smart_open(file_path, "rb", **storage_options(file_path)) as f:
+            for line in f:
+                r = json_loads(line)
+                if r.get("status") == "success" and r.get("duration_ms"):
+                    durations[r["hash"]].append(r["duration_ms"])
+    return {h: sorted(d)[len(d) // 2] for h, d in durations.items()}
+
+
+def estimate_durations(
+    token_estimates: dict[str, float], history: dict[str, float]
+) -> dict[str, float]:
+    """
+    Expected duration_ms per request hash, from estimate_request_tokens per hash.
+
+    Known hashes use their historical median; the rest are estimated from
+    token counts, scaled by the ms-per-token ratio observed in the history.
+    """
+    ratios = sorted(
+        history[h] / tokens
+        for h, tokens in token_estimates.items()
+        if h in history and tokens > 0
+    )
+    ms_per_token = ratios[len(ratios) // 2] if ratios else 1.0
+    return {
+        h: history.get(h, tokens * ms_per_token)
+        for h, tokens in token_estimates.items()
+    }
+
+
+class ToolStub:
+    """
+    Local stand-in for tool execution in multi-turn mode.
+
+    Recorded observations map a tool name to the output to return; tools
+    without one get a fake result echoing the parsed call arguments.
+    """
+
+    def __init__(self, observations: Optional[dict] = None):
+        self.observations = observations or {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "ToolStub":
+        with megfile.smart_open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def respond(self, tool_call: dict) -> str:
+        function = tool_call.get("function") or {}
+        name = function.get("name")
+        if name in self.observations:
+            observation = self.observations[name]
+            if isinstance(observation, str):
+                return observation
+            return json.dumps(observation, ensure_ascii=False)
+        args = function.get("arguments")
+        try:
+            if isinstance(args, str):
+                args = json.loads(args)
+        except json.JSONDecodeError:
+            pass
+        return json.dumps(
+            {"status": "success", "tool": name, "arguments": args},
+            ensure_ascii=False,
+        )
+
+
+def next_turn_messages(
+    messages: list[dict], message: dict, tool_stub: ToolStub
+) -> list[dict]:
+    """Conversation extended with the assistant tool calls and stubbed tool outputs."""
+    tool_calls = [
+        {
+            "id": tc.get("id") or f"call_{i}",
+            "type": tc.get("type") or "function",
+            "function": {
+                "name": (tc.get("function") or {}).get("name"),
+                "arguments": (tc.get("function") or {}).get("arguments") or "",
+            },
+        }
+        for i, tc in enumerate(message.get("tool_calls") or [])
+    ]
+    extended = list(messages)
+    extended.append(
+        {
+            "role": "assistant",
+            "content": message.get("content") or "",
+            "tool_calls": tool_calls,
+        }
+    )
+    for tc in tool_calls:
+        extended.append(
+            {
+                "role": "tool",
+                "tool_call_id": tc["id"],
+                "content": tool_stub.respond(tc),
+            }
+        )
+    return extended
+
+
+# (base, cap) in seconds of the exponential backoff for each retryable error
+# class; "client" errors (bad request, auth, unsupported field) are never retried
+RETRY_BACKOFF = {
+    "rate_limit": (2.0, 60.0),
+    "server": (1.0, 30.0),
+    "timeout": (1.0, 30.0),
+    "connection": (0.5, 10.0),
+}
+
+
+def classify_status_code(status_code: int) -> str:
+    if status_code == 429:
+        return "rate_limit"
+    if status_code == 408:
+        return "timeout"
+    if status_code >= 500 or status_code == 409:
+        return "server"
+    return "client"
+
+
+def classify_error(error: BaseException) -> str:
+    """Error class of a failed attempt: rate_limit, server, timeout, connection or client."""
+    if isinstance(
+        error, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)
+    ):
+        return "timeout"
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(error, openai.APIStatusError):
+        return classify_status_code(error.status_code)
+    return "client"
+
+
+def retry_delay(error_class: str, retry_number: int, error: BaseException) -> float:
+    """Full-jitter exponential backoff; a Retry-After header raises the delay up to the cap."""
+    base, cap = RETRY_BACKOFF[error_class]
+    delay = random.uniform(0, min(cap, base * 2 ** (retry_number - 1)))
+    response = getattr(error, "response", None)
+    if error_class == "rate_limit" and response is not None:
+        try:
+            delay = max(delay, min(cap, float(response.headers.get("retry-after"))))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+# Unspent retry budget stops accruing beyond what this many requests earn
+RETRY_BUDGET_WINDOW = 500
+
+
+class RetryBudget:
+    """
+    Cap on retries: every request sent earns `ratio` of a retry, on top of
+    `min_retries`, so a failing vendor cannot multiply the load by max_retries.
+
+    The unspent balance is capped at what RETRY_BUDGET_WINDOW requests earn,
+    so long-lived validators (drift monitor, shadow proxy) cannot bank an
+    unbounded budget during quiet weeks and spend it all in one outage.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.capacity = min_retries + ratio * RETRY_BUDGET_WINDOW
+        self.balance = float(min_retries)
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_request(self):
+        self.requests += 1
+        self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False once it is used up."""
+        if self.balance <= 0:
+            self.exhausted += 1
+            return False
+        self.balance -= 1
+        self.retries += 1
+        return True
+
+    def describe(self) -> dict:
+        return {
+            "ratio": self.ratio,
+            "requests": self.requests,
+            "retries": self.retries,
+            "denied": self.exhausted,
+            "balance": round(self.balance, 3),
+        }
+
+
+# Consecutive server, timeout or connection failures that take an endpoint out of rotation
+ENDPOINT_FAILURE_THRESHOLD = 3
+ENDPOINT_COOLDOWN_SECONDS = (5.0, 120.0)
+ROUTING_STRATEGIES = ("least-outstanding", "p2c")
+
+
+class Endpoint:
+    """One (base_url, api_key) of a vendor, with its load and health."""
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str]):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.client = None
+        self.outstanding = 0
+        self.attempts = 0
+        self.errors: dict[str, int] = defaultdict(int)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.cooldowns = 0
+        self.latency = LatencySketch()
+
+    def describe(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "attempts": self.attempts,
+            "errors": sum(self.errors.values()),
+            "error_classes": dict(self.errors),
+            "error_rate": round(sum(self.errors.values()) / self.attempts, 4)
+            if self.attempts
+            else None,
+            "cooldowns": self.cooldowns,
+            "latency_ms": self.latency.describe(),
+        }
+
+
+def load_endpoints(path: str) -> list[Endpoint]:
+    """
+    Endpoint pool from a JSON list of {"base_url", "api_key" or "api_key_env", "name"}.
+
+    Names default to the position in the list.
+    """
+    with megfile.smart_open(path, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    endpoints = []
+    for i, config in enumerate(configs):
+        api_key = config.get("api_key")
+        if config.get("api_key_env"):
+            api_key = os.environ.get(config["api_key_env"], api_key)
+        endpoints.append(Endpoint(config.get("name", str(i)), config["base_url"], api_key))
+    return endpoints
+
+
+class EndpointPool:
+    """
+    Routes attempts over a vendor's endpoints.
+
+    `least-outstanding` picks the endpoint with the fewest attempts in flight,
+    `p2c` the less loaded of two random ones. Endpoints that are rate limited
+    (for Retry-After or the backoff) or fail repeatedly are skipped until
+    their cooldown ends, unless every endpoint is cooling down.
+    """
+
+    def __init__(self, endpoints: list[Endpoint], routing: str = "least-outstanding"):
+        if not endpoints:
+            raise ValueError("Endpoint pool is empty")
+        if routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {routing}")
+        self.endpoints = endpoints
+        self.routing = routing
+
+    def pick(self) -> Endpoint:
+        now = time.time()
+        candidates = [e for e in self.endpoints if e.cooldown_until <= now]
+        if not candidates:
+            return min(self.endpoints, key=lambda e: e.cooldown_until)
+        if self.routing == "p2c" and len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        return min(candidates, key=lambda e: (e.outstanding, e.attempts))
+
+    def start(self, endpoint: Endpoint):
+        endpoint.outstanding += 1
+        endpoint.attempts += 1
+
+    def finish(
+        self,
+        endpoint: Endpoint,
+        duration_ms: float,
+        error_class: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ):
+        endpoint.outstanding -= 1
+        if error_class is None:
+            endpoint.consecutive_failures = 0
+            endpoint.latency.add(duration_ms)
+            return
+        endpoint.errors[error_class] += 1
+        if error_class == "rate_limit":
+            self._cool_down(endpoint, retry_delay(error_class, 1, error))
+        elif error_class in RETRY_BACKOFF:
+            endpoint.consecutive_failures += 1
+            excess = endpoint.consecutive_failures - ENDPOINT_FAILURE_THRESHOLD
+            if excess >= 0:
+                base, cap = ENDPOINT_COOLDOWN_SECONDS
+                self._cool_down(endpoint, min(cap, base * 2**excess))
+
+    def _cool_down(self, endpoint: Endpoint, seconds: float):
+        until = time.time() + seconds
+        if until > endpoint.cooldown_until:
+            if endpoint.cooldown_until <= time.time():
+                endpoint.cooldowns += 1
+                logger.warning(f"Endpoint {endpoint.name} out of rotation for {seconds:.1f}s")
+            endpoint.cooldown_until = until
+
+    def describe(self) -> dict:
+        return {e.name: e.describe() for e in self.endpoints}
+
+
+LATENCY_BUCKETS_SECONDS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+class RunMetrics:
+    """Live counters for a run, exported in Prometheus text format."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.completions: dict[tuple[str, str], int] = defaultdict(int)
+        self.schema_failures = 0
+        self.error_classes: dict[str, int] = defaultdict(int)
+        # Counted in send_request when a retry is scheduled, so batch API
+        # calls and warm-up requests never show up as retries
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS_SECONDS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def retry_scheduled(self):
+        self.retries += 1
+
+    def request_finished(self, result: dict):
+        self.in_flight -= 1
+        self.observe(result)
+
+    def observe(self, result: dict):
+        """Record a finished result."""
+        finish_reason = result.get("finish_reason") or "none"
+        self.completions[(result.get("status", "failed"), finish_reason)] += 1
+        if finish_reason == "tool_calls" and not result.get("tool_calls_valid"):
+            self.schema_failures += 1
+        if result.get("error_class"):
+            self.error_classes[result["error_class"]] += 1
+
+        if result.get("duration_ms") is not None:
+            seconds = result["duration_ms"] / 1000
+            self.latency_count += 1
+            self.latency_sum += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS_SECONDS):
+                if seconds <= bound:
+                    self.latency_buckets[i] += 1
+
+        prompt_tokens, completion_tokens, cached_tokens = extract_usage(
+            result.get("response")
+        )
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+
+    def snapshot(self) -> dict:
+        """JSON-serializable view of the current counters."""
+        return {
+            "model": self.model,
+            "updated_at": datetime.now().isoformat(),
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            "in_flight": self.in_flight,
+            "completions": [
+                {"status": status, "finish_reason": finish_reason, "count": count}
+                for (status, finish_reason), count in sorted(self.completions.items())
+            ],
+            "schema_validation_error_count": self.schema_failures,
+            "error_classes": dict(sorted(self.error_classes.items())),
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "latency_seconds": {
+                "count": self.latency_count,
+                "sum": round(self.latency_sum, 3),
+                "buckets": dict(
+                    zip(map(str, LATENCY_BUCKETS_SECONDS), self.latency_buckets)
+                ),
+            },
+        }
+
+    def render(self) -> str:
+        """Render the counters in Prometheus text exposition format."""
+        model = self.model.replace("\\", "\\\\").replace('"', '\\"')
+        label = f'model="{model}"'
+        lines = [
+            "# HELP tool_calls_eval_in_flight_requests Requests currently sent to the vendor.",
+            "# TYPE tool_calls_eval_in_flight_requests gauge",
+            f"tool_calls_eval_in_flight_requests{{{label}}} {self.in_flight}",
+            "# HELP tool_calls_eval_completions_total Finished requests by status and finish_reason.",
+            "# TYPE tool_calls_eval_completions_total counter",
+        ]
+        for (status, finish_reason), count in sorted(self.completions.items()):
+            lines.append(
+                f'tool_calls_eval_completions_total{{{label},status="{status}",'
+                f'finish_reason="{finish_reason}"}} {count}'
+            )
+        lines += [
+            "# HELP tool_calls_eval_schema_validation_errors_total Tool calls that failed schema validation.",
+            "# TYPE tool_calls_eval_schema_validation_errors_total counter",
+            f"tool_calls_eval_schema_validation_errors_total{{{label}}} {self.schema_failures}",
+            "# HELP tool_calls_eval_errors_total Failed requests by error class.",
+            "# TYPE tool_calls_eval_errors_total counter",
+        ]
+        for error_class, count in sorted(self.error_classes.items()):
+            lines.append(
+                f'tool_calls_eval_errors_total{{{label},error_class="{error_class}"}} {count}'
+            )
+        lines += [
+            "# HELP tool_calls_eval_retries_total Retries scheduled after failed attempts.",
+            "# TYPE tool_calls_eval_retries_total counter",
+            f"tool_calls_eval_retries_total{{{label}}} {self.retries}",
+            "# HELP tool_calls_eval_tokens_total Tokens reported in response usage.",
+            "# TYPE tool_calls_eval_tokens_total counter",
+            f'tool_calls_eval_tokens_total{{{label},type="prompt"}} {self.prompt_tokens}',
+            f'tool_calls_eval_tokens_total{{{label},type="completion"}} {self.completion_tokens}',
+            f'tool_calls_eval_tokens_total{{{label},type="cached"}} {self.cached_tokens}',
+            "# HELP tool_calls_eval_request_duration_seconds Request latency.",
+            "# TYPE tool_calls_eval_request_duration_seconds histogram",
+        ]
+        for bound, count in zip(LATENCY_BUCKETS_SECONDS, self.latency_buckets):
+            lines.append(
+                f'tool_calls_eval_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+            )
+        lines += [
+            f'tool_calls_eval_request_duration_seconds_bucket{{{label},le="+Inf"}} {self.latency_count}',
+            f"tool_calls_eval_request_duration_seconds_sum{{{label}}} {self.latency_sum:.3f}",
+            f"tool_calls_eval_request_duration_seconds_count{{{label}}} {self.latency_count}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        """Start a minimal HTTP server exposing GET /metrics."""
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request_line = await reader.readline()
+                # Drain headers, the body is never used
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request_line.decode("latin-1").split()
+                if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                    status, body = "200 OK", self.render().encode("utf-8")
+                else:
+                    status, body = "404 Not Found", b"not found\n"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n".encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return server
+
+
+# Steady state: throughput of every window in a run of this many stays
+# within the tolerance of the median window throughput
+STEADY_WINDOWS = 3
+STEADY_TOLERANCE = 0.25
+# Steady state shows early in a run; long-lived validators (shadow proxy,
+# drift monitor) stop recording completion times after this many
+STEADY_MAX_SAMPLES = 100_000
+
+
+def find_steady_state(
+    started_at: float, finished_at: list[float], min_per_window: int = 10
+) -> Optional[tuple[float, float]]:
+    """
+    When completion throughput settles, as (seconds since started_at, requests/s).
+
+    The run is cut into up to 20 equal windows of at least `min_per_window`
+    completions on average. Steady state starts at the first window that
+    begins STEADY_WINDOWS windows in a row within STEADY_TOLERANCE of the
+    median window throughput. None when the run is too short to tell.
+    """
+    span = max(finished_at, default=started_at) - started_at
+    windows = min(20, len(finished_at) // min_per_window)
+    if windows < STEADY_WINDOWS or span <= 0:
+        return None
+    width = span / windows
+    counts = [0] * windows
+    for t in finished_at:
+        counts[min(int((t - started_at) / width), windows - 1)] += 1
+    median = sorted(counts)[windows // 2]
+    for i in range(windows - STEADY_WINDOWS + 1):
+        if all(
+            abs(c - median) <= STEADY_TOLERANCE * median
+            for c in counts[i : i + STEADY_WINDOWS]
+        ):
+            return i * width, median / width
+    return None
+
+
+def snapshot_path(summary_file: str) -> str:
+    """Path of the live snapshot written next to the summary file."""
+    root, _ = os.path.splitext(summary_file)
+    return f"{root}.live.json"
+
+
+def checkpoint_dir(output_file: str) -> str:
+    """Directory of the result parts uploaded while a run is in progress."""
+    return f"{output_file}.parts"
+
+
+# Trace lane of the request running in the current task, read by httpx hooks
+current_trace_lane: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "current_trace_lane", default=None
+)
+
+# When the first content or tool-call delta of a streamed response arrived
+current_first_token_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "current_first_token_at", default=None
+)
+
+# When the latest attempt of the request in the current task was sent, so TTFT
+# excludes failed attempts and retry backoff
+current_attempt_started_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "current_attempt_started_at", default=None
+)
+
+# Body text of the last --raw-response answer in the current task, as the vendor sent it
+current_raw_body: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_raw_body", default=None
+)
+
+# Endpoint that served the last attempt of the request in the current task
+current_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_endpoint", default=None
+)
+
+
+class TraceRecorder:
+    """Collects per-request spans in Chrome trace-event format (for Perfetto)."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: list[dict] = []
+        self.lanes: dict[tuple, int] = {}
+
+    def now(self) -> float:
+        """Microseconds since the recorder was created."""
+        return (time.perf_counter() - self.origin) * 1_000_000
+
+    def lane(self, data_index: int, trial: int = 0) -> int:
+        """Thread id for a sample; rounds of a conversation share its lane."""
+        key = (data_index, trial)
+        if key not in self.lanes:
+            tid = len(self.lanes) + 1
+            self.lanes[key] = tid
+            name = f"#{data_index}" if trial == 0 else f"#{data_index} trial {trial}"
+            self.events.append(
+                {"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": name}}
+            )
+        return self.lanes[key]
+
+    def span(self, name: str, tid: int, start: float, end: float, **args):
+        self.events.append(
+            {
+                "ph": "X",
+                "name": name,
+                "pid": 1,
+                "tid": tid,
+                "ts": round(start, 1),
+                "dur": round(max(0.0, end - start), 1),
+                "args": args,
+            }
+        )
+
+    def instant(self, name: str, tid: int, **args):
+        self.events.append(
+            {"ph": "i", "s": "t", "name": name, "pid": 1, "tid": tid, "ts": round(self.now(), 1), "args": args}
+        )
+
+    async def on_http_request(self, request) -> None:
+        """httpx hook: one call per attempt, including client retries."""
+        lane = current_trace_lane.get()
+        if lane is not None:
+            lane["attempt"] += 1
+            lane["attempt_start"] = self.now()
+
+    async def on_http_response(self, response) -> None:
+        """httpx hook: called when response headers (the first byte) arrive."""
+        lane = current_trace_lane.get()
+        if lane is not None:
+            self.span(
+                f"attempt {lane['attempt']}",
+                lane["tid"],
+                lane["attempt_start"],
+                self.now(),
+                status_code=response.status_code,
+            )
+            self.instant("first byte", lane["tid"], attempt=lane["attempt"])
+
+    def write(self, path: str):
+        with megfile.smart_open(path, "w", encoding="utf-8", **storage_options(path)) as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"Trace saved to {path} (open in https://ui.perfetto.dev)")
+
+
+class SamplingProfiler:
+    """
+    Samples the main thread's stack from a background thread.
+
+    Output is in folded-stack format ("frame;frame;frame count" per line),
+    readable by speedscope and flamegraph.pl.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.counts: dict[str, int] = defaultdict(int)
+        self.target_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self, path: str):
+        self._stop.set()
+        self._thread.join()
+        with megfile.smart_open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items(), key=lambda kv: -kv[1]):
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Profile saved to {path} ({sum(self.counts.values())} samples)")
+
+
+# Default throwaway warm-up request: opens connections and wakes the model
+# without putting test-set prompts into the vendor's prefix cache
+WARMUP_REQUEST = {"messages": [{"role": "user", "content": "Hello"}], "max_tokens": 1}
+
+
+def summarize_results(results_file: str) -> dict:
+    """Summary of a results file from its stored scores, first turns only as in a run."""
+    acc = None
+    repeats = 1
+    with megfile.smart_open(results_file, "rb", **storage_options(results_file)) as f:
+        for line in f:
+            result = json_loads(line)
+            if acc is None:
+                acc = SummaryAccumulator(
+                    result["request"].get("model", ""), track_trials=True
+                )
+            if result.get("round", 0):
+                continue
+            record = ResultRecord.from_result(result)
+            acc.add(record)
+            repeats = max(repeats, record.trial + 1)
+    return acc.build(repeats=repeats) if acc else {}
+
+
+class ResultStream:
+    """
+    Scored results of ToolCallsValidator.run, in completion order.
+
+    Iterate it with `async for`; `summary()` gives the summary of the
+    results yielded so far at any point, first turns only as in a run.
+    """
+
+    def __init__(self, validator: "ToolCallsValidator", jobs: AsyncIterator[tuple]):
+        self.validator = validator
+        self._jobs = jobs
+        self.summary_acc = SummaryAccumulator(
+            validator.alias_model, track_trials=validator.repeats > 1
+        )
+
+    def __aiter__(self) -> AsyncIterator[dict]:
+        return self._results()
+
+    async def _results(self) -> AsyncIterator[dict]:
+        async for result in self.validator.stream_jobs(self._jobs):
+            if result.get("round", 0) == 0:
+                self.summary_acc.add(ResultRecord.from_result(result))
+            yield result
+
+    def summary(self) -> dict:
+        return self.summary_acc.build(
+            price=self.validator.price,
+            projected_requests=self.validator.projected_requests,
+            repeats=self.validator.repeats,
+        )
+
+
 class ToolCallsValidator:
     """Validator for tool calls."""
 
@@ -40,6 +1390,31 @@ class ToolCallsValidator:
         vendor: Optional[str] = None,
         provider_order: Optional[list[str]] = None,
         alias_model: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+        snapshot_interval: float = 0,
+        price_table: Optional[dict] = None,
+        projected_requests: int = 1_000_000,
+        repeats: int = 1,
+        schedule: str = "dataset",
+        history_files: Optional[list[str]] = None,
+        dataset_cache: Optional[str] = None,
+        batch: bool = False,
+        batch_poll_interval: float = 30,
+        batch_completion_window: str = "24h",
+        max_rounds: int = 1,
+        tool_stub: Optional[ToolStub] = None,
+        trace_file: Optional[str] = None,
+        retry_budget: float = 0.2,
+        checkpoint_interval: float = 0,
+        warmup: int = 0,
+        warmup_requests: Optional[list[dict]] = None,
+        expected_calls: Optional[dict[str, dict]] = None,
+        accuracy_tolerance: float = 1e-6,
+        raw_response: bool = False,
+        endpoints: Optional[list[Endpoint]] = None,
+        routing: str = "least-outstanding",
+        stream: bool = False,
     ):
         self.model = model
         self.base_url = base_url
@@ -53,18 +1428,66 @@ class ToolCallsValidator:
         self.summary_file = summary_file
         self.incremental = incremental
         self.filter_unsupported_roles = filter_unsupported_roles
+        self.stream = stream
         self.vendor = vendor
         self.provider_order = provider_order
         self.alias_model = alias_model if alias_model else model
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.snapshot_interval = snapshot_interval
+        self.price = None
+        if price_table:
+            self.price = lookup_price(price_table, vendor, self.alias_model)
+            if self.price is None:
+                self.price = lookup_price(price_table, vendor, model)
+            if self.price is None:
+                logger.warning(
+                    f"No price entry for vendor={vendor} model={self.alias_model}"
+                )
+        self.projected_requests = projected_requests
+        self.repeats = max(1, repeats)
+        self.schedule = schedule
+        self.history_files = history_files or []
+        self.dataset_cache = dataset_cache
+        self.batch = batch
+        self.batch_poll_interval = batch_poll_interval
+        self.batch_completion_window = batch_completion_window
+        self.max_rounds = max(1, max_rounds)
+        self.tool_stub = tool_stub or ToolStub()
+        self.round_accs: dict[int, SummaryAccumulator] = {}
+        self.trace_file = trace_file
+        self.tracer = TraceRecorder() if trace_file else None
+        self.retry_budget = RetryBudget(retry_budget)
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_lines: list[bytes] = []
+        self.checkpoint_run_id = f"{datetime.now():%Y%m%d%H%M%S}-{os.getpid()}"
+        self.checkpoint_parts = 0
+        self.warmup = warmup
+        self.warmup_requests = [
+            self.prepare_request(r) for r in warmup_requests or [WARMUP_REQUEST]
+        ]
+        self.warmup_summary: Optional[dict] = None
+        # Requests are warm once every connection slot has completed one
+        self.warm_after = concurrency
+        self.finished_requests = 0
+        self.first_sent_at: Optional[float] = None
+        self.finished_at: list[float] = []
+        self.expected_calls = expected_calls or {}
+        self.accuracy_tolerance = accuracy_tolerance
+        self.raw_response = raw_response
+        # Without a pool, the single base_url and api_key form a pool of one
+        self.pooled = bool(endpoints)
+        self.pool = EndpointPool(
+            endpoints or [Endpoint("default", base_url, self.api_key)], routing
+        )
 
-        self.results: list[dict] = []
+        self.results: list[ResultRecord] = []
+        self.summary_acc = SummaryAccumulator(self.alias_model)
+        self.metrics = RunMetrics(self.alias_model)
 
-        self.client = AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            timeout=self.timeout,
-            max_retries=self.max_retries,
-        )
+        self._client = None
+        # Prepared requests of the current run, see stage_dataset
+        self.staging = None
 
         logger.info(f"Results will be saved to {self.output_file}")
         logger.info(f"Summary will be saved to {self.summary_file}")
@@ -77,11 +1500,45 @@ class ToolCallsValidator:
             if vendor == "openrouter" and provider_order:
                 logger.info(f"Provider order: {provider_order}")
 
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """OpenAI client, created on first use so offline work never imports openai."""
+        if self._client is None:
+            self._client = self._make_client(self.base_url, self.api_key)
+        return self._client
+
+    def _make_client(self, base_url: str, api_key: Optional[str]) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self.timeout,
+            # Retries are done in send_request, per error class and within the budget
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                event_hooks=self._http_event_hooks()
+            ),
+        )
+
+    def endpoint_client(self, endpoint: Endpoint) -> openai.AsyncOpenAI:
+        """Client of a pool endpoint; each endpoint has its own connection pool."""
+        if not self.pooled:
+            return self.client
+        if endpoint.client is None:
+            endpoint.client = self._make_client(endpoint.base_url, endpoint.api_key)
+        return endpoint.client
+
+    def _http_event_hooks(self) -> dict:
+        hooks = {"request": [], "response": []}
+        if self.tracer:
+            hooks["request"].append(self.tracer.on_http_request)
+            hooks["response"].append(self.tracer.on_http_response)
+        return hooks
+
     def prepare_request(self, request: dict) -> dict:
         """Process request messages and set model."""
         req = request.copy()
 
-        # Force disable stream mode
+        # Always hashed as non-streaming; --stream is applied when sending
         req["stream"] = False
 
         # Add provider field for openrouter
@@ -127,182 +1584,537 @@ class ToolCallsValidator:
 
         return req
 
+    def dataset_cache_path(self, file_path: str) -> str:
+        """Cache file for a dataset, keyed by its fingerprint and preparation options."""
+        options = {
+            "version": DATASET_CACHE_VERSION,
+            "file": file_fingerprint(file_path),
+            "model": self.model,
+            "vendor": self.vendor,
+            "provider_order": self.provider_order,
+            "filter_unsupported_roles": self.filter_unsupported_roles,
+        }
+        return megfile.smart_path_join(
+            self.dataset_cache, f"prepared-{compute_hash(options)}.jsonl"
+        )
+
     def read_jsonl(self, file_path: str) -> list[dict]:
-        """Load and prepare JSONL requests, compute hash."""
-        requests = []
-        with megfile.smart_open(file_path, "r", encoding="utf-8") as f:
+        """Load all prepared requests, from the dataset cache when enabled."""
+        return list(self.iter_prepared(file_path))
+
+    def iter_prepared(self, file_path: str) -> Iterator[dict]:
+        """
+        Yield prepared requests one at a time, from the dataset cache when enabled.
+
+        The cache is a JSONL file of prepared requests with an index of their
+        byte ranges next to it (see stage_dataset). Both are written as the
+        requests stream through, so the dataset never has to fit in memory.
+        """
+        if not self.dataset_cache:
+            yield from self._iter_jsonl(file_path)
+            return
+
+        cache_path = self.dataset_cache_path(file_path)
+        # The index is written last, so a cache with an index is complete
+        if megfile.smart_exists(f"{cache_path}.index"):
+            with megfile.smart_open(cache_path, "rb", **storage_options(cache_path)) as f:
+                for line in f:
+                    yield json_loads(line)
+            return
+
+        megfile.smart_makedirs(self.dataset_cache, exist_ok=True)
+        # Write to temporary files first so concurrent runs never see a partial cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        index = []
+        offset = 0
+        with megfile.smart_open(tmp_path, "wb", **storage_options(tmp_path)) as f:
+            for req in self._iter_jsonl(file_path):
+                data = json_dumps_line(req)
+                f.write(data)
+                index.append(
+                    [
+                        req["data_index"],
+                        req["hash"],
+                        offset,
+                        len(data),
+                        estimate_request_tokens(req["prepared"]),
+                    ]
+                )
+                offset += len(data)
+                yield req
+        megfile.smart_move(tmp_path, cache_path)
+        with megfile.smart_open(f"{tmp_path}.index", "wb") as f:
+            f.write(json_dumps_line(index))
+        megfile.smart_move(f"{tmp_path}.index", f"{cache_path}.index")
+        logger.info(f"Saved prepared dataset cache to {cache_path}")
+
+    def _iter_jsonl(self, file_path: str) -> Iterator[dict]:
+        """Load and prepare JSONL requests (gzip-compressed if *.gz), compute hash."""
+        with megfile.smart_open(file_path, "rb", **storage_options(file_path)) as raw:
+            # Shards written by convert_dataset.py --compress are *.jsonl.gz
+            f = gzip.GzipFile(fileobj=raw) if file_path.endswith(".gz") else raw
             for line_num, line in enumerate(f, 1):
                 try:
-                    raw_req = json.loads(line.strip())
+                    raw_req = json_loads(line)
                     prepared_req = self.prepare_request(raw_req)
-                    requests.append(
-                        {
-                            "data_index": line_num,
-                            "raw": raw_req,
-                            "prepared": prepared_req,
-                            "hash": compute_hash(prepared_req),
-                        }
-                    )
+                    yield {
+                        "data_index": line_num,
+                        "raw": raw_req,
+                        "prepared": prepared_req,
+                        "hash": compute_hash(prepared_req),
+                    }
                 except json.JSONDecodeError as e:
                     logger.error(f"Error parsing line {line_num}: {e}")
-        return requests
+
+    def stage_dataset(self, file_path: str) -> list[StagedRequest]:
+        """
+        Put the prepared requests in a local staging file and index them.
+
+        Only the index stays in memory; load_jobs reads each payload back
+        when its job is dispatched. A cached dataset is staged as is, without
+        parsing a single request: a local cache file is the staging file, a
+        remote one is copied.
+        """
+        if self.dataset_cache:
+            cache_path = self.dataset_cache_path(file_path)
+            index_path = f"{cache_path}.index"
+            if megfile.smart_exists(index_path):
+                with megfile.smart_open(index_path, "rb") as f:
+                    index = json_loads(f.read())
+                if megfile.SmartPath(cache_path).protocol == "file":
+                    self.staging = open(cache_path, "rb")
+                else:
+                    self.staging = tempfile.TemporaryFile()
+                    with megfile.smart_open(
+                        cache_path, "rb", **storage_options(cache_path)
+                    ) as f:
+                        shutil.copyfileobj(f, self.staging, IO_BLOCK_SIZE)
+                logger.info(f"Loaded {len(index)} prepared requests from {cache_path}")
+                return [StagedRequest(*entry) for entry in index]
+
+        self.staging = tempfile.TemporaryFile()
+        staged = []
+        for req in self.iter_prepared(file_path):
+            data = json_dumps_line(req)
+            staged.append(
+                StagedRequest(
+                    data_index=req["data_index"],
+                    hash=req["hash"],
+                    offset=self.staging.tell(),
+                    length=len(data),
+                    tokens=(
+                        estimate_request_tokens(req["prepared"])
+                        if self.schedule == "lpt"
+                        else 0.0
+                    ),
+                )
+            )
+            self.staging.write(data)
+        return staged
+
+    def load_jobs(
+        self, jobs: list[tuple[StagedRequest, int]]
+    ) -> Iterator[tuple[dict, int, int]]:
+        """(request, data_index, trial) of planned jobs, payloads read from the staging file."""
+        for entry, trial in jobs:
+            self.staging.seek(entry.offset)
+            req = json_loads(self.staging.read(entry.length))
+            yield req, entry.data_index, trial
 
     def read_result_jsonl(self, file_path: str) -> list[dict]:
         results = []
-        with megfile.smart_open(file_path, "r", encoding="utf-8") as f:
+        with megfile.smart_open(file_path, "rb", **storage_options(file_path)) as f:
             for line in f:
-                results.append(json.loads(line))
+                results.append(json_loads(line))
         return results
 
-    async def send_request(self, request: dict) -> tuple[str, dict]:
-        try:
-            logger.debug(
-                f"Sending request: {json.dumps(request, ensure_ascii=False)[:500]}..."
-            )
-
-            # Extract provider field from request and add to extra_body
-            request_copy = request.copy()
-            extra_body = self.extra_body.copy()
-            if "provider" in request_copy:
-                extra_body["provider"] = request_copy.pop("provider")
+    def _split_extra_body(self, request: dict) -> tuple[dict, dict]:
+        """Request copy as sent, without the provider field, and extra_body including it."""
+        request_copy = request.copy()
+        # Stream only when TTFT is measured; the chunks are assembled into one response
+        if self.stream:
+            request_copy["stream"] = True
+            request_copy["stream_options"] = {"include_usage": True}
+        extra_body = self.extra_body.copy()
+        if "provider" in request_copy:
+            extra_body["provider"] = request_copy.pop("provider")
+        return request_copy, extra_body
+
+    async def send_request(
+        self, request: dict
+    ) -> tuple[str, dict, int, Optional[str]]:
+        """
+        Send a request, retrying retryable error classes with backoff.
+
+        Returns (status, response, attempts, error_class), where error_class is
+        the class of the final failure and None on success.
+        """
+        # Lazy: the payload is only serialized when DEBUG is enabled
+        logger.opt(lazy=True).debug(
+            "Sending request: {}...",
+            lambda: json.dumps(request, ensure_ascii=False)[:500],
+        )
 
-            if request_copy.get("stream", False):
-                return await self._handle_stream_request(request_copy, extra_body)
-            else:
-                response = await self.client.chat.completions.create(
-                    **request_copy, extra_body=extra_body
+        request_copy, extra_body = self._split_extra_body(request)
+
+        self.retry_budget.record_request()
+        attempts = 0
+        while True:
+            attempts += 1
+            # Every attempt is routed anew, so retries move off a throttled endpoint
+            endpoint = self.pool.pick()
+            client = self.endpoint_client(endpoint)
+            current_endpoint.set(endpoint.name)
+            self.pool.start(endpoint)
+            attempt_start = time.time()
+            current_attempt_started_at.set(attempt_start)
+            current_first_token_at.set(None)
+            try:
+                if request_copy.get("stream", False):
+                    response_dict = await self._handle_stream_request(
+                        client, request_copy, extra_body
+                    )
+                elif self.raw_response:
+                    # Status errors still raise, so retries and error classes are unchanged
+                    raw = await client.chat.completions.with_raw_response.create(
+                        **request_copy, extra_body=extra_body
+                    )
+                    response_dict = parse_raw_response(raw.http_response.content)
+                    current_raw_body.set(raw.http_response.text)
+                    logger.opt(lazy=True).debug(
+                        "Response received: {}...",
+                        lambda: raw.http_response.text[:500],
+                    )
+                else:
+                    response = await client.chat.completions.create(
+                        **request_copy, extra_body=extra_body
+                    )
+                    response_dict = response.model_dump()
+                    # 添加响应日志
+                    logger.opt(lazy=True).debug(
+                        "Response received: {}...",
+                        lambda: json.dumps(response_dict, ensure_ascii=False)[:500],
+                    )
+                self.pool.finish(endpoint, (time.time() - attempt_start) * 1000)
+                return "success", response_dict, attempts, None
+            except Exception as e:
+                error_class = classify_error(e)
+                self.pool.finish(
+                    endpoint, (time.time() - attempt_start) * 1000, error_class, e
                 )
-                response_dict = response.model_dump()
-                # 添加响应日志
-                logger.debug(
-                    f"Response received: {json.dumps(response_dict, ensure_ascii=False)[:500]}..."
+                if (
+                    error_class in RETRY_BACKOFF
+                    and attempts <= self.max_retries
+                    and self.retry_budget.try_spend()
+                ):
+                    delay = retry_delay(error_class, attempts, e)
+                    self.metrics.retry_scheduled()
+                    logger.warning(
+                        f"Request failed ({error_class}), retry {attempts}/{self.max_retries} "
+                        f"in {delay:.1f}s: {e}"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                if error_class in RETRY_BACKOFF and attempts <= self.max_retries:
+                    logger.warning("Retry budget exhausted, not retrying")
+                logger.error(f"Request failed ({error_class}) after {attempts} attempts: {e}")
+                logger.error(
+                    f"Failed request payload: {json.dumps(request, ensure_ascii=False, indent=2)}"
                 )
-                return "success", response_dict
-        except Exception as e:
-            logger.error(f"Request failed: {e}")
-            logger.error(
-                f"Failed request payload: {json.dumps(request, ensure_ascii=False, indent=2)}"
-            )
-            return "failed", {"error": str(e)}
+                return "failed", {"error": str(e)}, attempts, error_class
 
     async def _handle_stream_request(
-        self, request: dict, extra_body: dict
-    ) -> tuple[str, dict]:
-        try:
-            stream = await self.client.chat.completions.create(
-                **request, extra_body=extra_body
-            )
+        self, client: openai.AsyncOpenAI, request: dict, extra_body: dict
+    ) -> dict:
+        """Send a streaming request and assemble the chunks into one response."""
+        stream = await client.chat.completions.create(
+            **request, extra_body=extra_body
+        )
 
-            request_id = None
-            created = None
-            full_content = []
-            tool_calls: dict[int, dict] = {}
-            finish_reason = None
-            usage = None
-
-            async for event in stream:
-                if hasattr(event, "id") and event.id:
-                    request_id = event.id
-                if hasattr(event, "created") and event.created:
-                    created = event.created
-
-                if not hasattr(event, "choices") or not event.choices:
-                    logger.warning("Empty choices in stream event")
+        request_id = None
+        created = None
+        full_content = []
+        tool_calls: dict[int, dict] = {}
+        finish_reason = None
+        usage = None
+        first_token_at = None
+
+        async for event in stream:
+            if hasattr(event, "id") and event.id:
+                request_id = event.id
+            if hasattr(event, "created") and event.created:
+                created = event.created
+            # With include_usage, usage comes in a final chunk without choices, but
+            # some vendors also attach it to the finish chunk or to every chunk
+            if getattr(event, "usage", None):
+                usage = event.usage.model_dump()
+                if not getattr(event, "choices", None):
                     continue
 
-                choice = event.choices[0]
-
-                if hasattr(choice, "delta") and choice.delta:
-                    if hasattr(choice.delta, "content") and choice.delta.content:
-                        full_content.append(choice.delta.content)
-
-                    if hasattr(choice.delta, "tool_calls") and choice.delta.tool_calls:
-                        for tc in choice.delta.tool_calls:
-                            idx = tc.index if tc.index is not None else 0
-
-                            if idx not in tool_calls:
-                                tool_calls[idx] = {
-                                    "id": tc.id,
-                                    "type": tc.type,
-                                    "function": {"name": "", "arguments": ""},
-                                }
-
-                            if hasattr(tc, "function") and tc.function:
-                                if hasattr(tc.function, "name") and tc.function.name:
-                                    tool_calls[idx]["function"]["name"] = (
-                                        tc.function.name
-                                    )
-                                if (
-                                    hasattr(tc.function, "arguments")
-                                    and tc.function.arguments
-                                ):
-                                    tool_calls[idx]["function"]["arguments"] += (
-                                        tc.function.arguments
-                                    )
-
-                if hasattr(choice, "finish_reason") and choice.finish_reason:
-                    finish_reason = choice.finish_reason
-
-                if hasattr(choice, "usage") and choice.usage:
-                    usage = choice.usage
-
-            response = {
-                "id": request_id,
-                "object": "chat.completion",
-                "created": created,
-                "model": request.get("model", ""),
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": "".join(full_content),
-                            "tool_calls": (
-                                list(tool_calls.values()) if tool_calls else None
-                            ),
-                        },
-                        "finish_reason": finish_reason or "stop",
-                    }
-                ],
-                "usage": usage,
-            }
-            return "success", response
-        except Exception as e:
-            logger.error(f"Stream request failed: {e}")
-            return "failed", {"error": str(e)}
+            if not hasattr(event, "choices") or not event.choices:
+                logger.warning("Empty choices in stream event")
+                continue
+
+            choice = event.choices[0]
+
+            if hasattr(choice, "delta") and choice.delta:
+                if first_token_at is None and (
+                    choice.delta.content or choice.delta.tool_calls
+                ):
+                    first_token_at = time.time()
+                    current_first_token_at.set(first_token_at)
+                if hasattr(choice.delta, "content") and choice.delta.content:
+                    full_content.append(choice.delta.content)
+
+                if hasattr(choice.delta, "tool_calls") and choice.delta.tool_calls:
+                    for tc in choice.delta.tool_calls:
+                        idx = tc.index if tc.index is not None else 0
+
+                        if idx not in tool_calls:
+                            tool_calls[idx] = {
+                                "id": tc.id,
+                                "type": tc.type,
+                                "function": {"name": "", "arguments": ""},
+                            }
+
+                        if hasattr(tc, "function") and tc.function:
+                            if hasattr(tc.function, "name") and tc.function.name:
+                                tool_calls[idx]["function"]["name"] = (
+                                    tc.function.name
+                                )
+                            if (
+                                hasattr(tc.function, "arguments")
+                                and tc.function.arguments
+                            ):
+                                tool_calls[idx]["function"]["arguments"] += (
+                                    tc.function.arguments
+                                )
+
+            if hasattr(choice, "finish_reason") and choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+            if hasattr(choice, "usage") and choice.usage:
+                usage = choice.usage
+                if hasattr(usage, "model_dump"):
+                    usage = usage.model_dump()
+
+        response = {
+            "id": request_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": request.get("model", ""),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "".join(full_content),
+                        "tool_calls": (
+                            list(tool_calls.values()) if tool_calls else None
+                        ),
+                    },
+                    "finish_reason": finish_reason or "stop",
+                }
+            ],
+            "usage": usage,
+        }
+        return response
+
+    def _mark_sent(self, sent_at: float) -> bool:
+        """Note a request being sent; returns whether it counts as warm."""
+        if self.first_sent_at is None:
+            self.first_sent_at = sent_at
+        return self.finished_requests >= self.warm_after
+
+    def _mark_finished(self):
+        self.finished_requests += 1
+        if len(self.finished_at) < STEADY_MAX_SAMPLES:
+            self.finished_at.append(time.time())
+
+    async def warm_up(self):
+        """
+        Send `warmup` throwaway requests before measurement starts.
+
+        They pay for DNS, TLS, connection setup and vendor cold starts, and
+        are neither scored nor written. Requests sent afterwards count as warm.
+        """
+        if self.warmup <= 0:
+            return
+        latency = LatencySketch()
+        failed = 0
+
+        async def send(endpoint: Endpoint, request: dict):
+            nonlocal failed
+            async with self.semaphore:
+                start_time = time.time()
+                self._mark_sent(start_time)
+                request, extra_body = self._split_extra_body(request)
+                self.pool.start(endpoint)
+                error_class = None
+                error = None
+                try:
+                    response = await self.endpoint_client(endpoint).chat.completions.create(
+                        **request, extra_body=extra_body
+                    )
+                    if request.get("stream"):
+                        async for _ in response:
+                            pass
+                    latency.add((time.time() - start_time) * 1000)
+                except Exception as e:
+                    failed += 1
+                    error_class = classify_error(e)
+                    error = e
+                    logger.warning(f"Warm-up request failed: {e}")
+                finally:
+                    self.pool.finish(
+                        endpoint, (time.time() - start_time) * 1000, error_class, error
+                    )
+                    self._mark_finished()
+
+        started = time.time()
+        # Round-robin so every endpoint the run may be routed to gets warmed
+        endpoints = self.pool.endpoints
+        await asyncio.gather(
+            *(
+                send(
+                    endpoints[i % len(endpoints)],
+                    self.warmup_requests[i % len(self.warmup_requests)],
+                )
+                for i in range(self.warmup)
+            )
+        )
+        self.warmup_summary = {
+            "requests": self.warmup,
+            "failed": failed,
+            "duration_ms": int((time.time() - started) * 1000),
+            "latency_ms": latency.describe(),
+        }
+        logger.info(
+            f"Warm-up: {self.warmup} requests in {self.warmup_summary['duration_ms']}ms, "
+            f"{failed} failed"
+        )
 
-    async def process_request(self, prepared_req: dict, data_index: int) -> dict:
+    async def process_request(
+        self, prepared_req: dict, data_index: int, trial: int = 0
+    ) -> dict:
         """Process a single request, record duration and status."""
+        tracer = self.tracer
+        if tracer:
+            tid = tracer.lane(data_index, trial)
+            queued_at = tracer.now()
         async with self.semaphore:
+            if tracer:
+                acquired_at = tracer.now()
+                tracer.span("queued", tid, queued_at, acquired_at)
+                current_trace_lane.set({"tid": tid, "attempt": 0, "attempt_start": 0.0})
+            self.metrics.request_started()
             start_time = time.time()
-            status, response = await self.send_request(prepared_req["prepared"])
+            warm = self._mark_sent(start_time)
+            current_first_token_at.set(None)
+            current_raw_body.set(None)
+            status, response, attempts, error_class = await self.send_request(
+                prepared_req["prepared"]
+            )
             duration_ms = int((time.time() - start_time) * 1000)
+            self._mark_finished()
+
+            if tracer:
+                done_at = tracer.now()
+                lane = current_trace_lane.get()
+                tracer.span(
+                    "request",
+                    tid,
+                    acquired_at,
+                    done_at,
+                    status=status,
+                    attempts=lane["attempt"],
+                )
+            result = self.score_response(
+                prepared_req,
+                data_index,
+                trial,
+                status,
+                response,
+                duration_ms,
+                attempts=attempts,
+                error_class=error_class,
+            )
+            result["warm"] = warm
+            first_token_at = current_first_token_at.get()
+            if status == "success" and first_token_at is not None:
+                result["ttft_ms"] = int(
+                    (first_token_at - current_attempt_started_at.get()) * 1000
+                )
+            if self.pooled:
+                result["endpoint"] = current_endpoint.get()
+            raw_body = current_raw_body.get()
+            if status == "success" and raw_body is not None:
+                result["raw_response"] = raw_body
+            if tracer:
+                tracer.span(
+                    "validate",
+                    tid,
+                    done_at,
+                    tracer.now(),
+                    finish_reason=result["finish_reason"],
+                    tool_calls_valid=result["tool_calls_valid"],
+                )
+            self.metrics.request_finished(result)
+            return result
 
-            finish_reason = None
-            tool_calls_valid = None
-
-            if response and "choices" in response:
-                choice = response["choices"][0] if response["choices"] else {}
-                finish_reason = choice.get("finish_reason")
-                if finish_reason == "tool_calls":
-                    tools = prepared_req["prepared"].get("tools", [])
-                    tool_calls = choice.get("message", {}).get("tool_calls", [])
-                    tool_calls_valid = len(tool_calls) != 0 and all(
-                        self.validate_tool_call(tc, tools) for tc in tool_calls
-                    )
+    def score_response(
+        self,
+        prepared_req: dict,
+        data_index: int,
+        trial: int,
+        status: str,
+        response: dict,
+        duration_ms: Optional[int],
+        attempts: int = 1,
+        error_class: Optional[str] = None,
+    ) -> dict:
+        """Build the result record for a response, validating its tool calls."""
+        finish_reason = None
+        tool_calls_valid = None
+
+        if response and "choices" in response:
+            choice = response["choices"][0] if response["choices"] else {}
+            finish_reason = choice.get("finish_reason")
+            if finish_reason == "tool_calls":
+                tools = prepared_req["prepared"].get("tools", [])
+                tool_calls = choice.get("message", {}).get("tool_calls", [])
+                tool_calls_valid = len(tool_calls) != 0 and all(
+                    self.validate_tool_call(tc, tools) for tc in tool_calls
+                )
 
-            result = {
-                "data_index": data_index,
-                "request": prepared_req["prepared"],
-                "response": response,
-                "status": status,
-                "finish_reason": finish_reason,
-                "tool_calls_valid": tool_calls_valid,
-                "last_run_at": datetime.now().isoformat(),
-                "duration_ms": duration_ms,
-                "hash": prepared_req["hash"],
-            }
-            return result
+        result = {
+            "data_index": data_index,
+            "request": prepared_req["prepared"],
+            "response": response,
+            "status": status,
+            "finish_reason": finish_reason,
+            "tool_calls_valid": tool_calls_valid,
+            "last_run_at": datetime.now().isoformat(),
+            "duration_ms": duration_ms,
+            "hash": prepared_req["hash"],
+            "trial": trial,
+            "attempts": attempts,
+            "error_class": error_class,
+        }
+        if self.price is not None:
+            result["cost"] = compute_cost(self.price, *extract_usage(response))
+        if self.expected_calls:
+            # The raw sample is what the sidecar was keyed on; rescoring only has the request
+            sample = prepared_req.get("raw") or prepared_req["prepared"]
+            expected = self.expected_calls.get(expected_call_key(sample))
+            if expected is not None:
+                name_correct, call_correct = score_expected_call(
+                    response, expected, self.accuracy_tolerance
+                )
+                result["tool_name_correct"] = name_correct
+                result["tool_call_correct"] = call_correct
+        return result
 
     def validate_tool_call(self, tool_call: dict, tools: list[dict]) -> bool:
         """Validate tool call arguments against schema."""
@@ -322,114 +2134,585 @@ class ToolCallsValidator:
             args = tool_call["function"]["arguments"]
             if isinstance(args, str):
                 args = json.loads(args)
-            validate(instance=args, schema=schema)
+            jsonschema.validate(instance=args, schema=schema)
             return True
-        except (json.JSONDecodeError, ValidationError) as e:
+        except (json.JSONDecodeError, jsonschema.ValidationError) as e:
             logger.warning(f"Schema validation failed: {e}")
             return False
         except Exception as e:
             logger.warning(f"Unexpected validation error: {e}")
             return False
 
+    def _spool_line(self, spool, line: bytes, record: ResultRecord) -> ResultRecord:
+        """Append a result line to the spool file and remember where it went."""
+        record.offset = spool.seek(0, os.SEEK_END)
+        record.length = spool.write(line)
+        return record
+
+    def _spool_result(self, spool, result: dict, checkpoint: bool = False) -> ResultRecord:
+        line = json_dumps_line(result)
+        if checkpoint and self.checkpoint_interval > 0:
+            self.checkpoint_lines.append(line)
+        return self._spool_line(spool, line, ResultRecord.from_result(result))
+
+    def _add_record(self, record: ResultRecord):
+        self.results.append(record)
+        # The main summary stays first-turn only, comparable with single-turn runs
+        if record.round == 0:
+            self.summary_acc.add(record)
+        if self.max_rounds > 1:
+            if record.round not in self.round_accs:
+                self.round_accs[record.round] = SummaryAccumulator(self.alias_model)
+            self.round_accs[record.round].add(record)
+
     async def validate_file(self, file_path: str):
         """Validate all requests from a file, supports incremental mode."""
-        all_requests = self.read_jsonl(file_path)
-        existing_results = []
-        existing_hash_map = {}
-
-        if self.incremental and megfile.smart_exists(self.output_file):
-            existing_results = self.read_result_jsonl(self.output_file)
-            for r in existing_results:
-                existing_hash_map[r["hash"]] = r
-            logger.info(f"Loaded {len(existing_results)} existing results")
+        # Full result lines go to a local spool file; only compact records stay in memory
+        spool = tempfile.TemporaryFile()
+        jobs = self.plan_jobs(file_path, spool)
+
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = await self.metrics.serve(
+                self.metrics_host, self.metrics_port
+            )
+        snapshot_task = None
+        if self.snapshot_interval > 0:
+            snapshot_task = asyncio.create_task(self._write_snapshots())
+        checkpoint_task = None
+        checkpoint_stop = asyncio.Event()
+        if self.checkpoint_interval > 0:
+            checkpoint_task = asyncio.create_task(
+                self._write_checkpoints(checkpoint_stop)
+            )
 
-        tasks = []
+        try:
+            if self.batch:
+                await self.run_batch(jobs, spool)
+            else:
+                await self.warm_up()
+                await self.run_jobs(jobs, spool)
+        finally:
+            if self.staging:
+                self.staging.close()
+            if snapshot_task:
+                snapshot_task.cancel()
+                self.write_snapshot()
+            if checkpoint_task:
+                checkpoint_stop.set()
+                await checkpoint_task
+            if metrics_server:
+                metrics_server.close()
+                await metrics_server.wait_closed()
+
+        self.save_results(spool)
+        if self.tracer:
+            self.tracer.write(self.trace_file)
+
+    def rescore_file(self, results_file: str):
+        """Re-validate the stored responses of a results file and rewrite it with its summary."""
+        spool = tempfile.TemporaryFile()
+        records = []
+        changed = 0
+        with megfile.smart_open(results_file, "rb", **storage_options(results_file)) as f:
+            for line in f:
+                r = json_loads(line)
+                scored = self.score_response(
+                    {"prepared": r["request"], "hash": r["hash"]},
+                    r["data_index"],
+                    r.get("trial", 0),
+                    r["status"],
+                    r["response"],
+                    r.get("duration_ms"),
+                )
+                if scored["tool_calls_valid"] != r.get("tool_calls_valid"):
+                    changed += 1
+                r["finish_reason"] = scored["finish_reason"]
+                r["tool_calls_valid"] = scored["tool_calls_valid"]
+                for field in ("cost", "tool_name_correct", "tool_call_correct"):
+                    if field in scored:
+                        r[field] = scored[field]
+                records.append(self._spool_result(spool, r))
+
+        # Trials and rounds are only known once the whole file has been read
+        self.repeats = max((r.trial + 1 for r in records), default=1)
+        self.max_rounds = max((r.round + 1 for r in records), default=1)
         self.results = []
+        self.summary_acc = SummaryAccumulator(
+            self.alias_model, track_trials=self.repeats > 1
+        )
+        self.round_accs = {}
+        for record in records:
+            self._add_record(record)
+        logger.info(f"Rescored {len(records)} results, {changed} changed validity")
+        self.save_results(spool)
+
+    def plan_jobs(self, file_path: str, spool) -> list[tuple[StagedRequest, int]]:
+        """
+        Stage requests and decide which (request, trial) jobs to run.
+
+        In incremental mode, successful existing results are copied to the
+        spool and counted instead of being re-run.
+        """
+        # Fetch the dataset in the background while existing results are read,
+        # so both downloads overlap when they live on object storage
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        dataset_future = executor.submit(self.stage_dataset, file_path)
+        # First turns by (hash, trial), as (data_index, record or None if it failed)
+        stored: dict[tuple[str, int], list[tuple[int, Optional[ResultRecord]]]] = defaultdict(list)
+
+        # Later rounds of a conversation are kept whenever its first turn is
+        followups: dict[tuple[str, int, int], list[ResultRecord]] = defaultdict(list)
+
+        parts_dir = checkpoint_dir(self.output_file)
+        parts = sorted(megfile.smart_glob(megfile.smart_path_join(parts_dir, "part-*.jsonl")))
+        if self.incremental:
+            # Parts left by an interrupted run are newer than the output file
+            sources = parts
+            if megfile.smart_exists(self.output_file):
+                sources = [self.output_file] + parts
+            loaded = 0
+            for source in sources:
+                with megfile.smart_open(source, "rb", **storage_options(source)) as f:
+                    for line in f:
+                        r = json_loads(line)
+                        loaded += 1
+                        trial = r.get("trial", 0)
+                        if r.get("round", 0) > 0:
+                            followups[(r["hash"], r["data_index"], trial)].append(
+                                self._spool_result(spool, r)
+                            )
+                            continue
+                        record = None
+                        if r.get("status") == "success":
+                            record = self._spool_result(spool, r)
+                        stored[(r["hash"], trial)].append((r["data_index"], record))
+            logger.info(
+                f"Loaded {loaded} existing results"
+                + (f" ({len(parts)} checkpoint parts)" if parts else "")
+            )
+        elif parts:
+            logger.warning(f"Removing {len(parts)} stale checkpoint parts in {parts_dir}")
+            megfile.smart_remove(parts_dir, missing_ok=True)
+
+        staged = dataset_future.result()
+        executor.shutdown()
+
+        # Copies of a duplicated sample share a hash: the n-th copy in the
+        # dataset takes the n-th stored result, so each copy is run once
+        existing_records: dict[tuple[str, int, int], tuple[ResultRecord, list]] = {}
+        for (request_hash, trial), items in stored.items():
+            items.sort(key=lambda item: item[0])
+            for occurrence, (data_index, record) in enumerate(items):
+                if record is not None:
+                    existing_records[(request_hash, occurrence, trial)] = (
+                        record,
+                        followups.get((request_hash, data_index, trial), []),
+                    )
+        occurrences: dict[str, int] = defaultdict(int)
+        staged_occurrences = []
+        for entry in staged:
+            staged_occurrences.append(occurrences[entry.hash])
+            occurrences[entry.hash] += 1
+        duplicates = len(staged) - len(occurrences)
+        if duplicates:
+            logger.warning(
+                f"{duplicates} samples duplicate an earlier line of {file_path}; "
+                "each copy is run and scored as a separate sample"
+            )
 
-        for req in all_requests:
-            h = req["hash"]
-            data_index = req["data_index"]
-            if self.incremental and h in existing_hash_map:
-                r = existing_hash_map[h]
-                if r.get("status") == "success":
-                    self.results.append(r)
+        self.results = []
+        self.summary_acc = SummaryAccumulator(
+            self.alias_model, track_trials=self.repeats > 1
+        )
+        self.round_accs = {}
+
+        jobs = []
+        # Trial-major order: trials of one sample are a full pass apart,
+        # so they never hit the vendor back-to-back
+        for trial in range(self.repeats):
+            for entry, occurrence in zip(staged, staged_occurrences):
+                key = (entry.hash, occurrence, trial)
+                if key in existing_records:
+                    record, rounds = existing_records[key]
+                    self._add_record(record)
+                    for followup in rounds:
+                        self._add_record(followup)
                     continue  # skip successful
-            tasks.append(self.process_request(req, data_index))
+                jobs.append((entry, trial))
+
+        if self.schedule == "lpt":
+            history = load_duration_history(self.history_files)
+            for record, _ in existing_records.values():
+                if record.duration_ms:
+                    history.setdefault(record.hash, record.duration_ms)
+            expected = estimate_durations(
+                {entry.hash: entry.tokens for entry in staged}, history
+            )
+            # Longest processing time first within each pass
+            jobs.sort(key=lambda job: (job[1], -expected[job[0].hash]))
+            logger.info(
+                f"LPT schedule: {sum(h in history for h in expected)}/{len(expected)} "
+                "requests estimated from history"
+            )
+        return jobs
 
-        with tqdm_asyncio(total=len(tasks), desc="Processing", unit="req") as pbar:
-            for task in asyncio.as_completed(tasks):
-                try:
-                    res = await task
-                    self.results.append(res)
-                except Exception as e:
-                    logger.error(f"Task failed: {e}")
-                finally:
+    async def process_conversation(
+        self, prepared_req: dict, data_index: int, trial: int = 0
+    ) -> list[dict]:
+        """
+        Run up to max_rounds turns, answering tool calls from the tool stub.
+
+        Every turn acquires the semaphore on its own, so turns of different
+        conversations interleave instead of one conversation holding a slot.
+        """
+        results = []
+        request = prepared_req
+        for round_index in range(self.max_rounds):
+            result = await self.process_request(request, data_index, trial)
+            result["round"] = round_index
+            results.append(result)
+            if result["status"] != "success" or result["finish_reason"] != "tool_calls":
+                break
+            message = result["response"]["choices"][0].get("message") or {}
+            followup = dict(request["prepared"])
+            followup["messages"] = next_turn_messages(
+                followup.get("messages", []), message, self.tool_stub
+            )
+            request = {"prepared": followup, "hash": prepared_req["hash"]}
+        return results
+
+    def run(self, requests: Union[Iterable[dict], AsyncIterable[dict]]) -> ResultStream:
+        """
+        Score a stream of request bodies, yielding results as they complete.
+
+        `requests` is any sync or async iterable of request dicts in test-set
+        format; each is sent `repeats` times. Input is only read as results
+        are consumed, so unbounded streams run in bounded memory, and all
+        calls share this validator's client, connection pool and concurrency.
+
+            stream = validator.run(requests)
+            async for result in stream:
+                ...
+            summary = stream.summary()
+        """
+        return ResultStream(self, self._iter_jobs(requests))
+
+    async def _iter_jobs(
+        self, requests: Union[Iterable[dict], AsyncIterable[dict]]
+    ) -> AsyncIterator[tuple[dict, int, int]]:
+        if hasattr(requests, "__aiter__"):
+            source = requests
+        else:
+
+            async def source_from_iterable():
+                for raw_req in requests:
+                    yield raw_req
+
+            source = source_from_iterable()
+        # Later trials wait in a rotating buffer at least one job window long, so
+        # trials of one sample are never in flight together (as in plan_jobs'
+        # trial-major order) while memory stays bounded for unbounded sources
+        spacing = self.concurrency * 2
+        waiting: deque[tuple[dict, int, int]] = deque()
+
+        def next_trial() -> tuple[dict, int, int]:
+            req, data_index, trial = waiting.popleft()
+            if trial + 1 < self.repeats:
+                waiting.append((req, data_index, trial + 1))
+            return req, data_index, trial
+
+        data_index = 0
+        async for raw_req in source:
+            data_index += 1
+            prepared_req = self.prepare_request(raw_req)
+            req = {
+                "data_index": data_index,
+                "raw": raw_req,
+                "prepared": prepared_req,
+                "hash": compute_hash(prepared_req),
+            }
+            yield req, data_index, 0
+            if self.repeats > 1:
+                waiting.append((req, data_index, 1))
+            while len(waiting) > spacing:
+                yield next_trial()
+        while waiting:
+            yield next_trial()
+
+    async def stream_jobs(
+        self,
+        jobs: Union[Iterable[tuple[dict, int, int]], AsyncIterable[tuple[dict, int, int]]],
+    ) -> AsyncIterator[dict]:
+        """
+        Run (request, data_index, trial) jobs, yielding results as they complete.
+
+        Jobs are started in order with at most 2 x concurrency of them pending,
+        which keeps semaphore waiters queued in job order, and the next jobs
+        are only pulled while the consumer is taking results (backpressure).
+        Multi-round jobs yield one result per round.
+        """
+        process = (
+            self.process_conversation if self.max_rounds > 1 else self.process_request
+        )
+        async_jobs = jobs.__aiter__() if hasattr(jobs, "__aiter__") else None
+        sync_jobs = None if async_jobs else iter(jobs)
+        window = self.concurrency * 2
+        pending: set = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        job = await async_jobs.__anext__() if async_jobs else next(sync_jobs)
+                    except (StopAsyncIteration, StopIteration):
+                        exhausted = True
+                        break
+                    pending.add(asyncio.create_task(process(*job)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    try:
+                        res = task.result()
+                    except Exception as e:
+                        logger.error(f"Task failed: {e}")
+                        continue
+                    for r in res if isinstance(res, list) else [res]:
+                        yield r
+        finally:
+            # The consumer stopped early: do not leave requests running
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def run_jobs(self, jobs: list[tuple[StagedRequest, int]], spool):
+        """Send jobs through chat.completions and write their results to the spool."""
+        from tqdm.asyncio import tqdm_asyncio
+
+        with tqdm_asyncio(total=len(jobs), desc="Processing", unit="req") as pbar:
+            # Payloads are loaded as the window advances, never all at once
+            async for r in self.stream_jobs(self.load_jobs(jobs)):
+                written_at = self.tracer.now() if self.tracer else 0
+                self._add_record(self._spool_result(spool, r, checkpoint=True))
+                if self.tracer:
+                    self.tracer.span(
+                        "write",
+                        self.tracer.lane(r["data_index"], r["trial"]),
+                        written_at,
+                        self.tracer.now(),
+                    )
+                if r.get("round", 0) == 0:
                     pbar.update(1)
 
-        self.results.sort(key=lambda r: r["data_index"])
+    def batch_custom_id(self, data_index: int, trial: int) -> str:
+        # Duplicate dataset lines are separate samples, as in the online path
+        return f"{data_index}-{trial}"
+
+    def build_batch_input(self, jobs: Iterable[tuple[dict, int, int]]) -> bytes:
+        """Batch input JSONL, one line per (data_index, trial) job."""
+        lines = []
+        for req, data_index, trial in jobs:
+            custom_id = self.batch_custom_id(data_index, trial)
+            body = dict(req["prepared"])
+            body.update(self.extra_body)
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    async def run_batch(self, jobs: list[tuple[StagedRequest, int]], spool):
+        """Submit jobs through the /v1/files + /v1/batches API and score the output."""
+        from tqdm.asyncio import tqdm_asyncio
 
-        # Save results
-        with megfile.smart_open(self.output_file, "w", encoding="utf-8") as f:
-            for r in self.results:
-                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        if not jobs:
+            return
+        batch_input = self.build_batch_input(self.load_jobs(jobs))
+        input_file = await self.client.files.create(
+            file=("batch-input.jsonl", batch_input), purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.batch_completion_window,
+        )
+        logger.info(f"Submitted batch {batch.id} with {len(jobs)} requests")
+        submitted_at = time.time()
+
+        with tqdm_asyncio(total=len(jobs), desc="Batch", unit="req") as pbar:
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(self.batch_poll_interval)
+                batch = await self.client.batches.retrieve(batch.id)
+                counts = batch.request_counts
+                if counts is not None:
+                    pbar.n = min(len(jobs), counts.completed + counts.failed)
+                    pbar.refresh()
+        logger.info(
+            f"Batch {batch.id} finished with status {batch.status} "
+            f"after {int(time.time() - submitted_at)}s"
+        )
+
+        outputs: dict[str, tuple[str, dict, Optional[str]]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json_loads(line)
+                response = item.get("response") or {}
+                status_code = response.get("status_code")
+                if status_code == 200 and not item.get("error"):
+                    outputs[item["custom_id"]] = ("success", response.get("body"), None)
+                else:
+                    error = item.get("error") or response.get("body") or {}
+                    error_class = classify_status_code(status_code) if status_code else "server"
+                    outputs[item["custom_id"]] = ("failed", {"error": str(error)}, error_class)
+
+        for req, data_index, trial in self.load_jobs(jobs):
+            status, response, error_class = outputs.get(
+                self.batch_custom_id(data_index, trial),
+                (
+                    "failed",
+                    {"error": f"No batch output (batch status: {batch.status})"},
+                    "server",
+                ),
+            )
+            # Per-request latency is not observable in batch mode
+            result = self.score_response(
+                req, data_index, trial, status, response, None, error_class=error_class
+            )
+            self.metrics.observe(result)
+            self._add_record(self._spool_result(spool, result, checkpoint=True))
+
+    def save_results(self, spool):
+        """Write results in data_index order from the spool, then the summary."""
+        self.results.sort(key=lambda r: (r.data_index, r.trial, r.round))
+
+        # Save results in data_index order, copying payloads from the spool
+        with spool, megfile.smart_open(
+            self.output_file, "wb", **storage_options(self.output_file)
+        ) as f:
+            for record in self.results:
+                spool.seek(record.offset)
+                f.write(spool.read(record.length))
 
         # Compute summary
         self.compute_summary()
         with megfile.smart_open(self.summary_file, "w", encoding="utf-8") as f:
             json.dump(self.summary, f, ensure_ascii=False, indent=4)
 
+        # The complete output supersedes the parts uploaded during the run
+        megfile.smart_remove(checkpoint_dir(self.output_file), missing_ok=True)
+
         logger.info(f"Results saved to {self.output_file}")
         logger.info(f"Summary saved to {self.summary_file}")
 
+    def write_snapshot(self):
+        """Write the current live metrics next to the summary file."""
+        path = snapshot_path(self.summary_file)
+        with megfile.smart_open(path, "w", encoding="utf-8") as f:
+            json.dump(self.metrics.snapshot(), f, ensure_ascii=False, indent=4)
+
+    async def _write_snapshots(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.warning(f"Failed to write metrics snapshot: {e}")
+
+    def write_checkpoint(self):
+        """Upload the results finished since the last checkpoint as a new part."""
+        lines, self.checkpoint_lines = self.checkpoint_lines, []
+        if not lines:
+            return
+        self.checkpoint_parts += 1
+        path = megfile.smart_path_join(
+            checkpoint_dir(self.output_file),
+            f"part-{self.checkpoint_run_id}-{self.checkpoint_parts:06d}.jsonl",
+        )
+        with megfile.smart_open(path, "wb", **storage_options(path)) as f:
+            f.writelines(lines)
+
+    async def _write_checkpoints(self, stop: asyncio.Event):
+        """Upload a part every checkpoint_interval seconds, and a last one once stopped."""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.checkpoint_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                # Uploads run in a thread so the event loop keeps sending requests
+                await asyncio.to_thread(self.write_checkpoint)
+            except Exception as e:
+                logger.warning(f"Failed to write result checkpoint: {e}")
+
     def compute_summary(self):
-        """Compute summary from all results."""
-        summary = {
-            "model": self.alias_model,
-            "success_count": 0,
-            "failure_count": 0,
-            "finish_stop": 0,
-            "finish_tool_calls": 0,
-            "finish_others": 0,
-            "finish_others_detail": {},
-            "schema_validation_error_count": 0,
-            "successful_tool_call_count": 0,
-        }
-        for r in self.results:
-            status = r.get("status")
-            finish_reason = r.get("finish_reason")
-            tool_calls_valid = r.get("tool_calls_valid")
+        """Compute summary from the counters accumulated while results arrived."""
+        self.summary = self.summary_acc.build(
+            price=self.price,
+            projected_requests=self.projected_requests,
+            repeats=self.repeats,
+        )
+        if self.retry_budget.requests:
+            self.summary["retry_budget"] = self.retry_budget.describe()
+        if self.pooled:
+            self.summary["routing"] = self.pool.routing
+            self.summary["endpoints"] = self.pool.describe()
+        if self.first_sent_at is not None and not self.batch:
+            steady = find_steady_state(self.first_sent_at, self.finished_at)
+            self.summary["warmup"] = {
+                **(self.warmup_summary or {"requests": 0}),
+                "warm_after": self.warm_after,
+                "time_to_steady_state_ms": int(steady[0] * 1000) if steady else None,
+                "steady_state_rps": round(steady[1], 3) if steady else None,
+            }
+        if self.max_rounds > 1:
+            rounds = {}
+            for round_index, acc in sorted(self.round_accs.items()):
+                round_summary = acc.build(price=self.price)
+                round_summary.pop("model")
+                rounds[str(round_index)] = round_summary
+            self.summary["max_rounds"] = self.max_rounds
+            self.summary["rounds"] = rounds
 
-            if status == "success":
-                summary["success_count"] += 1
-            else:
-                summary["failure_count"] += 1
-
-            if finish_reason == "stop":
-                summary["finish_stop"] += 1
-            elif finish_reason == "tool_calls":
-                summary["finish_tool_calls"] += 1
-                if tool_calls_valid:
-                    summary["successful_tool_call_count"] += 1
-                else:
-                    summary["schema_validation_error_count"] += 1
-            elif finish_reason:
-                summary["finish_others"] += 1
-                summary["finish_others_detail"].setdefault(finish_reason, 0)
-                summary["finish_others_detail"][finish_reason] += 1
-        self.summary = summary
 
+RUN_DESCRIPTION = (
+    "Validate LLM tool calls via HTTP API with concurrency and optional incremental re-run.\n\n"
+    "Each line in the JSONL test set must be a complete LLM request body, e.g., including messages and optional tools.\n"
+    "Project tip: a typical test set file is named `samples.jsonl` in the repo path."
+)
 
-async def main():
-    parser = argparse.ArgumentParser(
-        description="Validate LLM tool calls via HTTP API with concurrency and optional incremental re-run.\n\n"
-        "Each line in the JSONL test set must be a complete LLM request body, e.g., including messages and optional tools.\n"
-        "Project tip: a typical test set file is named `samples.jsonl` in the repo path."
-    )
+SUBCOMMANDS = ("run", "rescore", "summary", "analyze", "report", "convert")
 
+# Subcommands that hand their arguments to a script elsewhere in the repo
+SCRIPT_SUBCOMMANDS = {
+    "analyze": os.path.join("datasets", "analyze_samples.py"),
+    "report": os.path.join("benchmark-result", "generate_report.py"),
+    "convert": os.path.join("datasets", "convert_dataset.py"),
+}
+
+
+def add_run_arguments(parser: argparse.ArgumentParser):
     parser.add_argument(
         "file_path",
         help=(
-            "Path to the test set file in JSONL format.\n"
+            "Path to the test set file in JSONL format (*.jsonl.gz is decompressed on the fly).\n"
             "Example line in JSONL:\n"
             '  {"messages":[{"role":"system","content":"You are a helpful assistant."},\n'
             '               {"role":"user","content":"Find info about company X"}],\n'
@@ -452,8 +2735,7 @@ async def main():
     )
     parser.add_argument(
         "--base-url",
-        required=True,
-        help="API endpoint, e.g., https://api.moonshot.cn/v1",
+        help="API endpoint, e.g., https://api.moonshot.cn/v1 (required unless --endpoints is set)",
     )
     parser.add_argument(
         "--api-key", help="API key for authentication (or set OPENAI_API_KEY in env)"
@@ -484,7 +2766,16 @@ async def main():
         "--retries",
         type=int,
         default=3,
-        help="Number of retries on failure (default: 3)",
+        help="Number of retries on failure (default: 3). Only rate-limit, server, timeout "
+        "and connection errors are retried, with jittered exponential backoff per error class",
+    )
+    parser.add_argument(
+        "--retry-budget",
+        type=float,
+        default=0.2,
+        help="Retry budget as retries earned per request sent, on top of 10 free retries "
+        "(default: 0.2). Once spent, failures are not retried so a failing vendor does not "
+        "receive a multiple of the load. The unspent budget is capped at what 500 requests earn",
     )
     parser.add_argument(
         "--extra-body",
@@ -522,7 +2813,244 @@ async def main():
         help=("Alias model name to use in results (defaults to actual model name)"),
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help=(
+            "Serve live run metrics in Prometheus text format at http://HOST:PORT/metrics.\n"
+            "Disabled by default."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Bind address for --metrics-port (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        default=0,
+        help=(
+            "Write a JSON metrics snapshot next to --summary (as *.live.json) every N seconds.\n"
+            "Disabled by default (0)."
+        ),
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=0,
+        help=(
+            "Every N seconds, upload the results finished since the last upload as a part file\n"
+            "under {output}.parts/, so an interrupted run keeps its results and --incremental\n"
+            "resumes from them. The parts are removed once the full output is written.\n"
+            "Disabled by default (0)."
+        ),
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=0,
+        help=(
+            "Send N throwaway requests before measurement starts, to pay for DNS, TLS and\n"
+            "vendor cold starts up front. Their responses are not scored or written (default: 0).\n"
+            "Results are tagged warm once --concurrency requests have completed, and the\n"
+            "summary reports cold and warm latency separately, plus the time until completion\n"
+            "throughput settles within 25%% of its median (time_to_steady_state_ms)."
+        ),
+    )
+    parser.add_argument(
+        "--warmup-file",
+        type=str,
+        help=(
+            "JSONL file of dedicated warm-up requests, cycled through for --warmup.\n"
+            "Default: a one-token 'Hello' request."
+        ),
+    )
+    parser.add_argument(
+        "--expected-calls",
+        type=str,
+        help=(
+            "Expected-calls sidecar written by datasets/convert_dataset.py (*.expected.jsonl).\n"
+            "When set, the first tool call of each response is compared with the expected call\n"
+            "(tool name, and arguments after type coercion) and the summary reports\n"
+            "tool_name_accuracy and tool_call_accuracy."
+        ),
+    )
+    parser.add_argument(
+        "--accuracy-tolerance",
+        type=float,
+        default=1e-6,
+        help="Relative and absolute tolerance for numeric arguments in accuracy scoring (default: 1e-6)",
+    )
+    parser.add_argument(
+        "--endpoints",
+        type=str,
+        help=(
+            "JSON file with a pool of endpoints of the vendor to spread requests over, e.g.\n"
+            "[{\"name\": \"us\", \"base_url\": \"https://us.example.com/v1\", \"api_key_env\": \"US_KEY\"}, ...]\n"
+            "(api_key may be given inline). Each result records the endpoint that served it and\n"
+            "the summary breaks latency and errors down per endpoint. Raise --concurrency to match."
+        ),
+    )
+    parser.add_argument(
+        "--routing",
+        choices=ROUTING_STRATEGIES,
+        default="least-outstanding",
+        help=(
+            "How --endpoints are chosen per attempt: fewest requests in flight, or the less\n"
+            "loaded of two random endpoints (p2c). Rate-limited or failing endpoints are\n"
+            "skipped until their cooldown ends (default: least-outstanding)"
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Send requests with stream=true (and stream_options.include_usage) to measure\n"
+            "time to first token; the chunks are assembled into one response for scoring.\n"
+            "Results get ttft_ms and the summary ttft_ms quantiles."
+        ),
+    )
+    parser.add_argument(
+        "--raw-response",
+        action="store_true",
+        help=(
+            "Read non-streaming response bodies directly instead of building SDK response models.\n"
+            "Results keep the same fields, plus 'raw_response': the body text exactly as the vendor\n"
+            "sent it, for archival ('response' is the parsed body and is re-serialized).\n"
+            "Saves CPU on large responses and high concurrency."
+        ),
+    )
+    parser.add_argument(
+        "--price-table",
+        type=str,
+        help=(
+            "JSON file with prices in USD per 1M tokens, keyed by vendor then model\n"
+            "(e.g. {\"ppio\": {\"deepseek-v3.2-exp\": {\"prompt\": 0.28, \"cached_prompt\": 0.028, \"completion\": 0.42}}}).\n"
+            "'*' matches any vendor or model. When set, results and summary include cost figures."
+        ),
+    )
+    parser.add_argument(
+        "--projected-requests",
+        type=int,
+        default=1_000_000,
+        help="Traffic volume used for projected_cost in the summary (default: 1000000)",
+    )
+
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=1,
+        help=(
+            "Run every sample K times to measure vendor nondeterminism (default: 1).\n"
+            "Results are keyed by (hash, trial), so --incremental can add trials later.\n"
+            "The summary gains per-sample consistency statistics."
+        ),
+    )
+
+    parser.add_argument(
+        "--schedule",
+        choices=["dataset", "lpt"],
+        default="dataset",
+        help=(
+            "Dispatch order of requests (default: dataset).\n"
+            "'lpt' sends the longest expected requests first to shorten the run's tail;\n"
+            "durations are estimated from token counts and --history results."
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        nargs="*",
+        default=[],
+        help="Prior results JSONL files whose duration_ms (matched by hash) feed --schedule lpt",
+    )
+
+    parser.add_argument(
+        "--dataset-cache",
+        type=str,
+        help=(
+            "Directory for the prepared-dataset cache. Parsed and prepared requests are stored as JSONL\n"
+            "keyed by the dataset's path, size and mtime and --model/--vendor/--provider-order/\n"
+            "--filter-unsupported-roles, so repeated runs over the same dataset skip reading, parsing\n"
+            "and hashing it. Disabled by default."
+        ),
+    )
+
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Submit requests through the vendor's /v1/files + /v1/batches API instead of\n"
+            "synchronous chat.completions. Each (sample, trial) is one batch line with\n"
+            "custom_id {data_index}-{trial}; "
+            "per-request latency is not recorded in this mode."
+        ),
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=30,
+        help="Seconds between batch status polls (default: 30)",
+    )
+    parser.add_argument(
+        "--batch-completion-window",
+        default="24h",
+        help="completion_window passed to the batch API (default: 24h)",
+    )
+    parser.add_argument(
+        "--max-rounds",
+        type=int,
+        default=1,
+        help=(
+            "Multi-turn mode: when a response ends with tool_calls, append stubbed tool outputs\n"
+            "and re-submit, up to N rounds per sample (default: 1, first turn only).\n"
+            "Results carry a 'round' field and the summary gains per-round statistics."
+        ),
+    )
+    parser.add_argument(
+        "--tool-observations",
+        type=str,
+        help=(
+            "JSON file mapping tool name to the recorded output returned in multi-turn mode.\n"
+            "Tools not listed get a fake result echoing their arguments."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        help=(
+            "Write a Chrome trace-event timeline (open in Perfetto) with per-request spans:\n"
+            "queued, request (with each HTTP attempt and first byte), validate and write."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help=(
+            "Sample the harness process stack every 5ms and write folded stacks to this file\n"
+            "(for speedscope or flamegraph.pl)."
+        ),
+    )
+
+
+async def run(args: argparse.Namespace):
+    """`run`: send the test set to the vendor and score the responses."""
+    if args.batch and args.max_rounds > 1:
+        logger.error("--batch cannot be combined with --max-rounds > 1")
+        return
+    if args.batch and args.stream:
+        logger.error("--batch cannot be combined with --stream")
+        return
+    if args.batch and args.warmup:
+        logger.warning("--warmup is ignored in --batch mode, where latency is not measured")
+
+    endpoints = None
+    if args.endpoints:
+        endpoints = load_endpoints(args.endpoints)
+        logger.info(f"Routing over {len(endpoints)} endpoints ({args.routing})")
+    elif not args.base_url:
+        logger.error("--base-url is required unless --endpoints is set")
+        return
 
     extra_body = {}
     if args.extra_body:
@@ -532,6 +3060,24 @@ async def main():
             logger.error(f"Invalid JSON for --extra-body: {e}")
             return
 
+    price_table = None
+    if args.price_table:
+        price_table = load_price_table(args.price_table)
+
+    tool_stub = None
+    if args.tool_observations:
+        tool_stub = ToolStub.from_file(args.tool_observations)
+
+    expected_calls = None
+    if args.expected_calls:
+        expected_calls = load_expected_calls(args.expected_calls)
+        logger.info(f"Loaded {len(expected_calls)} expected calls from {args.expected_calls}")
+
+    warmup_requests = None
+    if args.warmup_file:
+        with megfile.smart_open(args.warmup_file, "rb") as f:
+            warmup_requests = [json_loads(line) for line in f if line.strip()]
+
     # Parse provider order
     provider_order = None
     if args.provider_order:
@@ -539,8 +3085,9 @@ async def main():
 
     validator = ToolCallsValidator(
         model=args.model,
-        base_url=args.base_url,
-        api_key=args.api_key,
+        # Batch jobs and other non-routed calls use the first endpoint by default
+        base_url=args.base_url or endpoints[0].base_url,
+        api_key=args.api_key if args.base_url else endpoints[0].api_key,
         concurrency=args.concurrency,
         output_file=args.output,
         summary_file=args.summary,
@@ -552,9 +3099,149 @@ async def main():
         vendor=args.vendor,
         alias_model=args.alias_model,
         provider_order=provider_order,
+        metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host,
+        snapshot_interval=args.snapshot_interval,
+        price_table=price_table,
+        projected_requests=args.projected_requests,
+        repeats=args.repeats,
+        schedule=args.schedule,
+        history_files=args.history,
+        dataset_cache=args.dataset_cache,
+        batch=args.batch,
+        batch_poll_interval=args.batch_poll_interval,
+        batch_completion_window=args.batch_completion_window,
+        max_rounds=args.max_rounds,
+        tool_stub=tool_stub,
+        trace_file=args.trace,
+        retry_budget=args.retry_budget,
+        checkpoint_interval=args.checkpoint_interval,
+        warmup=args.warmup,
+        warmup_requests=warmup_requests,
+        expected_calls=expected_calls,
+        accuracy_tolerance=args.accuracy_tolerance,
+        raw_response=args.raw_response,
+        endpoints=endpoints,
+        routing=args.routing,
+        stream=args.stream,
+    )
+    profiler = None
+    if args.profile:
+        profiler = SamplingProfiler()
+        profiler.start()
+    try:
+        await validator.validate_file(args.file_path)
+    finally:
+        if profiler:
+            profiler.stop(args.profile)
+
+
+def rescore(args: argparse.Namespace):
+    """`rescore`: re-validate the tool calls of a results file without sending requests."""
+    price_table = load_price_table(args.price_table) if args.price_table else None
+    expected_calls = load_expected_calls(args.expected_calls) if args.expected_calls else None
+    alias_model = args.alias_model
+    if not alias_model:
+        with megfile.smart_open(args.results_file, "rb") as f:
+            first_line = f.readline()
+        alias_model = json_loads(first_line)["request"].get("model") if first_line else None
+    validator = ToolCallsValidator(
+        model=None,
+        base_url=None,
+        output_file=args.output or args.results_file,
+        summary_file=args.summary,
+        vendor=args.vendor,
+        alias_model=alias_model,
+        price_table=price_table,
+        expected_calls=expected_calls,
+        accuracy_tolerance=args.accuracy_tolerance,
+    )
+    validator.rescore_file(args.results_file)
+
+
+def print_summaries(args: argparse.Namespace):
+    """`summary`: print the summary of one or more results files."""
+    for results_file in args.results_files:
+        summary = summarize_results(results_file)
+        print(json.dumps({"file": results_file, **summary}, ensure_ascii=False, indent=4))
+
+
+def run_script(relative_path: str, argv: list[str]):
+    """Run a repo script as __main__ with the given arguments."""
+    import runpy
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_path)
+    sys.path.insert(0, os.path.dirname(path))
+    sys.argv = [path, *argv]
+    runpy.run_path(path, run_name="__main__")
+
+
+def main(argv: Optional[list[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    # `tool_calls_eval.py samples.jsonl --model ...` keeps working as `run`
+    if argv and argv[0] not in SUBCOMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["run", *argv]
+    if argv and argv[0] in SCRIPT_SUBCOMMANDS:
+        return run_script(SCRIPT_SUBCOMMANDS[argv[0]], argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description="Tool-call verification for LLM vendors. Without a subcommand, arguments are passed to `run`."
     )
-    await validator.validate_file(args.file_path)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run",
+        help="Send a test set to a vendor and score the tool calls",
+        description=RUN_DESCRIPTION,
+    )
+    add_run_arguments(run_parser)
+
+    rescore_parser = subparsers.add_parser(
+        "rescore",
+        help="Re-validate an existing results file offline and rewrite it with its summary",
+    )
+    rescore_parser.add_argument("results_file", help="results JSONL written by `run`")
+    rescore_parser.add_argument(
+        "--output", help="Rescored results file (default: overwrite the input)"
+    )
+    rescore_parser.add_argument(
+        "--summary",
+        default="summary.json",
+        help="Summary JSON file (default: summary.json)",
+    )
+    rescore_parser.add_argument(
+        "--alias-model", help="Model name recorded in the summary (default: from the results)"
+    )
+    rescore_parser.add_argument("--vendor", help="Vendor name, used to look up prices")
+    rescore_parser.add_argument("--price-table", help="JSON price table, see `run --help`")
+    rescore_parser.add_argument(
+        "--expected-calls", help="Expected-calls sidecar for accuracy scoring, see `run --help`"
+    )
+    rescore_parser.add_argument(
+        "--accuracy-tolerance",
+        type=float,
+        default=1e-6,
+        help="Tolerance for numeric arguments in accuracy scoring (default: 1e-6)",
+    )
+
+    summary_parser = subparsers.add_parser(
+        "summary", help="Print the summary of results files without re-validating"
+    )
+    summary_parser.add_argument("results_files", nargs="+", help="results JSONL files")
+
+    for name, path in SCRIPT_SUBCOMMANDS.items():
+        subparsers.add_parser(
+            name, help=f"Run {path.replace(os.sep, '/')} (see `{name} --help`)", add_help=False
+        )
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        asyncio.run(run(args))
+    elif args.command == "rescore":
+        rescore(args)
+    elif args.command == "summary":
+        print_summaries(args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()